@@ -1,7 +1,9 @@
 import datetime
-import pandas as pd
-from models import SensorData, db
-from sqlalchemy import func
+import numpy as np
+from database import get_latest_reading, iter_reading_chunks
+from models import db, ROLLUPS
+from rollups import get_rollup_moments
+from stats import Moments, QuantileSample, describe
 
 
 def parse_ts(ts_str):
@@ -12,69 +14,81 @@ def parse_ts(ts_str):
         # fallback for very old Python or other formats:
         return datetime.datetime.strptime(ts_str, "%Y-%m-%d %H:%M:%S.%f")
 
-def analyze_date_range_db(start: str, end: str):
-    start_dt = parse_ts(start)
-    end_dt   = parse_ts(end)
-    if end_dt < start_dt:
-        raise ValueError("End must be after start")
-    if end_dt - start_dt > datetime.timedelta(days=3):
-        raise ValueError("Range cannot exceed 3 days")
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
 
-    # 1) Pull all readings for our five topics
-    topics = ['esp32/temperature',
-              'esp32/humidity',
-              'esp32/pressure',
-              'esp32/rain_score',
-              'esp32/light']
+def parse_duration(text):
+    """Parse ``"30s"``, ``"5m"``, ``"24h"`` or ``"7d"`` into a timedelta."""
+    text = (text or "").strip().lower()
+    unit = DURATION_UNITS.get(text[-1:])
+    try:
+        amount = float(text[:-1]) if unit else float(text)
+    except ValueError:
+        raise ValueError(f"Invalid duration: {text!r}")
+    if amount <= 0:
+        raise ValueError(f"Duration must be positive: {text!r}")
+    return datetime.timedelta(seconds=amount * (unit or 1))
 
-    rows = (
-        SensorData.query
-        .filter(SensorData.timestamp >= start_dt,
-                SensorData.timestamp <= end_dt,
-                SensorData.topic.in_(topics))
-        .all()
-    )
-    if not rows:
-        raise ValueError("No data in the given range")
+# values kept per topic for the quartiles; exact up to this many readings
+QUANTILE_SAMPLE_SIZE = 100000
+ANALYZE_CHUNK_SIZE = 50000
+# source="rollup" uses the coarsest rollup that still gives this many buckets
+ROLLUP_MIN_BUCKETS = 100
 
-    # 2) Build DataFrame and pivot so each column is a topic
-    data = [{'timestamp': r.timestamp, 'topic': r.topic, 'value': r.value}
-            for r in rows]
-    df = pd.DataFrame(data)
-    df = df.pivot(index='timestamp', columns='topic', values='value')
-    # If some timestamps are missing a topic, you can forward-fill or drop:
-    df = df.sort_index().ffill()
 
-    # 3) Summary stats
-    summary = df.describe().T
+def analyze_date_range_db(start: str, end: str, source: str = "raw", device: str = None):
+    """Summary stats and trend slope per topic between two ISO timestamps.
 
-    # 4) Trend slopes
-    trends = {}
-    x = (df.index - df.index[0]).total_seconds().values.reshape(-1,1)
-    for col in df.columns:
-        y = df[col].values
-        cov = ((x.flatten()-x.mean()) * (y-y.mean())).sum()
-        var = ((x.flatten()-x.mean())**2).sum()
-        trends[col] = cov/var
+    ``source="raw"`` streams every reading (exact, quartiles from a bounded
+    sample); ``source="rollup"`` merges the rollup tables instead, which is
+    much cheaper for long ranges but has no quartiles and buckets the
+    trend by rollup width. ``device`` limits both to one device's readings.
+    """
+    start_dt = parse_ts(start)
+    end_dt   = parse_ts(end)
+    if end_dt < start_dt:
+        raise ValueError("End must be after start")
+    if source not in ("raw", "rollup"):
+        raise ValueError("source must be 'raw' or 'rollup'")
+
+    # 1) Our five topics
+    topics = ['temperature',
+              'humidity',
+              'pressure',
+              'rain_score',
+              'light']
 
-    return summary, trends
+    if source == "rollup":
+        # 2) coarsest rollup that still resolves the range, merged in one step
+        span = (end_dt - start_dt).total_seconds()
+        width = max([w for w in ROLLUPS if span / w >= ROLLUP_MIN_BUCKETS] or [min(ROLLUPS)])
+        moments = get_rollup_moments(db.session, start_dt, end_dt, topics, width, device=device)
+        quantiles = None
+    else:
+        # 2) stream column chunks (no ORM objects) and merge their partial stats
+        moments = Moments.empty(len(topics))
+        sample = QuantileSample(len(topics), QUANTILE_SAMPLE_SIZE)
+        x0 = None
+        for chunk in iter_reading_chunks(start_dt, end_dt, topics, ANALYZE_CHUNK_SIZE, device):
+            if x0 is None:
+                x0 = chunk['timestamp'][0]
+            # seconds since the first reading, so the slope is per second
+            C = np.vstack([chunk[t] for t in topics])  # topics x rows
+            moments = moments.merge(Moments.from_columns(chunk['timestamp'] - x0, C))
+            sample.add(C)
+        quantiles = sample.quantiles()
 
+    if not moments.n.any():
+        raise ValueError("No data in the given range")
 
-def get_latest_features():
-    # 1) Find the most recent timestamp in SensorData
-    last_ts = db.session.query(func.max(SensorData.timestamp)).scalar()
+    # 3) Summary stats and 4) trend slopes
+    return describe(topics, moments, quantiles)
 
-    # 2) Pull all topics at that timestamp
-    recs = (
-      SensorData.query
-      .filter(SensorData.timestamp == last_ts)
-      .all()
-    )
 
-    # 3) Map topic → raw column name → float
-    feat_map = {}
-    for r in recs:
-        key = r.topic.split("/",1)[-1]   # strip "esp32/"
-        feat_map[key] = r.value
+def get_latest_features(device=None):
+    # 1) The most recent reading holds every topic for its timestamp
+    latest = get_latest_reading(device)
+    if latest is None:
+        return {}, None
 
-    return feat_map, last_ts
+    # 2) Map raw column name → float
+    return latest.values(), latest.timestamp
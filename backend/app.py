@@ -1,17 +1,29 @@
 import os
-import pickle
+import numpy as np
 from datetime import datetime, timedelta
-import torch
-from flask import Flask, jsonify, url_for, redirect, request
+from flask import Flask, Response, jsonify, url_for, redirect, request
 from flask_cors import CORS
-from analyze_data import analyze_date_range_db, get_latest_features
+from analyze_data import analyze_date_range_db, get_latest_features, parse_duration, parse_ts
 from database import *
-from models import db, SensorData, User, RainClassifier
+from models import (db, SQLITE_PRAGMAS, SensorData, SensorReading, User, reading_row, device_from_topic,
+                    SENSOR_FIELDS, DEVICE_ID_MAX)
+from migrations import run_migrations
+from ingest import ShardedIngestWriter
+from rollups import rebuild_rollups, to_epoch
+from latest_cache import LatestCache
+from broadcaster import Broadcaster
+from prediction import PredictionCache, LazyRainModel, FEATURES, DEFAULT_CHUNK_SIZE
+import logs
+import metrics
+import http_cache
+from payloads import PayloadDecoder, PayloadError, parse_formats
 from dotenv import load_dotenv
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import (JWTManager, create_access_token, jwt_required, get_jwt, get_jwt_identity,
+                                get_jwt_request_location)
 from google_auth import register_oauth
 import paho.mqtt.client as mqtt
-import json
+import time
+import click
 
 load_dotenv()
 app = Flask(__name__)
@@ -20,7 +32,46 @@ app.config["JWT_SECRET_KEY"] = os.getenv("JWT_SECRET_KEY")
 
 
 basedir = os.path.abspath(os.path.dirname(__file__))
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'sensors.db')
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///' + os.path.join(basedir, 'sensors.db'))
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    # request threads, the ingest writer and the MQTT loop each check out their own connection
+    "pool_size": int(os.getenv('DB_POOL_SIZE', 10)),
+    "max_overflow": int(os.getenv('DB_MAX_OVERFLOW', 20)),
+    "pool_timeout": 30,
+    # a pooled connection is used by one thread at a time, but not always the one that opened it
+    "connect_args": {"check_same_thread": False},
+}
+# overrides for models.SQLITE_PRAGMAS, e.g. SQLITE_PRAGMAS="journal_mode=DELETE,synchronous=FULL"
+for pragma in filter(None, os.getenv('SQLITE_PRAGMAS', '').split(',')):
+    name, value = pragma.split('=', 1)
+    SQLITE_PRAGMAS[name.strip()] = value.strip()
+# ingest batching: flush after this many rows or this many seconds, whichever comes first
+app.config['INGEST_BATCH_SIZE'] = int(os.getenv('INGEST_BATCH_SIZE', 500))
+app.config['INGEST_MAX_LATENCY'] = float(os.getenv('INGEST_MAX_LATENCY', 1.0))
+# writer threads; each device always lands on the same one
+app.config['INGEST_SHARDS'] = int(os.getenv('INGEST_SHARDS', 4))
+# 0 when ingest_service.py stores the readings; the app then only keeps its live view
+app.config['INGEST_IN_PROCESS'] = os.getenv('INGEST_IN_PROCESS', '1') == '1'
+# devices tracked individually in memory (live view, ETags); readings from more still count towards "all devices"
+app.config['MAX_DEVICES'] = int(os.getenv('MAX_DEVICES', 1000))
+# /api/predict reuses its last result for up to PREDICT_CACHE_TTL seconds,
+# or PREDICT_MIN_INTERVAL seconds once new readings have been stored
+app.config['PREDICT_CACHE_TTL'] = float(os.getenv('PREDICT_CACHE_TTL', 60.0))
+app.config['PREDICT_MIN_INTERVAL'] = float(os.getenv('PREDICT_MIN_INTERVAL', 5.0))
+# keep the current month plus this many full months of raw readings; 0 keeps everything
+app.config['RETENTION_MONTHS'] = int(os.getenv('RETENTION_MONTHS', 0))
+# /api/stream: events buffered per client before it counts as too slow, and max open streams
+app.config['STREAM_QUEUE_SIZE'] = int(os.getenv('STREAM_QUEUE_SIZE', 100))
+app.config['STREAM_MAX_SUBSCRIBERS'] = int(os.getenv('STREAM_MAX_SUBSCRIBERS', 500))
+# lifetime of the stream-only tokens that open /api/stream; they travel in the URL, so keep it short
+app.config['STREAM_TOKEN_SECONDS'] = int(os.getenv('STREAM_TOKEN_SECONDS', 60))
+# rain classifier engine: "numpy" (exported rain_classifier.npz, no torch) or "torch"
+app.config['RAIN_MODEL_BACKEND'] = os.getenv('RAIN_MODEL_BACKEND', 'numpy')
+# load the rain classifier and latest values at startup instead of on the first request
+app.config['WARM_UP'] = os.getenv('WARM_UP', '0') == '1'
+# JSON/text responses at least this large are gzip/brotli-compressed when the client accepts it
+app.config['COMPRESS_MIN_BYTES'] = int(os.getenv('COMPRESS_MIN_BYTES', 1024))
+app.config['COMPRESS_LEVEL'] = int(os.getenv('COMPRESS_LEVEL', 6))
 
 # update CORS configuration
 CORS(app,
@@ -32,6 +83,13 @@ CORS(app,
      supports_credentials=True)
 jwt = JWTManager(app)
 db.init_app(app)
+# ?jwt= stream tokens must not end up in the dev server's access log
+logs.redact_query("werkzeug")
+
+@jwt.token_verification_loader
+def stream_token_scope(jwt_header, jwt_data):
+    # stream tokens open /api/stream and nothing else
+    return jwt_data.get("scope") != "stream" or request.endpoint == "stream"
 
 oauth = register_oauth(app)
 google = oauth.google
@@ -40,35 +98,127 @@ google = oauth.google
 # mqtt configuration
 MQTT_BROKER = "broker.hivemq.com"
 MQTT_PORT = 1883
-MQTT_TOPIC = "esp32/output"
+# the original board by default; add e.g. "stations/+/output" to take one topic per station, "+" matching the device_id.
+# On a public broker anyone can publish there, so the wildcard is opt-in.
+MQTT_TOPICS = [t.strip() for t in os.getenv('MQTT_TOPICS', 'esp32/output').split(',') if t.strip()]
+# payload format per subscription, e.g. "stations/+/output=msgpack"; other topics are sniffed
+payload_decoder = PayloadDecoder(parse_formats(os.getenv('MQTT_PAYLOAD_FORMATS', '')))
 
 mqtt_client = mqtt.Client()
-mqtt_client.on_connect = lambda client, userdata, flags, rc: client.subscribe(MQTT_TOPIC)
+mqtt_client.on_connect = lambda client, userdata, flags, rc: client.subscribe([(t, 0) for t in MQTT_TOPICS])
 mqtt_client.on_message = lambda client, userdata, msg: on_message(client, userdata, msg)
 
-# --- Load pretrained rain classifier & scaler once at startup ---
-device = torch.device('cpu')
-model = RainClassifier(in_dim=3).to(device)
-model.load_state_dict(
-    torch.load('../suggestion/rain_classifier.pth', map_location=device, weights_only=True)
-)
-model.eval()
-# load StandardScaler
-with open('../suggestion/scaler.pkl', 'rb') as f:
-    scaler = pickle.load(f)
+prediction_cache = PredictionCache(ttl=app.config['PREDICT_CACHE_TTL'],
+                                   min_interval=app.config['PREDICT_MIN_INTERVAL'])
+
+# readings are written in bulk by background threads (sharded by device) instead of per message
+ingest_writer = ShardedIngestWriter(app,
+                                    shards=app.config['INGEST_SHARDS'],
+                                    batch_size=app.config['INGEST_BATCH_SIZE'],
+                                    max_latency=app.config['INGEST_MAX_LATENCY'],
+                                    on_flush=lambda rows: on_flush(rows),
+                                    retention_months=app.config['RETENTION_MONTHS'])
+# newest stored reading per device; the ETags of the read routes are built from it
+data_version = http_cache.DataVersion(max_devices=app.config['MAX_DEVICES'])
+# newest value per sensor and device, updated by on_message so /api/data never waits on SQLite
+latest_cache = LatestCache(max_devices=app.config['MAX_DEVICES'])
+# pushes every reading to the open /api/stream connections
+broadcaster = Broadcaster(max_queue=app.config['STREAM_QUEUE_SIZE'],
+                          max_subscribers=app.config['STREAM_MAX_SUBSCRIBERS'])
+
+log = logs.get_logger("api")
+mqtt_log = logs.get_logger("mqtt")
+
+# --- metrics, served at /metrics ---
+MQTT_MESSAGES = metrics.counter("mqtt_messages_total", "MQTT messages received, by outcome", ("result",))
+MQTT_DECODE_SECONDS = metrics.histogram("mqtt_decode_seconds", "Payload decode and row mapping per MQTT message",
+                                        ("format",))
+MQTT_DECODE_ERRORS = metrics.counter("mqtt_decode_errors_total", "Payloads rejected by the decoder, by format",
+                                     ("format",))
+MQTT_HANDLE_SECONDS = metrics.histogram("mqtt_handle_seconds", "Total on_message time per MQTT message")
+REQUEST_SECONDS = metrics.histogram("http_request_seconds", "Request time per route",
+                                    ("route", "method", "status"))
+QUERY_SECONDS = metrics.histogram("http_query_seconds", "Database time per request, by route", ("route",))
+SERIALIZE_SECONDS = metrics.histogram("http_serialize_seconds", "JSON encoding time per response, by route",
+                                      ("route",))
+RESPONSE_ROWS = metrics.histogram("http_response_rows", "Rows or buckets behind each response, by route",
+                                  ("route",), buckets=metrics.COUNT_BUCKETS)
+NOT_MODIFIED = metrics.counter("http_not_modified_total", "Requests answered 304 from their ETag", ("route",))
+COMPRESSED = metrics.counter("http_compressed_total", "Responses compressed, by encoding", ("encoding",))
+COMPRESSION_SAVED_BYTES = metrics.counter("http_compression_saved_bytes_total",
+                                          "Bytes saved by response compression")
+metrics.gauge_callback("ingest_queue_depth", "Readings waiting for the ingest writers",
+                       lambda: ingest_writer.stats()["queue_depth"])
+metrics.gauge_callback("stream_subscribers", "Open /api/stream connections",
+                       lambda: broadcaster.stats()["subscribers"])
+metrics.counter_callback("stream_subscribers_dropped_total", "Streams closed for falling behind",
+                         lambda: broadcaster.stats()["subscribers_dropped"])
+metrics.counter_callback("predict_cache_hits_total", "/api/predict answers served from the cache",
+                         lambda: prediction_cache.hits)
+metrics.counter_callback("predict_cache_misses_total", "/api/predict answers computed",
+                         lambda: prediction_cache.misses)
+metrics.gauge_callback("rain_model_load_seconds", "Time the rain classifier took to load (0 until loaded)",
+                       lambda: rain_model.load_seconds or 0.0)
+
+# column name -> key used in the JSON sent to the dashboard
+FRONTEND_KEYS = {
+    "temperature": "temperature",
+    "humidity": "humidity",
+    "pressure": "pressure",
+    "rain_level": "rainLevel",
+    "rain_score": "rainScore",
+    "light": "light",
+}
+
+# --- Pretrained rain classifier, loaded on the first prediction (or by warm_up) ---
+rain_model = LazyRainModel(app.config['RAIN_MODEL_BACKEND'])
+
+def warm_up():
+    """Do the lazy first-request work now; call from a server's post-fork hook."""
+    rain_model.get()
+    with app.app_context():
+        latest_cache.ensure_seeded(lambda: get_latest_values(SENSOR_FIELDS))
+
+def on_flush(rows):
+    prediction_cache.invalidate()
+    data_version.note(rows)
 
 def on_message(client, userdata, msg):
-    data = json.loads(msg.payload.decode())
-    timestamp = datetime.now()
-    with app.app_context():
-        for key, value in data.items():
-            
-            # ensure value is numeric type
-            if isinstance(value, (int, float)):
-                sensor = SensorData(topic=f"esp32/{key}", value=float(value), timestamp=timestamp)
-                db.session.add(sensor)
-        db.session.commit()
-        print(f"Stored sensor data: {data}")
+    with MQTT_HANDLE_SECONDS.time():
+        handle_message(msg)
+
+def handle_message(msg):
+    started = time.perf_counter()
+    try:
+        fmt, data = payload_decoder.decode(msg.topic, msg.payload)
+    except PayloadError as e:
+        MQTT_MESSAGES.labels("malformed").inc()
+        MQTT_DECODE_ERRORS.labels(e.format).inc()
+        mqtt_log.sample("payload_malformed", topic=msg.topic, format=e.format, error=str(e))
+        return
+    device = device_from_topic(msg.topic, MQTT_TOPICS)
+    if device is None:
+        MQTT_MESSAGES.labels("no_device").inc()
+        mqtt_log.sample("payload_without_device", topic=msg.topic)
+        return
+    row = reading_row(data, datetime.now(), device)
+    MQTT_DECODE_SECONDS.labels(fmt).observe(time.perf_counter() - started)
+    if row is None:
+        MQTT_MESSAGES.labels("empty").inc()
+    else:
+        MQTT_MESSAGES.labels("accepted").inc()
+        latest_cache.update(row)
+        if app.config['INGEST_IN_PROCESS']:
+            ingest_writer.submit([row])
+        else:
+            # stored by ingest_service.py shortly; let the next prediction (and poll) see it
+            on_flush([row])
+        mqtt_log.sample("reading_stored", level="info", topic=msg.topic, device=device, format=fmt)
+        broadcaster.publish("reading", {
+            "data": format_sensor_data(*latest_cache.snapshot()),
+            "device": device,
+            "reading": {FRONTEND_KEYS[k]: v for k, v in row.items() if k in FRONTEND_KEYS and v is not None},
+        })
 
 @app.shell_context_processor
 def make_shell_context():
@@ -76,6 +226,7 @@ def make_shell_context():
         "db": db,
         "User": User,
         "SensorData": SensorData,
+        "SensorReading": SensorReading,
         "get_user_by_id": get_user_by_id,
         "get_user_by_email": get_user_by_email,
         "check_user_credentials": check_user_credentials,
@@ -83,8 +234,39 @@ def make_shell_context():
         "create_sensor_data": create_sensor_data,
         "get_latest_sensor_data": get_latest_sensor_data,
         "get_sensor_data_by_topic": get_sensor_data_by_topic,
+        "get_latest_reading": get_latest_reading,
+        "get_latest_values": get_latest_values,
+        "get_reading_columns": get_reading_columns,
+        "ingest_writer": ingest_writer,
+        "latest_cache": latest_cache,
+        "broadcaster": broadcaster,
+        "prediction_cache": prediction_cache,
+        "rain_model": rain_model,
     }
 
+@app.cli.command("rebuild-rollups")
+@click.option("--start", help="ISO timestamp; defaults to the oldest reading")
+@click.option("--end", help="ISO timestamp; defaults to the newest reading")
+def rebuild_rollups_command(start, end):
+    """Recompute the 1m/1h rollup tables from raw sensor readings."""
+    rebuild_rollups(db.session,
+                    parse_ts(start) if start else None,
+                    parse_ts(end) if end else None)
+    db.session.commit()
+    print("rollups rebuilt")
+
+@app.cli.command("apply-retention")
+@click.option("--months", type=int, default=None,
+              help="full months to keep before the current one; defaults to RETENTION_MONTHS")
+def apply_retention_command(months):
+    """Drop monthly reading partitions older than the retention window."""
+    ingest_writer.retention_months = app.config['RETENTION_MONTHS'] if months is None else months
+    if not ingest_writer.retention_months:
+        print("retention disabled (0 months), nothing dropped")
+        return
+    dropped = ingest_writer.apply_retention()
+    print(f"dropped {len(dropped)} partition(s)")
+
 @app.route("/")
 def home():
     return jsonify({"message": "Flask running with Google OAuth"})
@@ -92,43 +274,113 @@ def home():
 @app.route("/api/auth/google")
 def google_login():
     redirect_uri = url_for("google_callback", _external=True)
-    print("🪪 Redirect URI:", redirect_uri)
+    log.info("google_redirect", redirect_uri=redirect_uri)
     return google.authorize_redirect(redirect_uri)
 
+def format_sensor_data(latest, updated_at):
+    """The /api/data payload for a ``LatestCache`` snapshot."""
+    values = {topic: value for topic, (value, ts) in latest.items()}
+    latest_temperature = values.get("temperature")
+    latest_humidity = values.get("humidity")
+    latest_pressure = values.get("pressure")
+    latest_rain_level = values.get("rain_level")
+    latest_rain_score = values.get("rain_score")
+    latest_light = values.get("light")
+
+    # Formatted data
+    return {
+        "temperature": f"{latest_temperature:.1f}°C" if latest_temperature is not None else "24°C",
+        "humidity": f"{latest_humidity:.0f}%" if latest_humidity is not None else "60%",
+        "pressure": f"{latest_pressure:.1f} hPa" if latest_pressure is not None else "1013 hPa",
+        "rainLevel": "No Rain" if not latest_rain_level else 
+                 "Light Rain" if latest_rain_level == 1 else 
+                 "Moderate Rain" if latest_rain_level == 2 else 
+                 "Heavy Rain",
+        "rainScore": f"{latest_rain_score:.0f}" if latest_rain_score is not None else "0",
+        "light": f"{latest_light:.1f} lux" if latest_light is not None else "500 lux",
+        # when each sensor last reported, so the dashboard can flag quiet ones
+        "updatedAt": updated_at.isoformat() if updated_at else None,
+        "lastUpdated": {
+            FRONTEND_KEYS[topic]: ts.isoformat()
+            for topic, (value, ts) in latest.items() if topic in FRONTEND_KEYS
+        }
+    }
+
+def route_name():
+    # the URL rule, not the path, so label values stay a small fixed set
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+@app.before_request
+def start_timer():
+    request.environ["metrics.started"] = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    size = response.content_length
+    encoding = http_cache.compress(response, request.accept_encodings,
+                                   app.config['COMPRESS_MIN_BYTES'], app.config['COMPRESS_LEVEL'])
+    if encoding is not None:
+        COMPRESSED.labels(encoding).inc()
+        COMPRESSION_SAVED_BYTES.inc(size - response.content_length)
+    started = request.environ.get("metrics.started")
+    if started is not None:
+        REQUEST_SECONDS.labels(route_name(), request.method, str(response.status_code)).observe(
+            time.perf_counter() - started)
+    return response
+
+def not_modified(etag):
+    NOT_MODIFIED.labels(route_name()).inc()
+    return http_cache.not_modified(etag)
+
+def timed_query(fn, *args, **kwargs):
+    """Call a database helper, recording its time under the current route."""
+    with QUERY_SECONDS.labels(route_name()).time():
+        return fn(*args, **kwargs)
+
+def json_response(payload, rows=None):
+    """``jsonify`` with its time (and optionally the row count) recorded per route."""
+    route = route_name()
+    with SERIALIZE_SECONDS.labels(route).time():
+        response = jsonify(payload)
+    if rows is not None:
+        RESPONSE_ROWS.labels(route).observe(rows)
+    return response
+
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+def request_device():
+    """``?device=`` of the current request, or None for every device."""
+    device = request.args.get("device", "").strip() or None
+    if device is not None and len(device) > DEVICE_ID_MAX:
+        raise ValueError(f"device must be at most {DEVICE_ID_MAX} characters")
+    return device
+
 @app.route("/api/data", methods=["GET"])
 def get_data():
     try:
-        # get new value
-        latest_temperature = SensorData.query.filter(SensorData.topic == "esp32/temperature").order_by(SensorData.timestamp.desc()).first()
-        latest_humidity = SensorData.query.filter(SensorData.topic == "esp32/humidity").order_by(SensorData.timestamp.desc()).first()
-        latest_pressure = SensorData.query.filter(SensorData.topic == "esp32/pressure").order_by(SensorData.timestamp.desc()).first()
-        latest_rain_level = SensorData.query.filter(SensorData.topic == "esp32/rain_level").order_by(SensorData.timestamp.desc()).first()
-        latest_rain_score = SensorData.query.filter(SensorData.topic == "esp32/rain_score").order_by(SensorData.timestamp.desc()).first()
-        latest_light = SensorData.query.filter(SensorData.topic == "esp32/light").order_by(SensorData.timestamp.desc()).first()
-        
-        # Formatted data
-        sensor_data = {
-            "temperature": f"{latest_temperature.value:.1f}°C" if latest_temperature else "24°C",
-            "humidity": f"{latest_humidity.value:.0f}%" if latest_humidity else "60%",
-            "pressure": f"{latest_pressure.value:.1f} hPa" if latest_pressure else "1013 hPa",
-            "rainLevel": "No Rain" if not latest_rain_level or latest_rain_level.value == 0 else 
-                     "Light Rain" if latest_rain_level.value == 1 else 
-                     "Moderate Rain" if latest_rain_level.value == 2 else 
-                     "Heavy Rain",
-            "rainScore": f"{latest_rain_score.value:.0f}" if latest_rain_score else "0",
-            "light": f"{latest_light.value:.1f} lux" if latest_light else "500 lux"
-        }
-        
-        return jsonify(sensor_data)
+        device = request_device()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        # served from memory; the database is only read once per device to seed the cache
+        latest, updated_at = latest_cache.lookup(lambda: timed_query(get_latest_values, SENSOR_FIELDS, device), device)
+        etag = http_cache.make_etag(data_version.boot, device, updated_at)
+        if http_cache.is_fresh(request, etag):
+            return not_modified(etag)
+        return http_cache.tag(json_response(format_sensor_data(latest, updated_at), rows=len(latest)), etag)
     except Exception as e:
-        print(f"Error fetching sensor data: {str(e)}")
+        log.error("sensor_data_failed", error=str(e))
         fallback_data = {
             "temperature": "24°C",
             "humidity": "60%",
             "pressure": "1013 hPa",
             "rainLevel": "No Rain",
             "rainScore": "0",
-            "light": "500 lux"
+            "light": "500 lux",
+            "updatedAt": None,
+            "lastUpdated": {}
         }
         return jsonify(fallback_data)
 
@@ -146,6 +398,47 @@ def protected():
     user_email = get_jwt_identity()
     return jsonify({"message": f"Welcome, {user_email}!"})
 
+# seconds between SSE comments that keep idle connections (and proxies) open
+STREAM_KEEPALIVE = 15
+# how long the browser waits before reconnecting a closed stream
+STREAM_RETRY_MS = 3000
+
+@app.route("/api/stream/token", methods=["POST"])
+@jwt_required()
+def stream_token():
+    # EventSource cannot set headers, so /api/stream takes its token as ?jwt=. URLs land in
+    # access and proxy logs, so that token is short-lived and only opens the stream.
+    expires_in = app.config['STREAM_TOKEN_SECONDS']
+    token = create_access_token(identity=get_jwt_identity(), additional_claims={"scope": "stream"},
+                                expires_delta=timedelta(seconds=expires_in))
+    return jsonify({"token": token, "expires_in": expires_in})
+
+@app.route("/api/stream")
+@jwt_required(locations=["headers", "query_string"])
+def stream():
+    # the token is only checked on connect; an open stream outlives it
+    if get_jwt_request_location() == "query_string" and get_jwt().get("scope") != "stream":
+        return jsonify({"msg": "?jwt= takes a token from POST /api/stream/token"}), 401
+    subscription = broadcaster.subscribe()
+    if subscription is None:
+        return jsonify({"msg": "Too many live connections"}), 503
+    # subscribed first, so no reading can fall between the snapshot and the stream
+    latest_cache.ensure_seeded(lambda: timed_query(get_latest_values, SENSOR_FIELDS))
+    snapshot = Broadcaster.encode("snapshot", {"data": format_sensor_data(*latest_cache.snapshot())})
+
+    def events():
+        try:
+            yield f"retry: {STREAM_RETRY_MS}\n\n".encode() + snapshot
+            while not subscription.dropped:
+                frame = subscription.get(STREAM_KEEPALIVE)
+                yield frame if frame is not None else b": keepalive\n\n"
+            # too slow to keep up: closing makes the browser reconnect and start from a new snapshot
+        finally:
+            broadcaster.unsubscribe(subscription)
+
+    return Response(events(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.route("/api/login", methods=["POST"])
 def login():
     data = request.get_json() or {}
@@ -190,92 +483,86 @@ def signup():
         "user": {"email": email, "name": name}
     }), 201
 
+# most buckets /api/historical-data will return per sensor
+MAX_HISTORY_BUCKETS = 2000
+
 @app.route("/api/historical-data", methods=["GET"])
 def get_historical_data():
     try:
-        # get data in the last hour
-        one_hour_ago = datetime.now() - timedelta(hours=1)
-        
-        # query data for each sensor type
-        temperature_data = SensorData.query.filter(
-            SensorData.topic == "esp32/temperature",
-            SensorData.timestamp >= one_hour_ago
-        ).order_by(SensorData.timestamp.asc()).all()
-        
-        humidity_data = SensorData.query.filter(
-            SensorData.topic == "esp32/humidity",
-            SensorData.timestamp >= one_hour_ago
-        ).order_by(SensorData.timestamp.asc()).all()
-        
-        pressure_data = SensorData.query.filter(
-            SensorData.topic == "esp32/pressure", 
-            SensorData.timestamp >= one_hour_ago
-        ).order_by(SensorData.timestamp.asc()).all()
-        
-        rain_level_data = SensorData.query.filter(
-            SensorData.topic == "esp32/rain_level",
-            SensorData.timestamp >= one_hour_ago
-        ).order_by(SensorData.timestamp.asc()).all()
-        
-        rain_score_data = SensorData.query.filter(
-            SensorData.topic == "esp32/rain_score",
-            SensorData.timestamp >= one_hour_ago
-        ).order_by(SensorData.timestamp.asc()).all()
-        
-        light_data = SensorData.query.filter(
-            SensorData.topic == "esp32/light",
-            SensorData.timestamp >= one_hour_ago
-        ).order_by(SensorData.timestamp.asc()).all()
+        # e.g. ?window=24h&resolution=5m&agg=mean,min,max (defaults: last hour per minute)
+        window = parse_duration(request.args.get("window", "1h"))
+        resolution = parse_duration(request.args.get("resolution", "1m"))
+        aggs = [a.strip() for a in request.args.get("agg", "mean").split(",") if a.strip()]
+        unknown = [a for a in aggs if a not in BUCKET_AGGREGATES]
+        if not aggs or unknown:
+            raise ValueError(f"agg must be one or more of {', '.join(BUCKET_AGGREGATES)}")
+        if resolution.total_seconds() < 1:
+            raise ValueError("resolution must be at least 1s")
+        if resolution.total_seconds() % 1:
+            # buckets are whole seconds in SQL; the bucket-count guard must use the same width
+            raise ValueError("resolution must be a whole number of seconds")
+        if window / resolution > MAX_HISTORY_BUCKETS:
+            raise ValueError(f"window/resolution exceeds {MAX_HISTORY_BUCKETS} buckets")
+        device = request_device()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    now = datetime.now()
+    # same answer until a reading is stored or the newest bucket rolls over
+    etag = http_cache.make_etag(data_version.boot, data_version.get(device), sorted(request.args.items(multi=True)),
+                                to_epoch(now) // resolution.total_seconds())
+    if http_cache.is_fresh(request, etag):
+        return not_modified(etag)
+
+    try:
+        # aggregation happens in SQLite, one row per bucket
+        buckets = timed_query(get_bucketed_readings, now - window, now, resolution.total_seconds(), aggs,
+                              device=device)
         
-        # deduplicate function
-        def deduplicate_by_minute(data_list):
-            minute_map = {}
-            for data in data_list:
-                minute_key = data.timestamp.strftime("%H:%M")
-                minute_map[minute_key] = data
-            
-            unique_list = list(minute_map.values())
-            unique_list.sort(key=lambda x: x.timestamp)
-            return unique_list
+        # bucket start label; add the date once the window spans more than a day
+        time_format = "%H:%M:%S" if window <= timedelta(days=1) else "%m-%d %H:%M"
         
-        # deduplicate each data set
-        temperature_data = deduplicate_by_minute(temperature_data)
-        humidity_data = deduplicate_by_minute(humidity_data)
-        pressure_data = deduplicate_by_minute(pressure_data)
-        rain_level_data = deduplicate_by_minute(rain_level_data)
-        rain_score_data = deduplicate_by_minute(rain_score_data)
-        light_data = deduplicate_by_minute(light_data)
+        def point(ts, stats):
+            entry = {"time": ts.strftime(time_format), "value": stats[aggs[0]]}
+            if len(aggs) > 1:
+                entry.update(stats)
+            return entry
         
         # Formatting frontend data
         result = {
-            "temperature": [{"time": data.timestamp.strftime("%H:%M:%S"), "value": data.value} for data in temperature_data],
-            "humidity": [{"time": data.timestamp.strftime("%H:%M:%S"), "value": data.value} for data in humidity_data],
-            "pressure": [{"time": data.timestamp.strftime("%H:%M:%S"), "value": data.value} for data in pressure_data],
-            "rainLevel": [{"time": data.timestamp.strftime("%H:%M:%S"), "value": data.value} for data in rain_level_data],
-            "rainScore": [{"time": data.timestamp.strftime("%H:%M:%S"), "value": data.value} for data in rain_score_data],
-            "light": [{"time": data.timestamp.strftime("%H:%M:%S"), "value": data.value} for data in light_data]
+            name: [point(ts, values[field]) for ts, values in buckets
+                   if values[field][aggs[0]] is not None]
+            for field, name in FRONTEND_KEYS.items()
         }
         
-        return jsonify(result)
+        return http_cache.tag(json_response(result, rows=len(buckets)), etag)
     except Exception as e:
-        print(f"Error fetching historical data: {str(e)}")
+        log.error("historical_data_failed", error=str(e))
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/analyze", methods=["GET"])
 def analyze():
     start = request.args.get("start", type=str)
     end = request.args.get("end", type=str)
+    # "rollup" trades the quartiles for reading pre-aggregated buckets
+    source = request.args.get("source", "raw", type=str)
     
     if not start or not end:
         return jsonify({"msg": "start & end required"}), 400
     
     try:    
-        summary, trends = analyze_date_range_db(start, end)
+        device = request_device()
+        # start and end are absolute, so only newly stored readings change the answer
+        etag = http_cache.make_etag(data_version.boot, data_version.get(device),
+                                    sorted(request.args.items(multi=True)))
+        if http_cache.is_fresh(request, etag):
+            return not_modified(etag)
+        summary, trends = timed_query(analyze_date_range_db, start, end, source, device)
         
         # strip any prefixes:
         clean_summary = {
             topic.split("/", 1)[-1]: stats
-            for topic, stats in summary.to_dict(orient="index").items()
+            for topic, stats in summary.items()
         }
         
         clean_trends = {
@@ -283,77 +570,131 @@ def analyze():
             for topic, slope in trends.items()
         }
         
-        return jsonify({
+        return http_cache.tag(json_response({
             "summary": clean_summary,
             "trends": clean_trends
-        })
+        }, rows=max((stats.get("count") or 0 for stats in summary.values()), default=0)), etag)
     except ValueError as e:
         return jsonify({"error": str(e)}), 400
     except Exception as e:
-        print(f"Error analyzing data: {str(e)}")
+        log.error("analyze_failed", error=str(e))
         return jsonify({"error": str(e)}), 500
 
+def compute_prediction(device=None):
+    # local time, the clock ingest stamps readings with
+    now = datetime.now()
+    past_5h = now - timedelta(hours=5)
+
+    # Mean per topic over the last 5h, averaged inside SQLite
+    means = timed_query(get_reading_means, past_5h, now, ("temperature", "humidity", "pressure"), device)
+
+    # Apply default fallback if anything is missing
+    for key in ["temperature", "humidity", "pressure"]:
+        if key not in means:
+            means[key] = {
+                "temperature": 22.0,
+                "humidity": 50.0,
+                "pressure": 1013.0
+            }[key]
+
+    # Prepare model input
+    X_raw = [
+        means["temperature"],
+        means["humidity"],
+        means["pressure"]
+    ]
+
+    # Predict
+    prob = float(rain_model.predict_proba([X_raw])[0])
+
+    return {
+        "prediction": {
+            "timestamp": now.isoformat(),
+            "rain_prob": prob
+        },
+        "features_used": means
+    }
+
 @app.route("/api/predict", methods=["GET"])
 def predict():
     try:
-        now = datetime.utcnow()
-        past_5h = now - timedelta(hours=5)
-
-        # Query 5h worth of sensor data
-        sensors = SensorData.query.filter(SensorData.timestamp >= past_5h).all()
-
-        # Group values by topic
-        topic_map = {}
-        for s in sensors:
-            topic = s.topic.split("/")[-1]  # e.g., "temperature"
-            topic_map.setdefault(topic, []).append(s.value)
-
-        # Compute mean per topic (simple aggregation formula)
-        means = {
-            k: sum(v) / len(v)
-            for k, v in topic_map.items()
-            if v  # non-empty
-        }
+        device = request_device()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        return json_response(prediction_cache.get_or_compute(lambda: compute_prediction(device), device))
 
-        # Apply default fallback if anything is missing
-        for key in ["temperature", "humidity", "pressure"]:
-            if key not in means:
-                means[key] = {
-                    "temperature": 22.0,
-                    "humidity": 50.0,
-                    "pressure": 1013.0
-                }[key]
-
-        # Prepare model input
-        X_raw = [
-            means["temperature"],
-            means["humidity"],
-            means["pressure"]
-        ]
-        X = scaler.transform([X_raw])
-        xb = torch.tensor(X, dtype=torch.float32)
-
-        # Predict
-        with torch.no_grad():
-            logit = model(xb).item()
-        prob = float(torch.sigmoid(torch.tensor(logit)).item())
-
-        return jsonify({
-            "prediction": {
-                "timestamp": now.isoformat(),
-                "rain_prob": prob
-            },
-            "features_used": means
-        })
+    except Exception as e:
+        log.error("prediction_failed", error=str(e))
+        return jsonify({"error": str(e)}), 500
+
+# most rows one /api/predict/batch request may score
+MAX_BATCH_ROWS = 200000
+
+@app.route("/api/predict/batch", methods=["POST"])
+def predict_batch():
+    # body: {"rows": [[t, h, p], ...] or [{"temperature": ..}, ...]}
+    #   or  {"start": iso, "end": iso, "device": optional} to score every stored reading in range
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({"error": "body must be a JSON object"}), 400
+    chunk_size = data.get("chunk_size", DEFAULT_CHUNK_SIZE)
+    if not isinstance(chunk_size, int) or isinstance(chunk_size, bool) or not 0 < chunk_size <= MAX_BATCH_ROWS:
+        return jsonify({"error": f"chunk_size must be between 1 and {MAX_BATCH_ROWS}"}), 400
+    timestamps = None
+    try:
+        if "rows" in data:
+            rows = data["rows"]
+            if not isinstance(rows, list):
+                raise ValueError("rows must be a list")
+            if len(rows) > MAX_BATCH_ROWS:
+                raise ValueError(f"at most {MAX_BATCH_ROWS} rows per request")
+            X = [[r[f] for f in FEATURES] if isinstance(r, dict) else r for r in rows]
+            X = np.asarray(X, dtype=float) if rows else np.empty((0, len(FEATURES)))
+        elif data.get("start") and data.get("end"):
+            device = data.get("device")
+            if device is not None and (not isinstance(device, str) or len(device) > DEVICE_ID_MAX):
+                raise ValueError(f"device must be a string of at most {DEVICE_ID_MAX} characters")
+            # one row past the cap is enough to reject a range without loading all of it
+            cols = timed_query(get_reading_columns, parse_ts(data["start"]), parse_ts(data["end"]), FEATURES, device,
+                               limit=MAX_BATCH_ROWS + 1)
+            if len(cols["timestamp"]) > MAX_BATCH_ROWS:
+                raise ValueError(f"range has more than {MAX_BATCH_ROWS} readings")
+            X = np.column_stack([cols[f] for f in FEATURES])
+            # readings missing a feature cannot be scored
+            complete = ~np.isnan(X).any(axis=1)
+            X, timestamps = X[complete], cols["timestamp"][complete]
+        else:
+            return jsonify({"msg": "rows or start & end required"}), 400
+        if not np.isfinite(X).all():
+            raise ValueError("features must be finite numbers")
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"error": f"invalid input: {str(e)}"}), 400
 
+    try:
+        probs = rain_model.predict_proba(X, chunk_size) if len(X) else np.empty(0)
+        result = {"count": int(len(probs)), "rain_prob": probs.tolist()}
+        if timestamps is not None:
+            result["timestamps"] = [str(ts).replace(" ", "T") for ts in timestamps.tolist()]
+        return json_response(result, rows=len(probs))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        print(f"Error generating prediction: {str(e)}")
+        log.error("batch_prediction_failed", error=str(e))
         return jsonify({"error": str(e)}), 500
 
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+        for description in run_migrations(db.engine):
+            print(f'migration applied: {description}')
         print('database created')
+        latest_cache.seed(get_latest_values(SENSOR_FIELDS))
+    if app.config['WARM_UP']:
+        warm_up()
+    # start the batched writer before any message can arrive
+    if app.config['INGEST_IN_PROCESS']:
+        ingest_writer.start()
     # start mqtt client 
     mqtt_client.connect(MQTT_BROKER, MQTT_PORT, 60)
     mqtt_client.loop_start()  
@@ -0,0 +1,146 @@
+"""Dashboard reads under concurrent ingest, WAL vs the old rollback journal.
+
+For each SQLite configuration a fresh interpreter serves the app on a
+threaded local server backed by a copy of sensors.db. N reader threads
+hammer /api/data and /api/historical-data while a synthetic publisher
+feeds ESP32-style payloads through ``on_message`` (no broker needed), and
+the ingest writer commits every ``--latency`` seconds. Reported per
+endpoint: throughput, p50/p95/p99 latency and errors ("database is
+locked" surfaces as a 500), plus ingest flush errors.
+
+    python bench_concurrency.py [--readers 8] [--duration 10] [--rate 50] [--latency 0.05]
+"""
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+# SQLITE_PRAGMAS overrides per configuration; "wal" is the default in models.py
+MODES = {
+    "rollback journal": "journal_mode=DELETE,synchronous=FULL,busy_timeout=0,mmap_size=0,cache_size=-2000",
+    "wal": "",
+}
+ENDPOINTS = {
+    "/api/data": "/api/data",
+    "/api/historical-data": "/api/historical-data?window=1h&resolution=10s&agg=mean,max",
+}
+
+
+def percentile(values, q):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def child(readers, duration, rate):
+    from werkzeug.serving import make_server
+    import app as web
+
+    with web.app.app_context():
+        web.db.create_all()
+        web.run_migrations(web.db.engine)
+    web.ingest_writer.start()
+    server = make_server("127.0.0.1", 0, web.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    stop = threading.Event()
+
+    class Message:
+        topic = "esp32/output"
+
+        def __init__(self, payload):
+            self.payload = payload
+
+    def publish():
+        interval = 1.0 / rate
+        next_at = time.monotonic()
+        while not stop.is_set():
+            payload = {"temperature": random.uniform(15, 30), "humidity": random.uniform(30, 90),
+                       "pressure": random.uniform(1000, 1030), "rain_level": 0,
+                       "rain_score": random.random(), "light": random.uniform(0, 1000)}
+            web.on_message(None, None, Message(json.dumps(payload).encode()))
+            next_at += interval
+            time.sleep(max(0.0, next_at - time.monotonic()))
+
+    results = {name: {"latencies": [], "errors": 0} for name in ENDPOINTS}
+
+    def read(worker):
+        names = list(ENDPOINTS)
+        i = worker
+        while not stop.is_set():
+            name = names[i % len(names)]
+            i += 1
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(base + ENDPOINTS[name], timeout=30) as response:
+                    response.read()
+                results[name]["latencies"].append(time.perf_counter() - started)
+            except (urllib.error.URLError, OSError):
+                results[name]["errors"] += 1
+
+    threads = [threading.Thread(target=publish)] + [
+        threading.Thread(target=read, args=(w,)) for w in range(readers)]
+    for t in threads:
+        t.start()
+    time.sleep(duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    server.shutdown()
+    web.ingest_writer.stop()
+
+    report = {"ingest": web.ingest_writer.stats()}
+    for name, r in results.items():
+        lat = r["latencies"]
+        report[name] = {"requests": len(lat), "errors": r["errors"], "rps": len(lat) / duration,
+                        "p50": percentile(lat, 0.5), "p95": percentile(lat, 0.95), "p99": percentile(lat, 0.99)}
+    print(json.dumps(report))
+
+
+def main():
+    args = sys.argv[1:]
+
+    def option(name, default):
+        return type(default)(args[args.index(name) + 1]) if name in args else default
+
+    readers = option("--readers", 8)
+    duration = option("--duration", 10.0)
+    rate = option("--rate", 50.0)
+    latency = option("--latency", 0.05)
+    if "--child" in args:
+        child(readers, duration, rate)
+        return
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    print(f"{readers} readers, {rate:g} msg/s ingest, ingest commit every {latency:g} s, {duration:g} s per mode")
+    print(f"{'mode':>16} | {'endpoint':<20} | {'req/s':>7} | {'p50':>8} | {'p95':>8} | {'p99':>8} | errors")
+    for mode, pragmas in MODES.items():
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "sensors.db")
+            shutil.copy(os.path.join(here, "sensors.db"), path)
+            env = dict(os.environ, DATABASE_URL="sqlite:///" + path, SQLITE_PRAGMAS=pragmas,
+                       INGEST_MAX_LATENCY=str(latency), PYTHONPATH=here)
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", *args],
+                                 cwd=here, env=env, capture_output=True, text=True)
+            if out.returncode != 0:
+                sys.exit(out.stderr[-2000:])
+            report = json.loads(out.stdout.strip().splitlines()[-1])
+        for name in ENDPOINTS:
+            r = report[name]
+            print(f"{mode:>16} | {name:<20} | {r['rps']:>7.0f} | {r['p50'] * 1000:>5.1f} ms | "
+                  f"{r['p95'] * 1000:>5.1f} ms | {r['p99'] * 1000:>5.1f} ms | {r['errors']}")
+        ingest = report["ingest"]
+        print(f"{mode:>16} | {'ingest':<20} | rows {ingest['rows_written']}, flushes {ingest['flush_count']}, "
+              f"flush errors {ingest['flush_errors']}, max flush {ingest['max_flush_seconds'] * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""Decode cost of each MQTT payload format at fleet message rates.
+
+Encodes the same station readings in every format ``payloads.py`` knows,
+then times the ingest path for each: sniff + decode, and decode +
+``reading_row``. Each format gets a payload size, microseconds per message,
+messages per second on one core, and the share of a core needed for
+``--devices`` stations each publishing ``--rate`` messages per second.
+``json (old)`` is the previous ``json.loads(payload.decode())``.
+
+The run ends by feeding random, truncated and bit-flipped payloads, and
+ones holding NaN or numbers too large for a float, to the decoder and
+``reading_row``, and checks that every failure is a ``PayloadError``.
+
+    python bench_decode.py [--devices 1000] [--rate 1] [--messages 50000] [--fuzz 20000]
+"""
+import json
+import random
+import sys
+import time
+from datetime import datetime
+
+import payloads
+from models import reading_row
+
+
+def readings(n, seed=0):
+    r = random.Random(seed)
+    return [{
+        "temperature": round(r.uniform(15, 30), 2), "humidity": round(r.uniform(30, 90), 2),
+        "pressure": round(r.uniform(1000, 1030), 2), "rain_level": r.choice([0, 0, 0, 1, 2]),
+        "rain_score": round(r.random(), 3), "light": round(r.uniform(0, 1000), 1),
+    } for _ in range(n)]
+
+
+def best_of(fn, items, repeat=5):
+    """Best per-item seconds of ``fn`` over ``items`` across ``repeat`` passes."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for item in items:
+            fn(item)
+        best = min(best, (time.perf_counter() - started) / len(items))
+    return best
+
+
+def measure(fmt, data):
+    encoded = [payloads.encode(d, fmt if fmt != "json (old)" else "json") for d in data]
+    now = datetime.now()
+    if fmt == "json (old)":
+        decode = lambda p: json.loads(p.decode())
+    else:
+        decode = lambda p: payloads.decode(p)[1]
+    return {
+        "bytes": sum(map(len, encoded)) / len(encoded),
+        "decode_s": best_of(decode, encoded),
+        "row_s": best_of(lambda p: reading_row(decode(p), now, "bench"), encoded),
+    }
+
+
+def hostile_numbers():
+    """Well-formed payloads whose numbers no float can hold."""
+    found = [b'{"temperature": 1' + b"0" * 400 + b"}", b'{"humidity": NaN}', b'{"light": -Infinity}',
+             b'{"pressure": 1e999}', payloads.STRUCT_LAYOUTS[1][0].pack(1, float("inf"), 0, 0, 0, 0, 0)]
+    if payloads.available("cbor"):
+        found.append(payloads.encode({"temperature": 10 ** 400}, "cbor"))
+    if payloads.available("msgpack"):
+        found.append(payloads.encode({"temperature": float("nan")}, "msgpack"))
+    return found
+
+
+def fuzz(count, seed=1):
+    """(payloads tried, rejected) for broken inputs; raises if anything but PayloadError escapes.
+
+    Whatever decodes also goes through ``reading_row``, as on the ingest path.
+    """
+    r = random.Random(seed)
+    valid = [payloads.encode(d, fmt) for d in readings(50, seed)
+             for fmt in payloads.DECODERS if payloads.available(fmt)]
+    hostile = hostile_numbers()
+    now = datetime.now()
+    rejected = 0
+    for i in range(count):
+        kind = i % 4
+        if kind == 3:
+            payload = r.choice(hostile)
+        elif kind == 0:
+            payload = bytes(r.getrandbits(8) for _ in range(r.randint(0, 64)))
+        else:
+            payload = bytearray(r.choice(valid))
+            if kind == 1:
+                payload = payload[:r.randint(0, len(payload) - 1)]
+            else:
+                payload[r.randrange(len(payload))] ^= 1 << r.randrange(8)
+            payload = bytes(payload)
+        try:
+            _, data = payloads.decode(payload)
+        except payloads.PayloadError:
+            rejected += 1
+            continue
+        reading_row(data, now, "fuzz")
+    return count, rejected
+
+
+def main():
+    devices, rate, messages, fuzz_count = 1000, 1.0, 50000, 20000
+    if "--devices" in sys.argv:
+        devices = int(sys.argv[sys.argv.index("--devices") + 1])
+    if "--rate" in sys.argv:
+        rate = float(sys.argv[sys.argv.index("--rate") + 1])
+    if "--messages" in sys.argv:
+        messages = int(sys.argv[sys.argv.index("--messages") + 1])
+    if "--fuzz" in sys.argv:
+        fuzz_count = int(sys.argv[sys.argv.index("--fuzz") + 1])
+
+    fleet_rate = devices * rate
+    data = readings(messages)
+    print(f"{devices} devices x {rate:g} msg/s = {fleet_rate:g} msg/s, {messages} messages per format")
+    print(f"{'format':>10} | {'bytes':>6} | {'decode':>9} | {'+ row':>9} | {'msg/s/core':>10} | fleet CPU")
+    for fmt in ("json (old)",) + tuple(payloads.DECODERS):
+        if fmt in payloads.DECODERS and not payloads.available(fmt):
+            print(f"{fmt:>10} | skipped, {fmt} package not installed")
+            continue
+        r = measure(fmt, data)
+        print(f"{fmt:>10} | {r['bytes']:>6.1f} | {r['decode_s'] * 1e6:>6.2f} us | {r['row_s'] * 1e6:>6.2f} us | "
+              f"{1 / r['row_s']:>10.0f} | {fleet_rate * r['row_s'] * 100:>7.2f} %")
+
+    tried, rejected = fuzz(fuzz_count)
+    # bit flips and truncations can still leave a valid payload, so only escapes are failures
+    print(f"fuzz: {tried} broken payloads, {rejected} rejected with PayloadError, "
+          f"{tried - rejected} still decoded, none raised anything else")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Import-time profile of the Flask app, per module, via ``python -X importtime``.
+
+Runs ``import app`` in fresh interpreters (best of ``--repeat``), then
+prints the total, the slowest top-level packages by cumulative time, and
+whether any dependency that should load lazily (torch, scikit-learn,
+pandas) was imported anyway. ``--budget-ms`` turns it into a check that
+exits non-zero on a regression.
+
+    python bench_import.py [--module app] [--repeat 5] [--top 15] [--budget-ms 800]
+"""
+import os
+import subprocess
+import sys
+
+# must stay out of `import app`; they load on first use only
+LAZY = ("torch", "sklearn", "pandas")
+
+
+def profile(module):
+    """[(name, self us, cumulative us)] for everything one cold ``import module`` loads."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                         capture_output=True, text=True, cwd=here, env=dict(os.environ, PYTHONPATH=here))
+    if out.returncode != 0:
+        sys.exit(f"import {module} failed:\n{out.stderr[-2000:]}")
+    lines = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # children are printed before their parent, indented two spaces per level
+        lines.append((name.strip(), int(self_us), int(cumulative_us), (len(name) - len(name.lstrip()) - 1) // 2))
+    # keep `module` and the nested imports right above it; drop interpreter startup (site, encodings)
+    end = max(i for i, (name, _, _, depth) in enumerate(lines) if name == module and depth == 0)
+    start = end
+    while start > 0 and lines[start - 1][3] > 0:
+        start -= 1
+    return [(name, self_us, cumulative_us) for name, self_us, cumulative_us, _ in lines[start:end + 1]]
+
+
+def main():
+    args = sys.argv[1:]
+
+    def option(name, default):
+        return type(default)(args[args.index(name) + 1]) if name in args else default
+
+    module = option("--module", "app")
+    repeat = option("--repeat", 5)
+    top = option("--top", 15)
+    budget_ms = option("--budget-ms", 0.0)
+
+    runs = [profile(module) for _ in range(repeat)]
+    best = min(runs, key=lambda r: r[-1][2])
+    total_ms = best[-1][2] / 1000
+
+    # self time summed per top-level package, so numpy.* or sqlalchemy.* show up as one line
+    packages = {}
+    for name, self_us, _ in best:
+        root = name.split(".")[0]
+        packages[root] = packages.get(root, 0) + self_us
+    print(f"import {module}: {total_ms:.0f} ms, {len(best)} modules (best of {repeat})")
+    print(f"{'package':<24} | {'self time':>9} | share")
+    for root, self_us in sorted(packages.items(), key=lambda kv: -kv[1])[:top]:
+        print(f"{root:<24} | {self_us / 1000:>6.1f} ms | {100 * self_us / best[-1][2]:>4.0f}%")
+
+    eager = sorted(set(packages) & set(LAZY))
+    print("lazy dependencies imported eagerly: " + (", ".join(eager) if eager else "none"))
+    failed = bool(eager) or (budget_ms and total_ms > budget_ms)
+    if budget_ms:
+        print(f"budget: {total_ms:.0f} / {budget_ms:.0f} ms")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
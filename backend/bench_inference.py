@@ -0,0 +1,83 @@
+"""Startup cost, memory and latency of the rain classifier backends.
+
+Each backend is measured in a fresh interpreter: time to import and load
+the model, resident memory afterwards, then per-call latency for a single
+row (what /api/predict does) and for a 10k-row batch. The two engines must
+agree before the numbers mean anything, so the run ends with a parity check.
+
+    python bench_inference.py [--backends numpy,torch] [--calls 2000]
+"""
+import json
+import subprocess
+import sys
+import time
+
+BATCH_ROWS = 10000
+
+CHILD = r"""
+import json, sys, time
+started = time.perf_counter()
+from prediction import load_rain_model
+model = load_rain_model(sys.argv[1])
+load_s = time.perf_counter() - started
+
+import numpy as np
+calls = int(sys.argv[2])
+row = [[22.0, 60.0, 1013.0]]
+model.predict_proba(row)
+started = time.perf_counter()
+for _ in range(calls):
+    model.predict_proba(row)
+single_us = (time.perf_counter() - started) / calls * 1e6
+
+X = np.random.default_rng(0).uniform([-10, 0, 950], [50, 100, 1060], size=(%d, 3))
+model.predict_proba(X)
+started = time.perf_counter()
+for _ in range(20):
+    model.predict_proba(X)
+batch_ms = (time.perf_counter() - started) / 20 * 1000
+
+rss_kb = 0
+with open("/proc/self/status") as f:
+    for line in f:
+        if line.startswith("VmRSS:"):
+            rss_kb = int(line.split()[1])
+print(json.dumps({"load_s": load_s, "rss_mb": rss_kb / 1024, "single_us": single_us,
+                  "batch_ms": batch_ms, "torch_loaded": "torch" in sys.modules}))
+""" % BATCH_ROWS
+
+
+def measure(backend, calls):
+    out = subprocess.run([sys.executable, "-c", CHILD, backend, str(calls)],
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def parity():
+    import numpy as np
+    from prediction import NumpyRainModel, TorchRainModel
+
+    X = np.random.default_rng(1).uniform([-10, 0, 950], [50, 100, 1060], size=(100000, 3))
+    diff = NumpyRainModel.load().predict_proba(X) - TorchRainModel.load().predict_proba(X)
+    return float(np.abs(diff).max())
+
+
+def main():
+    backends = ["numpy", "torch"]
+    calls = 2000
+    if "--backends" in sys.argv:
+        backends = sys.argv[sys.argv.index("--backends") + 1].split(",")
+    if "--calls" in sys.argv:
+        calls = int(sys.argv[sys.argv.index("--calls") + 1])
+
+    print(f"{'backend':>8} | {'import + load':>13} | {'RSS':>9} | {'1 row':>9} | {f'{BATCH_ROWS} rows':>10} | torch imported")
+    for backend in backends:
+        r = measure(backend, calls)
+        print(f"{backend:>8} | {r['load_s'] * 1000:>10.0f} ms | {r['rss_mb']:>6.0f} MB | "
+              f"{r['single_us']:>6.1f} us | {r['batch_ms']:>7.2f} ms | {r['torch_loaded']}")
+    if set(backends) >= {"numpy", "torch"}:
+        print(f"parity: max |p_numpy - p_torch| over 100000 rows = {parity():.2e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Latency of the /api/data lookups as the database grows.
+
+Builds throwaway databases of increasing size and times
+``get_latest_values`` against the old six ``filter(topic==...).first()``
+queries on the legacy table, with and without the topic/timestamp index.
+
+    python bench_latest.py                      # 10k, 100k, 1M, 10M rows
+    python bench_latest.py --quick              # stop at 1M
+    python bench_latest.py --sizes 10000,10000000
+
+Building the 10M database takes most of the run (about 20 minutes here) and
+a few GB in the temp directory; --quick finishes in about 2 minutes.
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta
+from flask import Flask
+from models import db, SensorData, SENSOR_FIELDS
+from migrations import run_migrations
+from database import get_latest_values
+
+REPEAT = 50
+
+
+def populate(path, rows):
+    # sensor_reading gets `rows` messages, sensor_data gets `rows` key/value rows
+    conn = sqlite3.connect(path)
+    start = datetime(2025, 1, 1)
+    conn.execute("CREATE TABLE sensor_data (id INTEGER PRIMARY KEY, topic VARCHAR(100), value FLOAT, timestamp DATETIME)")
+    conn.execute(f"CREATE TABLE sensor_reading (id INTEGER PRIMARY KEY, timestamp DATETIME, "
+                 f"{', '.join(f + ' FLOAT' for f in SENSOR_FIELDS)}, extra TEXT)")
+    placeholders = ", ".join("?" * (len(SENSOR_FIELDS) + 1))
+    chunk = 100000
+    for offset in range(0, rows, chunk):
+        n = min(chunk, rows - offset)
+        stamps = [str(start + timedelta(seconds=offset + i)) for i in range(n)]
+        conn.executemany(
+            f"INSERT INTO sensor_reading (timestamp, {', '.join(SENSOR_FIELDS)}) VALUES ({placeholders})",
+            ((ts, *(random.random() for _ in SENSOR_FIELDS)) for ts in stamps))
+        conn.executemany(
+            "INSERT INTO sensor_data (topic, value, timestamp) VALUES (?, ?, ?)",
+            ((f"esp32/{SENSOR_FIELDS[(offset + i) % len(SENSOR_FIELDS)]}", random.random(), stamps[i // len(SENSOR_FIELDS)])
+             for i in range(n)))
+        conn.commit()
+    # pretend the schema predates the migrations, so run_migrations adds the indexes later
+    conn.execute("PRAGMA user_version = 1")
+    conn.commit()
+    conn.close()
+
+
+def six_queries():
+    return {f: SensorData.query.filter(SensorData.topic == f"esp32/{f}")
+            .order_by(SensorData.timestamp.desc()).first() for f in SENSOR_FIELDS}
+
+
+def timed(fn, repeat):
+    fn()  # warm the page cache
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    sizes = [10000, 100000, 1000000, 10000000]
+    if "--quick" in sys.argv:
+        sizes = [n for n in sizes if n <= 1000000]
+    if "--sizes" in sys.argv:
+        sizes = [int(s) for s in sys.argv[sys.argv.index("--sizes") + 1].split(",")]
+
+    print(f"{'rows':>10} | {'six queries, no index':>22} | {'six queries, index':>19} | {'get_latest_values':>17}")
+    for rows in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.db")
+            populate(path, rows)
+            app = Flask(__name__)
+            app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + path
+            db.init_app(app)
+            with app.app_context():
+                # the unindexed baseline scans the table, so keep it to a few runs
+                unindexed = timed(six_queries, 3)
+                run_migrations(db.engine)
+                indexed = timed(six_queries, REPEAT)
+                latest = timed(lambda: get_latest_values(SENSOR_FIELDS), REPEAT)
+                db.session.remove()
+                db.engine.dispose()
+        print(f"{rows:>10} | {unindexed:>19.3f} ms | {indexed:>16.3f} ms | {latest:>14.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,443 @@
+"""Load test: a simulated ESP32 fleet plus concurrent clients on every read endpoint.
+
+``--devices`` simulated stations publish ESP32-style JSON (the firmware's
+six keys, drifting like real sensors) on ``stations/<id>/output`` at
+``--rate`` messages per second each. ``--via direct`` hands the messages to
+``app.on_message`` in-process. ``--via broker`` publishes them through a
+minimal local MQTT broker that the app's own paho client subscribes to.
+Meanwhile ``--clients`` HTTP threads cycle through the read endpoints and
+``--streams`` clients hold ``/api/stream`` open. The app is served on a
+threaded local server backed by a copy of sensors.db (or an empty
+database with ``--fresh``).
+
+Reported: published and stored messages/s, ingest drops and flush errors,
+how long the writer needed to catch up, per-endpoint req/s and
+p50/p95/p99 latency, stream events received, and database growth in
+bytes per stored reading. ``--out`` writes the same as JSON;
+``--compare`` prints two such files side by side.
+
+    python bench_load.py [--devices 20] [--rate 1] [--duration 30] [--clients 8] [--streams 4]
+                         [--via direct|broker] [--fresh] [--out results.json]
+    python bench_load.py --compare before.json after.json
+"""
+import json
+import logging
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta
+
+from bench_concurrency import percentile
+
+
+class Station:
+    """One simulated ESP32: values drift in small steps like the real sensors."""
+
+    def __init__(self, device, rng):
+        self.device = device
+        self.topic = f"stations/{device}/output"
+        self.rng = rng
+        self.temperature = rng.uniform(12, 28)
+        self.humidity = rng.uniform(35, 85)
+        self.pressure = rng.uniform(1005, 1025)
+        self.light = rng.uniform(0, 800)
+        self.rain_score = 0.0
+
+    def payload(self):
+        r = self.rng
+        self.temperature += r.gauss(0, 0.05)
+        self.humidity = min(100.0, max(0.0, self.humidity + r.gauss(0, 0.2)))
+        self.pressure += r.gauss(0, 0.02)
+        self.light = max(0.0, self.light + r.gauss(0, 5))
+        self.rain_score = min(1.0, max(0.0, self.rain_score + r.gauss(0, 0.02)))
+        rain_level = 0 if self.rain_score < 0.25 else 1 if self.rain_score < 0.5 else 2 if self.rain_score < 0.75 else 3
+        # same keys and rounding as the firmware's StaticJsonDocument
+        return json.dumps({
+            "temperature": round(self.temperature, 2), "humidity": round(self.humidity, 2),
+            "pressure": round(self.pressure, 2), "rain_level": rain_level,
+            "rain_score": round(self.rain_score, 6), "light": round(self.light, 1),
+        }).encode()
+
+
+class StubBroker:
+    """Just enough MQTT 3.1.1 for localhost: QoS 0 fan-out, + and # filters, no sessions."""
+
+    def __init__(self):
+        self._server = socket.create_server(("127.0.0.1", 0))
+        self.port = self._server.getsockname()[1]
+        self._lock = threading.Lock()
+        self._subscriptions = []  # (connection, send lock, topic filter)
+        self.forwarded = 0
+
+    def start(self):
+        threading.Thread(target=self._accept, daemon=True).start()
+        return self
+
+    def _accept(self):
+        while True:
+            conn, _ = self._server.accept()
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    @staticmethod
+    def _read_exact(conn, n):
+        data = b""
+        while len(data) < n:
+            chunk = conn.recv(n - len(data))
+            if not chunk:
+                raise ConnectionError
+            data += chunk
+        return data
+
+    @staticmethod
+    def _remaining_length(n):
+        out = b""
+        while True:
+            byte, n = n % 128, n // 128
+            out += bytes([byte | 128 if n else byte])
+            if not n:
+                return out
+
+    def _serve(self, conn):
+        import paho.mqtt.client as mqtt
+        send_lock = threading.Lock()
+        try:
+            while True:
+                header = self._read_exact(conn, 1)[0]
+                length, multiplier = 0, 1
+                while True:
+                    byte = self._read_exact(conn, 1)[0]
+                    length += (byte & 127) * multiplier
+                    multiplier *= 128
+                    if not byte & 128:
+                        break
+                body = self._read_exact(conn, length)
+                kind = header >> 4
+                if kind == 1:  # CONNECT
+                    conn.sendall(b"\x20\x02\x00\x00")
+                elif kind == 3:  # PUBLISH
+                    size = struct.unpack("!H", body[:2])[0]
+                    topic = body[2:2 + size].decode()
+                    payload = body[2 + size + (2 if header & 6 else 0):]
+                    if header & 6 == 2:  # QoS 1 needs a PUBACK
+                        conn.sendall(b"\x40\x02" + body[2 + size:4 + size])
+                    self._forward(topic, payload, mqtt.topic_matches_sub)
+                elif kind == 8:  # SUBSCRIBE
+                    packet_id, rest, granted = body[:2], body[2:], b""
+                    while rest:
+                        size = struct.unpack("!H", rest[:2])[0]
+                        with self._lock:
+                            self._subscriptions.append((conn, send_lock, rest[2:2 + size].decode()))
+                        rest, granted = rest[3 + size:], granted + b"\x00"
+                    with send_lock:
+                        conn.sendall(b"\x90" + self._remaining_length(2 + len(granted)) + packet_id + granted)
+                elif kind == 12:  # PINGREQ
+                    with send_lock:
+                        conn.sendall(b"\xd0\x00")
+                elif kind == 14:  # DISCONNECT
+                    break
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            with self._lock:
+                self._subscriptions = [s for s in self._subscriptions if s[0] is not conn]
+            conn.close()
+
+    def _forward(self, topic, payload, matches):
+        body = struct.pack("!H", len(topic)) + topic.encode() + payload
+        packet = b"\x30" + self._remaining_length(len(body)) + body
+        with self._lock:
+            targets = {(conn, send_lock) for conn, send_lock, pattern in self._subscriptions
+                       if matches(pattern, topic)}
+        for conn, send_lock in targets:
+            try:
+                with send_lock:
+                    conn.sendall(packet)
+                self.forwarded += 1
+            except OSError:
+                pass
+
+
+def db_size(path):
+    """File size and bytes in used pages; freed pages are reused before the file grows."""
+    if not os.path.exists(path):
+        return {"file": 0, "used": 0}
+    conn = sqlite3.connect(path)
+    try:
+        page_size, pages, free = (conn.execute(f"PRAGMA {p}").fetchone()[0]
+                                  for p in ("page_size", "page_count", "freelist_count"))
+    finally:
+        conn.close()
+    wal = path + "-wal"
+    return {"file": os.path.getsize(path) + (os.path.getsize(wal) if os.path.exists(wal) else 0),
+            "used": (pages - free) * page_size}
+
+
+def run(devices, rate, duration, clients, streams, via, fresh):
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, "sensors.db")
+    here = os.path.dirname(os.path.abspath(__file__))
+    if not fresh:
+        shutil.copy(os.path.join(here, "sensors.db"), path)
+    os.environ["DATABASE_URL"] = "sqlite:///" + path
+    os.environ.setdefault("JWT_SECRET_KEY", "bench-load-secret-key-0123456789abcdef")
+    # the simulated stations publish on stations/<id>/output, which the app only takes when asked
+    os.environ.setdefault("MQTT_TOPICS", "esp32/output,stations/+/output")
+    from werkzeug.serving import make_server
+    from flask_jwt_extended import create_access_token
+    import app as web
+
+    # one log line per request would swamp the report
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    with web.app.app_context():
+        web.db.create_all()
+        web.run_migrations(web.db.engine)
+        # the kind of token the dashboard gets from /api/stream/token
+        token = create_access_token(identity="bench_load", additional_claims={"scope": "stream"},
+                                    expires_delta=False)
+    web.ingest_writer.start()
+    server = make_server("127.0.0.1", 0, web.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    rng = random.Random(0)
+    fleet = [Station(f"station-{i:03d}", rng) for i in range(devices)]
+    size_before = db_size(path)
+
+    if via == "broker":
+        import paho.mqtt.client as mqtt
+        broker = StubBroker().start()
+        subscribed = threading.Event()
+        web.mqtt_client.on_subscribe = lambda *args: subscribed.set()
+        web.mqtt_client.connect("127.0.0.1", broker.port, 60)
+        web.mqtt_client.loop_start()
+        if not subscribed.wait(5):
+            sys.exit("the app did not subscribe to the local broker")
+        publisher = mqtt.Client()
+        publisher.connect("127.0.0.1", broker.port, 60)
+        publisher.loop_start()
+        send = lambda station, payload: publisher.publish(station.topic, payload)
+    else:
+        class Message:
+            def __init__(self, topic, payload):
+                self.topic, self.payload = topic, payload
+        send = lambda station, payload: web.on_message(None, None, Message(station.topic, payload))
+
+    stop = threading.Event()
+    published = [0]
+
+    def publish():
+        # the whole fleet on one schedule, stations taking turns
+        interval = 1.0 / (devices * rate)
+        started = time.monotonic()
+        while not stop.is_set():
+            due = int((time.monotonic() - started) / interval)
+            while published[0] < due and not stop.is_set():
+                station = fleet[published[0] % devices]
+                send(station, station.payload())
+                published[0] += 1
+            time.sleep(min(interval, 0.01))
+
+    device = fleet[0].device
+    endpoints = {
+        "data": ("GET", "/api/data", None),
+        "data?device": ("GET", f"/api/data?device={device}", None),
+        "historical raw 10s": ("GET", "/api/historical-data?window=1h&resolution=10s&agg=mean,max", None),
+        "historical rollup 5m": ("GET", "/api/historical-data?window=24h&resolution=5m&agg=mean,min,max", None),
+        "historical?device": ("GET", f"/api/historical-data?window=1h&resolution=1m&device={device}", None),
+        "analyze raw": ("GET", "/api/analyze?start={hour_ago}&end={now}", None),
+        "analyze rollup": ("GET", "/api/analyze?start={day_ago}&end={now}&source=rollup", None),
+        "predict": ("GET", "/api/predict", None),
+        "predict?device": ("GET", f"/api/predict?device={device}", None),
+        "predict/batch": ("POST", "/api/predict/batch",
+                          {"rows": [[rng.uniform(10, 30), rng.uniform(30, 90), rng.uniform(1000, 1030)]
+                                    for _ in range(1000)]}),
+    }
+    # errors: connection failures and 5xx; rejected: 4xx (e.g. /api/analyze before any data exists)
+    results = {name: {"latencies": [], "errors": 0, "rejected": 0} for name in endpoints}
+
+    def request(method, path, body):
+        now = datetime.now().replace(microsecond=0)
+        path = path.format(now=now.isoformat(), hour_ago=(now - timedelta(hours=1)).isoformat(),
+                           day_ago=(now - timedelta(days=1)).isoformat())
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(base + path, data=data, method=method,
+                                     headers={"Content-Type": "application/json"} if data else {})
+        with urllib.request.urlopen(req, timeout=30) as response:
+            response.read()
+
+    def read(worker):
+        names = list(endpoints)
+        i = worker
+        while not stop.is_set():
+            name = names[i % len(names)]
+            i += 1
+            started = time.perf_counter()
+            try:
+                request(*endpoints[name])
+                results[name]["latencies"].append(time.perf_counter() - started)
+            except urllib.error.HTTPError as e:
+                results[name]["rejected" if e.code < 500 else "errors"] += 1
+            except (urllib.error.URLError, OSError):
+                results[name]["errors"] += 1
+
+    stream_events = [0] * streams
+    stream_errors = [0]
+
+    def listen(n):
+        try:
+            with urllib.request.urlopen(f"{base}/api/stream?jwt={token}", timeout=5) as response:
+                while not stop.is_set():
+                    line = response.readline()
+                    if not line:
+                        break
+                    if line.startswith(b"event: reading"):
+                        stream_events[n] += 1
+        except (urllib.error.URLError, OSError):
+            if not stop.is_set():
+                stream_errors[0] += 1
+
+    threads = ([threading.Thread(target=publish)]
+               + [threading.Thread(target=read, args=(w,)) for w in range(clients)]
+               + [threading.Thread(target=listen, args=(n,), daemon=True) for n in range(streams)])
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    time.sleep(duration)
+    stop.set()
+    for t in threads[:1 + clients]:
+        t.join()
+    elapsed = time.monotonic() - started
+
+    # how long the writer needs to store what was published
+    drain_started = time.monotonic()
+    while time.monotonic() - drain_started < 30:
+        stats = web.ingest_writer.stats()
+        if stats["rows_written"] + stats["messages_dropped"] >= published[0] and not stats["queue_depth"]:
+            break
+        time.sleep(0.05)
+    drain = time.monotonic() - drain_started
+    server.shutdown()
+    web.ingest_writer.stop()
+    if via == "broker":
+        publisher.loop_stop()
+        web.mqtt_client.loop_stop()
+    size_after = db_size(path)
+    stats = web.ingest_writer.stats()
+    shutil.rmtree(tmp, ignore_errors=True)
+
+    growth = size_after["used"] - size_before["used"]
+    report = {
+        "config": {"devices": devices, "rate": rate, "duration": duration, "clients": clients,
+                   "streams": streams, "via": via, "fresh": fresh},
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(here),
+        "ingest": {
+            "published": published[0],
+            "published_per_s": published[0] / elapsed,
+            "stored": stats["rows_written"],
+            "stored_per_s": stats["rows_written"] / (elapsed + drain),
+            "dropped": stats["messages_dropped"],
+            "flush_errors": stats["flush_errors"],
+            "max_flush_seconds": stats["max_flush_seconds"],
+            "drain_seconds": drain,
+        },
+        "endpoints": {},
+        "streams": {"clients": streams, "events": sum(stream_events),
+                    "events_per_client_per_s": sum(stream_events) / max(1, streams) / elapsed,
+                    "errors": stream_errors[0]},
+        "db": {"before_bytes": size_before, "after_bytes": size_after, "growth_bytes": growth,
+               "bytes_per_reading": growth / stats["rows_written"] if stats["rows_written"] else None},
+    }
+    for name, r in results.items():
+        lat = r["latencies"]
+        report["endpoints"][name] = {"requests": len(lat), "errors": r["errors"], "rejected": r["rejected"],
+                                     "rps": len(lat) / elapsed,
+                                     "p50": percentile(lat, 0.5), "p95": percentile(lat, 0.95),
+                                     "p99": percentile(lat, 0.99)}
+    return report
+
+
+def git_commit(here):
+    out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=here, capture_output=True, text=True)
+    return out.stdout.strip() or None
+
+
+def print_report(report):
+    c, i = report["config"], report["ingest"]
+    print(f"{c['devices']} devices x {c['rate']:g} msg/s via {c['via']}, {c['clients']} HTTP clients, "
+          f"{c['streams']} streams, {c['duration']:g} s")
+    print(f"ingest: published {i['published_per_s']:.0f} msg/s, stored {i['stored_per_s']:.0f} msg/s, "
+          f"dropped {i['dropped']}, flush errors {i['flush_errors']}, drained in {i['drain_seconds']:.2f} s")
+    print(f"{'endpoint':<22} | {'req/s':>7} | {'p50':>8} | {'p95':>8} | {'p99':>8} | errors | 4xx")
+    for name, r in report["endpoints"].items():
+        print(f"{name:<22} | {r['rps']:>7.1f} | {r['p50'] * 1000:>5.1f} ms | {r['p95'] * 1000:>5.1f} ms | "
+              f"{r['p99'] * 1000:>5.1f} ms | {r['errors']:>6} | {r['rejected']}")
+    s, d = report["streams"], report["db"]
+    print(f"streams: {s['events']} events ({s['events_per_client_per_s']:.1f}/s per client), errors {s['errors']}")
+    per_reading = f"{d['bytes_per_reading']:.0f} bytes/reading" if d["bytes_per_reading"] is not None else "n/a"
+    print(f"database: +{d['growth_bytes'] / 1e6:.2f} MB used ({per_reading}), "
+          f"file {d['before_bytes']['file'] / 1e6:.1f} -> {d['after_bytes']['file'] / 1e6:.1f} MB")
+
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+
+    def change(old, new):
+        return f"{100 * (new - old) / old:+.0f}%" if old else "n/a"
+
+    print(f"before: {before_path} ({before.get('commit')}), after: {after_path} ({after.get('commit')})")
+    for key in ("published_per_s", "stored_per_s", "drain_seconds"):
+        old, new = before["ingest"][key], after["ingest"][key]
+        print(f"ingest {key:<18} | {old:>9.2f} -> {new:>9.2f} | {change(old, new)}")
+    print(f"{'endpoint':<22} | {'p50 ms':>17} | {'p99 ms':>17} | {'req/s':>15}")
+    for name in before["endpoints"]:
+        if name not in after["endpoints"]:
+            continue
+        b, a = before["endpoints"][name], after["endpoints"][name]
+        print(f"{name:<22} | {b['p50'] * 1000:>6.1f} -> {a['p50'] * 1000:>6.1f} | "
+              f"{b['p99'] * 1000:>6.1f} -> {a['p99'] * 1000:>6.1f} | {b['rps']:>5.0f} -> {a['rps']:>5.0f} "
+              f"({change(b['rps'], a['rps'])})")
+    old, new = before["db"]["bytes_per_reading"], after["db"]["bytes_per_reading"]
+    if old is not None and new is not None:
+        print(f"db bytes per reading   | {old:.0f} -> {new:.0f} | {change(old, new)}")
+
+
+def main():
+    args = sys.argv[1:]
+    if "--compare" in args:
+        i = args.index("--compare")
+        compare(args[i + 1], args[i + 2])
+        return
+
+    def option(name, default):
+        return type(default)(args[args.index(name) + 1]) if name in args else default
+
+    via = option("--via", "direct")
+    if via not in ("direct", "broker"):
+        sys.exit("--via must be direct or broker")
+    report = run(devices=option("--devices", 20), rate=option("--rate", 1.0), duration=option("--duration", 30.0),
+                 clients=option("--clients", 8), streams=option("--streams", 4), via=via, fresh="--fresh" in args)
+    print_report(report)
+    out = option("--out", "")
+    if out:
+        with open(out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"results written to {out}")
+
+
+if __name__ == '__main__':
+    main()
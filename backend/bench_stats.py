@@ -0,0 +1,78 @@
+"""Micro-benchmark: /api/analyze statistics, old pandas path vs stats.py.
+
+The old path is the one analyze_date_range_db used to run on its pivoted
+DataFrame: ``df.describe()`` plus a Python loop per column for the slope.
+No database is involved; both sides get the same in-memory arrays.
+
+    python bench_stats.py [rows ...]
+"""
+import sys
+import time
+import numpy as np
+import pandas as pd
+from stats import Moments, summarize
+
+TOPICS = ['temperature', 'humidity', 'pressure', 'rain_score', 'light']
+
+
+def old_describe_and_trends(df):
+    summary = df.describe().T
+    trends = {}
+    x = (df.index - df.index[0]).total_seconds().values.reshape(-1, 1)
+    for col in df.columns:
+        y = df[col].values
+        cov = ((x.flatten() - x.mean()) * (y - y.mean())).sum()
+        var = ((x.flatten() - x.mean()) ** 2).sum()
+        trends[col] = cov / var
+    return summary, trends
+
+
+def chunked(x, C, chunk_size=50000):
+    # how analyze_date_range_db streams: topics x rows chunks, merged pairwise
+    moments = Moments.empty(C.shape[0])
+    for i in range(0, len(x), chunk_size):
+        moments = moments.merge(Moments.from_columns(x[i:i + chunk_size], C[:, i:i + chunk_size]))
+    return moments
+
+
+def best_of(fn, repeat=5):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return min(times) * 1000
+
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [10000, 100000, 1000000]
+    rng = np.random.default_rng(0)
+    print(f"{'rows':>9} | {'describe + loop':>15} | {'stats.summarize':>15} | {'chunked moments':>15} | max rel. diff")
+    for rows in sizes:
+        x = np.arange(rows, dtype=float)
+        Y = rng.normal([23, 45, 1027, 0.1, 50], [2, 10, 1, 0.2, 100], size=(rows, len(TOPICS)))
+        Y += x[:, None] * 1e-6
+        df = pd.DataFrame(Y, columns=TOPICS,
+                          index=pd.Timestamp("2025-01-01") + pd.to_timedelta(x, unit="s"))
+
+        old = best_of(lambda: old_describe_and_trends(df))
+        new = best_of(lambda: summarize(x, Y, TOPICS))
+        C = np.ascontiguousarray(Y.T)
+        merged = best_of(lambda: chunked(x, C))
+
+        # the implementations must agree before the timings mean anything
+        old_summary, old_trends = old_describe_and_trends(df)
+        summary, trends = summarize(x, Y, TOPICS)
+        moments = chunked(x, C)
+        diffs = []
+        for j, t in enumerate(TOPICS):
+            for key in ("mean", "std", "min", "25%", "50%", "75%", "max"):
+                diffs.append(abs(summary[t][key] - old_summary.loc[t, key]) / abs(old_summary.loc[t, key]))
+            diffs.append(abs(trends[t] - old_trends[t]) / abs(old_trends[t]))
+            diffs.append(abs(moments.slope()[j] - old_trends[t]) / abs(old_trends[t]))
+            diffs.append(abs(moments.std()[j] - old_summary.loc[t, "std"]) / old_summary.loc[t, "std"])
+        print(f"{rows:>9} | {old:>12.2f} ms | {new:>12.2f} ms | {merged:>12.2f} ms | {max(diffs):.1e}")
+
+
+if __name__ == '__main__':
+    main()
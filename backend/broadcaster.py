@@ -0,0 +1,80 @@
+import json
+import queue
+import threading
+
+
+class Subscription:
+    """One connected client: a bounded queue of encoded events."""
+
+    def __init__(self, max_queue):
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = False
+
+    def get(self, timeout):
+        """Next encoded event, or None if nothing arrived within ``timeout`` seconds."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class Broadcaster:
+    """Fans events out to every subscriber of ``/api/stream``.
+
+    ``publish`` encodes an event once as a Server-Sent Events frame and
+    puts the same bytes on each subscriber's bounded queue without
+    blocking. A subscriber whose queue is full is too slow to keep up: it
+    is marked ``dropped`` and removed, and its stream tells the browser to
+    reconnect, which starts it again from a fresh snapshot.
+    """
+
+    def __init__(self, max_queue=100, max_subscribers=500):
+        self.max_queue = max_queue
+        self.max_subscribers = max_subscribers
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        # counters
+        self.events_published = 0
+        self.subscribers_dropped = 0
+
+    @staticmethod
+    def encode(event, data):
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode()
+
+    def subscribe(self):
+        """New ``Subscription``, or None when ``max_subscribers`` are already connected."""
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            subscription = Subscription(self.max_queue)
+            self._subscribers.add(subscription)
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def publish(self, event, data):
+        if not self._subscribers:
+            return
+        frame = self.encode(event, data)
+        with self._lock:
+            self.events_published += 1
+            slow = []
+            for subscription in self._subscribers:
+                try:
+                    subscription.queue.put_nowait(frame)
+                except queue.Full:
+                    slow.append(subscription)
+            for subscription in slow:
+                subscription.dropped = True
+                self._subscribers.discard(subscription)
+            self.subscribers_dropped += len(slow)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "subscribers": len(self._subscribers),
+                "events_published": self.events_published,
+                "subscribers_dropped": self.subscribers_dropped,
+            }
@@ -0,0 +1,29 @@
+"""PyTorch definition of the rain classifier trained in suggestion/training.py.
+
+Kept out of models.py so importing the database models does not load torch.
+"""
+from torch import nn
+
+
+# PyTorch model for rain classification
+class RainClassifier(nn.Module):
+    def __init__(self, in_dim, hidden=(32, 16)):
+        super().__init__()
+        layers, width = [], in_dim
+        for size in hidden:
+            layers += [nn.Linear(width, size), nn.ReLU()]
+            width = size
+        # net.0, net.2, ... as in the original fixed 32/16 network
+        self.net = nn.Sequential(*layers, nn.Linear(width, 1))
+    def forward(self, x):
+        return self.net(x).squeeze(-1)
+
+    @classmethod
+    def from_state_dict(cls, state_dict):
+        """A model shaped like ``state_dict`` (any hidden sizes, e.g. from sweep.py) with its weights loaded."""
+        weights = sorted((k for k in state_dict if k.endswith(".weight")),
+                         key=lambda k: int(k.split(".")[1]))
+        shapes = [tuple(state_dict[k].shape) for k in weights]
+        model = cls(in_dim=shapes[0][1], hidden=tuple(out for out, _ in shapes[:-1]))
+        model.load_state_dict(state_dict)
+        return model
@@ -1,4 +1,9 @@
-from models import User, db, SensorData
+from datetime import datetime
+import numpy as np
+from models import User, db, SensorData, SensorReading, ROLLUPS, SENSOR_FIELDS
+from rollups import from_epoch, get_rollup_buckets, pick_rollup
+from partitions import (drop_partitions_before, insert_readings, list_partitions, partition_table,
+                        partitions_between, readings_between)
 
 
 def get_user_by_id(user_id):
@@ -32,8 +37,168 @@ def get_latest_sensor_data():
 def get_sensor_data_by_topic(topic):
     return SensorData.query.filter_by(topic=topic).order_by(SensorData.timestamp.desc()).all()
 
-def get_sensor_data_between(start_time, end_time):
-    return SensorData.query.filter(SensorData.timestamp.between(start_time, end_time)).all()
+def get_sensor_data_between(start_time, end_time, device=None):
+    """Readings between two datetimes, oldest first, read only from the overlapping partitions.
+
+    Returned as detached ``SensorReading`` objects (``.values()``, ``.timestamp``).
+    """
+    readings = readings_between(db.session.connection(), start_time, end_time, device=device)
+    rows = db.session.execute(db.select(readings).order_by(readings.c.timestamp)).mappings()
+    return [SensorReading(**row) for row in rows]
+
+def create_sensor_reading(timestamp=None, **values):
+    reading = SensorReading(timestamp=timestamp or datetime.utcnow(), **values)
+    insert_readings(db.session.connection(), [{"timestamp": reading.timestamp, **values}])
+    db.session.commit()
+    return reading
+
+def get_latest_reading(device=None):
+    # newest partition first; an older month is only read if the newer ones are empty
+    conn = db.session.connection()
+    for month, name in reversed(list_partitions(conn)):
+        table = partition_table(name)
+        query = db.select(table).order_by(table.c.timestamp.desc()).limit(1)
+        if device is not None:
+            query = query.where(table.c.device_id == device)
+        row = conn.execute(query).mappings().first()
+        if row is not None:
+            return SensorReading(**row)
+    return None
+
+def get_latest_values(topics=SENSOR_FIELDS, device=None):
+    """Newest value of every topic in a single query, of one device or of any.
+
+    Topics may be given as ``"temperature"`` or ``"esp32/temperature"``.
+    Returns ``{topic: (value, timestamp)}`` for the topics that have data.
+    """
+    fields = [t.split("/", 1)[-1] for t in topics]
+    fields = [f for f in dict.fromkeys(fields) if f in SENSOR_FIELDS]
+    conn = db.session.connection()
+    latest = {}
+    # newest partition first; older months are only read for topics still missing
+    for month, name in reversed(list_partitions(conn)):
+        missing = [f for f in fields if f not in latest]
+        if not missing:
+            break
+        table = partition_table(name)
+        # each arm walks the timestamp (or device/timestamp) index backwards
+        # to its first non-null value
+        device_filter = [] if device is None else [table.c.device_id == device]
+        arms = [
+            db.select(db.literal(f).label("topic"),
+                      table.c[f].label("value"),
+                      table.c.timestamp.label("timestamp"))
+            .where(table.c[f].isnot(None), *device_filter)
+            .order_by(table.c.timestamp.desc())
+            .limit(1)
+            .subquery()
+            for f in missing
+        ]
+        query = db.union_all(*[db.select(arm) for arm in arms]) if len(arms) > 1 else db.select(arms[0])
+        for topic, value, ts in conn.execute(query):
+            latest[topic] = (value, ts)
+    return latest
+
+# aggregate name accepted by the API -> SQL function
+BUCKET_AGGREGATES = {"mean": db.func.avg, "min": db.func.min, "max": db.func.max}
+
+def get_bucketed_readings(start_time, end_time, resolution, aggs=("mean",), fields=SENSOR_FIELDS,
+                          device=None):
+    """Aggregate readings into fixed time buckets inside SQLite.
+
+    ``resolution`` is the bucket width in seconds. Returns a list of
+    ``(bucket_start, {field: {agg: value}})`` ordered by time, one entry per
+    bucket that has data. Resolutions that are whole minutes or hours are
+    answered from the coarsest matching rollup table instead of raw rows.
+    ``device=None`` aggregates every device together.
+    """
+    if resolution != int(resolution) or resolution < 1:
+        raise ValueError(f"resolution must be a whole number of seconds, got {resolution}")
+    if pick_rollup(resolution):
+        return get_rollup_buckets(db.session, start_time, end_time, resolution, aggs, fields, device)
+    readings = readings_between(db.session.connection(), start_time, end_time, ("timestamp", *fields),
+                                device)
+    # naive timestamps are read as UTC by strftime('%s') and mapped back the same way
+    bucket = (db.cast(db.func.strftime('%s', readings.c.timestamp), db.Integer)
+              // int(resolution)).label("bucket")
+    labels = [(f, a) for f in fields for a in aggs]
+    columns = [BUCKET_AGGREGATES[a](readings.c[f]) for f, a in labels]
+    rows = db.session.execute(
+        db.select(bucket, *columns)
+        .group_by(bucket)
+        .order_by(bucket)
+    ).all()
+    result = []
+    for row in rows:
+        values = {f: {} for f in fields}
+        for (f, a), value in zip(labels, row[1:]):
+            values[f][a] = value
+        result.append((from_epoch(row[0] * int(resolution)), values))
+    return result
+
+def get_reading_means(start_time, end_time, fields=SENSOR_FIELDS, device=None):
+    """``{field: AVG(field)}`` over a time range, computed by SQLite in one indexed scan.
+
+    Fields without any reading in the range are left out.
+    """
+    readings = readings_between(db.session.connection(), start_time, end_time, fields, device)
+    row = db.session.execute(db.select(*[db.func.avg(readings.c[f]) for f in fields])).one()
+    return {f: value for f, value in zip(fields, row) if value is not None}
+
+def get_reading_columns(start_time, end_time, fields=SENSOR_FIELDS, device=None, limit=None):
+    """Readings between two datetimes as column arrays, oldest first.
+
+    Returns ``{"timestamp": datetime64 array, field: float array, ...}``;
+    sensors missing from a message come back as NaN. ``limit`` caps the
+    rows read (the oldest ones are kept).
+    """
+    readings = readings_between(db.session.connection(), start_time, end_time, ("timestamp", *fields),
+                                device)
+    rows = db.session.execute(db.select(readings).order_by(readings.c.timestamp).limit(limit)).all()
+    cols = list(zip(*rows)) if rows else [()] * (len(fields) + 1)
+    result = {"timestamp": np.array(cols[0], dtype="datetime64[us]")}
+    for field, values in zip(fields, cols[1:]):
+        result[field] = np.array(values, dtype=float)
+    return result
+
+
+def iter_reading_chunks(start_time, end_time, fields=SENSOR_FIELDS, chunk_size=50000, device=None):
+    """Stream readings between two datetimes as NumPy column chunks, oldest first.
+
+    Yields ``{"timestamp": float array of epoch seconds, field: float array}``
+    of at most ``chunk_size`` rows each. Rows go straight from the DBAPI
+    cursor into arrays, so memory stays bounded by one chunk regardless of
+    the range. Partitions are read one after another, oldest first, so a
+    chunk never spans two months.
+    """
+    for field in fields:
+        if field not in SENSOR_FIELDS:
+            raise ValueError(f"Unknown sensor field: {field}")
+    columns = ", ".join(fields)
+    device_filter, params = ("", ()) if device is None else (" AND device_id = ?", (device,))
+    conn = db.session.connection()
+    tables = partitions_between(conn, start_time, end_time)
+    # datetimes -> the stored text format, as SQLAlchemy binds them everywhere else
+    timestamp_type = SensorReading.__table__.c.timestamp.type.dialect_impl(conn.dialect)
+    bind = timestamp_type.bind_processor(conn.dialect) or (lambda value: value)
+    cursor = conn.connection.cursor()
+    try:
+        for table in tables:
+            cursor.execute(
+                f"SELECT (julianday(timestamp) - 2440587.5) * 86400.0, {columns} "
+                f"FROM {table.name} WHERE timestamp BETWEEN ? AND ?{device_filter} ORDER BY timestamp",
+                (bind(start_time), bind(end_time), *params))
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                block = np.array(rows, dtype=float)
+                chunk = {"timestamp": block[:, 0]}
+                for i, field in enumerate(fields, start=1):
+                    chunk[field] = block[:, i]
+                yield chunk
+    finally:
+        cursor.close()
 
 
 def delete_user_by_id(user_id):
@@ -58,5 +223,8 @@ def delete_all_users():
 
 def delete_all_sensor_data():
     db.session.query(SensorData).delete()
+    # whole partitions are dropped rather than emptied row by row
+    drop_partitions_before(db.session.connection(), datetime.max)
+    for model in ROLLUPS.values():
+        db.session.query(model).delete()
     db.session.commit()
-
@@ -35,6 +35,8 @@ const char* mqtt_broker = "broker.hivemq.com";
 const int mqtt_port = 1883;
 const char* mqtt_client_id = "ESP32_Weather_Client";
 const char* mqtt_topic = "esp32/output";
+// 1 = publish MessagePack instead of JSON (about 20% smaller); the backend detects either
+#define PAYLOAD_MSGPACK 0
 
 // initialize wifi and mqtt client
 WiFiClient espClient;
@@ -274,10 +276,14 @@ void loop() {
   doc["rain_score"] = rainScore;
   doc["light"] = lightLevel;
   
-  char jsonBuffer[256];
-  serializeJson(doc, jsonBuffer);
+  char payloadBuffer[256];
+#if PAYLOAD_MSGPACK
+  size_t payloadLength = serializeMsgPack(doc, payloadBuffer, sizeof(payloadBuffer));
+#else
+  size_t payloadLength = serializeJson(doc, payloadBuffer, sizeof(payloadBuffer));
+#endif
   
-  if (client.publish(mqtt_topic, jsonBuffer)) {
+  if (client.publish(mqtt_topic, (const uint8_t*)payloadBuffer, payloadLength)) {
     Serial.println("MQTT message sent successfully");
   } else {
     Serial.println("Failed to send MQTT message");
@@ -0,0 +1,128 @@
+"""Conditional GET and response compression for the dashboard endpoints.
+
+The dashboard polls ``/api/data`` and ``/api/historical-data`` every few
+seconds, and while no readings arrive the answer does not change.
+``DataVersion`` remembers the newest stored reading per device (fed from
+the ingest writer's ``on_flush``), so a route can build its ETag and answer
+a matching ``If-None-Match`` with 304 before running any query.
+
+Large bodies are compressed with brotli when the ``brotli`` package is
+installed and the client asks for it, gzip otherwise.
+"""
+import gzip
+import hashlib
+import threading
+import time
+
+from flask import Response
+
+try:
+    import brotli
+except ImportError:  # optional; gzip only
+    brotli = None
+
+# brotli's default (11) is far too slow for per-request use; 4 is about
+# gzip -6 speed with smaller output
+BROTLI_QUALITY = 4
+COMPRESSIBLE_TYPES = ("application/json", "text/plain", "text/html", "text/csv")
+
+
+class DataVersion:
+    """Newest stored reading per device (``device=None`` = any device).
+
+    Each device has ``(latest timestamp, generation)``. The generation is
+    bumped on every flush that touches the device, so a late reading with an
+    older timestamp still changes the tag.
+
+    At most ``max_devices`` devices are tracked. Any other device shares the
+    any-device version, which changes on every flush, so its tags stay correct
+    and only revalidate less often.
+    """
+
+    def __init__(self, max_devices=1000):
+        self._lock = threading.Lock()
+        self._versions = {}
+        self.max_devices = max_devices
+        # differs per process, so tags handed out before a restart never match
+        self.boot = format(time.time_ns(), "x")
+
+    def note(self, rows):
+        """Record rows that were just committed."""
+        with self._lock:
+            touched = {}
+            for row in rows:
+                timestamp = row["timestamp"]
+                for device in (None, row.get("device_id")):
+                    current = touched.get(device)
+                    if current is None or current < timestamp:
+                        touched[device] = timestamp
+            for device, timestamp in touched.items():
+                if device not in self._versions and len(self._versions) > self.max_devices:
+                    continue
+                latest, generation = self._versions.get(device, (None, 0))
+                if latest is None or latest < timestamp:
+                    latest = timestamp
+                self._versions[device] = (latest, generation + 1)
+
+    def get(self, device=None):
+        """``(latest timestamp, generation)``; ``(None, 0)`` before anything was stored."""
+        version = self._versions.get(device)
+        if version is None and len(self._versions) > self.max_devices:
+            # possibly one of the untracked devices
+            return self._versions.get(None, (None, 0))
+        return version or (None, 0)
+
+
+def make_etag(*parts):
+    """Short opaque tag for the values that determine a response."""
+    return hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+
+
+def is_fresh(request, etag):
+    # weak comparison: the same JSON gzip- or brotli-encoded is still the same answer
+    return request.if_none_match.contains_weak(etag)
+
+
+def tag(response, etag):
+    """Attach ``etag`` and ask browsers to revalidate on every poll."""
+    response.set_etag(etag, weak=True)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+def not_modified(etag):
+    return tag(Response(status=304), etag)
+
+
+def negotiate(accept_encodings):
+    """``"br"``, ``"gzip"`` or ``None`` for a request's ``Accept-Encoding``."""
+    if brotli is not None and accept_encodings["br"] > 0:
+        return "br"
+    if accept_encodings["gzip"] > 0:
+        return "gzip"
+    return None
+
+
+def compress(response, accept_encodings, min_size=1024, level=6):
+    """Compress a buffered text/JSON response in place when it is worth it.
+
+    Streams (``/api/stream``), errors and bodies under ``min_size`` bytes are
+    left alone. Returns the encoding used, or ``None``.
+    """
+    if (response.status_code != 200 or response.is_streamed or response.direct_passthrough
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES):
+        return None
+    data = response.get_data()
+    if len(data) < min_size:
+        return None
+    response.vary.add("Accept-Encoding")
+    encoding = negotiate(accept_encodings)
+    if encoding == "br":
+        response.set_data(brotli.compress(data, quality=BROTLI_QUALITY))
+    elif encoding == "gzip":
+        response.set_data(gzip.compress(data, compresslevel=level, mtime=0))
+    else:
+        return None
+    response.headers["Content-Encoding"] = encoding
+    return encoding
@@ -0,0 +1,258 @@
+import queue
+import threading
+import time
+import atexit
+import zlib
+import logs
+import metrics
+from models import db, DEFAULT_DEVICE
+from rollups import apply_rollups
+from partitions import apply_retention, insert_readings
+
+log = logs.get_logger("ingest")
+# what the old per-message session.add/commit cost, now per batch
+WRITE_SECONDS = metrics.histogram("ingest_write_seconds",
+                                  "Time to insert one batch of readings and fold it into the rollups")
+COMMIT_SECONDS = metrics.histogram("ingest_commit_seconds", "Time to commit one ingest batch")
+BATCH_ROWS = metrics.histogram("ingest_batch_rows", "Readings per ingest batch", buckets=metrics.COUNT_BUCKETS)
+ROWS_WRITTEN = metrics.counter("ingest_rows_written_total", "Readings stored by the ingest writer")
+FLUSH_ERRORS = metrics.counter("ingest_flush_errors_total", "Ingest batches that failed and were discarded")
+DROPPED = metrics.counter("ingest_dropped_total", "Readings dropped because an ingest queue was full")
+
+# how often the writer checks for partitions past the retention window
+RETENTION_CHECK_SECONDS = 3600
+
+
+def write_batch(conn, rows):
+    """Persist decoded SensorReading rows and fold them into the rollups.
+
+    Shared by ``IngestWriter`` and the standalone ingest_service.py; the
+    caller owns the transaction, so raw rows and rollups commit together.
+    """
+    insert_readings(conn, rows)
+    apply_rollups(conn, rows)
+
+
+class IngestWriter:
+    """Background thread that batches decoded sensor rows into bulk inserts.
+
+    ``on_message`` only decodes the payload and hands the rows to ``submit``;
+    the writer thread flushes them with one INSERT/commit once ``batch_size``
+    rows are pending or the oldest pending row is ``max_latency`` seconds old.
+    ``on_flush(rows)`` is called after every successful commit. With
+    ``retention_months`` set, the same thread also drops partitions that
+    fell out of the retention window (see ``partitions.apply_retention``),
+    so the cleanup never competes with ingest for the write lock.
+    """
+
+    def __init__(self, app, batch_size=500, max_latency=1.0, max_queue=10000, on_flush=None,
+                 retention_months=0, name="ingest-writer"):
+        self.app = app
+        self.name = name
+        self.on_flush = on_flush
+        self.retention_months = retention_months
+        self._retention_checked = None
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        # counters
+        self.messages_received = 0
+        self.messages_dropped = 0
+        self.rows_written = 0
+        self.flush_count = 0
+        self.flush_errors = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+        self.partitions_dropped = 0
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+        return self
+
+    def submit(self, rows):
+        """Queue reading rows for the next bulk insert. Never blocks the caller."""
+        if not rows:
+            return True
+        try:
+            self._queue.put_nowait(rows)
+        except queue.Full:
+            with self._lock:
+                self.messages_dropped += 1
+            DROPPED.inc(len(rows))
+            log.sample("ingest_queue_full", writer=self.name, rows=len(rows))
+            return False
+        with self._lock:
+            self.messages_received += 1
+        return True
+
+    def stop(self, timeout=5.0):
+        """Stop the writer thread, flushing everything still queued."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+        # anything submitted after the thread exited
+        self._flush(self._drain([]))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "messages_received": self.messages_received,
+                "messages_dropped": self.messages_dropped,
+                "rows_written": self.rows_written,
+                "flush_count": self.flush_count,
+                "flush_errors": self.flush_errors,
+                "last_flush_seconds": self.last_flush_seconds,
+                "max_flush_seconds": self.max_flush_seconds,
+                "avg_flush_seconds": (self.total_flush_seconds / self.flush_count
+                                      if self.flush_count else 0.0),
+                "partitions_dropped": self.partitions_dropped,
+            }
+
+    def _drain(self, pending):
+        while True:
+            try:
+                pending.extend(self._queue.get_nowait())
+            except queue.Empty:
+                return pending
+
+    def _run(self):
+        pending = []
+        deadline = None
+        while not self._stop.is_set():
+            timeout = 0.1 if deadline is None else max(0.0, min(0.1, deadline - time.monotonic()))
+            try:
+                rows = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                rows = None
+            if rows:
+                if not pending:
+                    deadline = time.monotonic() + self.max_latency
+                pending.extend(rows)
+            if pending and (len(pending) >= self.batch_size or time.monotonic() >= deadline):
+                self._flush(pending)
+                pending = []
+                deadline = None
+            if self.retention_months and (self._retention_checked is None or
+                                          time.monotonic() - self._retention_checked >= RETENTION_CHECK_SECONDS):
+                self._retention_checked = time.monotonic()
+                self.apply_retention()
+        # shutting down: write whatever is left
+        self._flush(self._drain(pending))
+
+    def _flush(self, rows):
+        if not rows:
+            return
+        started = time.perf_counter()
+        with self.app.app_context():
+            try:
+                with WRITE_SECONDS.time():
+                    write_batch(db.session.connection(), rows)
+                with COMMIT_SECONDS.time():
+                    db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                with self._lock:
+                    self.flush_errors += 1
+                FLUSH_ERRORS.inc()
+                log.error("ingest_flush_failed", writer=self.name, rows=len(rows), error=str(e))
+                return
+        elapsed = time.perf_counter() - started
+        BATCH_ROWS.observe(len(rows))
+        ROWS_WRITTEN.inc(len(rows))
+        with self._lock:
+            self.rows_written += len(rows)
+            self.flush_count += 1
+            self.last_flush_seconds = elapsed
+            self.total_flush_seconds += elapsed
+            self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+        if self.on_flush is not None:
+            self.on_flush(rows)
+
+    def apply_retention(self):
+        """Drop partitions older than ``retention_months``; returns their names."""
+        with self.app.app_context():
+            try:
+                dropped = apply_retention(db.session.connection(), self.retention_months)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                log.error("retention_failed", months=self.retention_months, error=str(e))
+                return []
+        with self._lock:
+            self.partitions_dropped += len(dropped)
+        for name in dropped:
+            log.info("retention_dropped_partition", partition=name)
+        return dropped
+
+
+class ShardedIngestWriter:
+    """``IngestWriter`` threads sharded by device.
+
+    Every device always maps to the same shard, and each shard has its own
+    bounded queue. A board flooding the broker fills, and drops from, only
+    its own shard's queue; devices on the other shards keep flowing. The
+    shards share SQLite's single write lock (``busy_timeout`` makes them
+    take turns), and only shard 0 runs the retention check.
+    """
+
+    def __init__(self, app, shards=4, retention_months=0, **kwargs):
+        self.shards = [IngestWriter(app, retention_months=retention_months if i == 0 else 0,
+                                    name=f"ingest-writer-{i}", **kwargs)
+                       for i in range(max(1, shards))]
+
+    @property
+    def retention_months(self):
+        return self.shards[0].retention_months
+
+    @retention_months.setter
+    def retention_months(self, months):
+        self.shards[0].retention_months = months
+
+    def shard_for(self, device):
+        # crc32 rather than hash(): stable across restarts and processes
+        return self.shards[zlib.crc32((device or DEFAULT_DEVICE).encode()) % len(self.shards)]
+
+    def start(self):
+        for shard in self.shards:
+            shard.start()
+        return self
+
+    def submit(self, rows):
+        """Queue rows on their devices' shards. Never blocks the caller."""
+        by_shard = {}
+        for row in rows:
+            by_shard.setdefault(self.shard_for(row.get("device_id")), []).append(row)
+        results = [shard.submit(shard_rows) for shard, shard_rows in by_shard.items()]
+        return all(results)
+
+    def stop(self, timeout=5.0):
+        for shard in self.shards:
+            shard.stop(timeout)
+
+    def stats(self):
+        per_shard = [shard.stats() for shard in self.shards]
+        total = {key: sum(s[key] for s in per_shard)
+                 for key in ("queue_depth", "messages_received", "messages_dropped", "rows_written",
+                             "flush_count", "flush_errors", "partitions_dropped")}
+        flushes = total["flush_count"]
+        total["last_flush_seconds"] = max(s["last_flush_seconds"] for s in per_shard)
+        total["max_flush_seconds"] = max(s["max_flush_seconds"] for s in per_shard)
+        total["avg_flush_seconds"] = (sum(s["avg_flush_seconds"] * s["flush_count"] for s in per_shard) / flushes
+                                      if flushes else 0.0)
+        total["shards"] = per_shard
+        return total
+
+    def apply_retention(self):
+        return self.shards[0].apply_retention()
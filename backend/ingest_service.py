@@ -0,0 +1,399 @@
+"""Standalone asyncio MQTT ingest service.
+
+Runs in its own process so the Flask API never does ingest work. The paho
+client is driven by the asyncio event loop (socket reads and writes are
+loop callbacks), so keepalives keep flowing however slow SQLite is.
+Payloads are decoded on the loop and put on a bounded queue. A single
+writer task batches them and persists each batch with
+``ingest.write_batch`` in a worker thread.
+
+When the queue is full the ``--overflow`` policy decides what gives:
+
+* ``drop_oldest`` (default) - evict the oldest queued reading; the
+  dashboard cares more about fresh data than about a backlog.
+* ``drop_newest`` - discard the incoming reading.
+* ``block`` - lose nothing: stop reading from the broker until the writer
+  has drained the queue to half, leaving the backlog to TCP and the
+  broker.
+
+    python ingest_service.py                          # broker.hivemq.com, esp32/output
+    python ingest_service.py --topics esp32/output,stations/+/output   # plus one topic per station
+    python ingest_service.py --fake --rate 500 --devices 20   # in-process fake publishers, no broker
+    python ingest_service.py --overflow block --max-queue 20000 --stats-interval 10
+
+Run the API with INGEST_IN_PROCESS=0 so it only keeps its live view
+(``/api/data``, ``/api/stream``) from MQTT and leaves storage to this
+service.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import threading
+import time
+from collections import deque
+from datetime import datetime
+import paho.mqtt.client as mqtt
+from sqlalchemy import create_engine
+import logs
+from models import reading_row, device_from_topic
+from payloads import DECODERS, PayloadDecoder, PayloadError, encode, parse_formats
+from ingest import write_batch, RETENTION_CHECK_SECONDS
+from partitions import apply_retention
+from migrations import run_migrations
+
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest", "block")
+
+log = logs.get_logger("ingest_service")
+
+
+class IngestService:
+    """Bounded queue between the message sources and one batching writer task."""
+
+    def __init__(self, engine, max_queue=10000, overflow="drop_oldest", batch_size=500,
+                 max_latency=1.0, retention_months=0, topics=("esp32/output",), payload_formats=None):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {', '.join(OVERFLOW_POLICIES)}")
+        self.engine = engine
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.retention_months = retention_months
+        # subscriptions the device_id is read from
+        self.topics = list(topics)
+        # {subscription: format}; payloads on other topics are sniffed
+        self.decoder = PayloadDecoder(payload_formats)
+        self.queue = deque()
+        # readings that arrived after a "block" pause was requested
+        self._held = []
+        self.resumed = asyncio.Event()
+        self.resumed.set()
+        self.pause_hooks = []   # called with True to pause a source, False to resume it
+        self._has_rows = asyncio.Event()
+        self._stopping = False
+        # counters
+        self.metrics = {
+            "messages_received": 0,
+            "decode_errors": 0,
+            "decode_errors_by_format": {},
+            "messages_dropped": 0,
+            "rows_written": 0,
+            "batches_written": 0,
+            "write_errors": 0,
+            "queue_high_water": 0,
+            "pauses": 0,
+            "last_write_seconds": 0.0,
+            "max_write_seconds": 0.0,
+        }
+
+    # -- producer side, runs on the event loop --------------------------------
+
+    def handle_payload(self, topic, payload, received_at=None):
+        """Decode one MQTT payload and queue it; False if it was rejected or dropped."""
+        self.metrics["messages_received"] += 1
+        device = device_from_topic(topic, self.topics)
+        try:
+            _, data = self.decoder.decode(topic, payload)
+        except PayloadError as e:
+            self.metrics["decode_errors"] += 1
+            errors = self.metrics["decode_errors_by_format"]
+            errors[e.format] = errors.get(e.format, 0) + 1
+            return False
+        row = reading_row(data, received_at or datetime.now(), device) if device is not None else None
+        if row is None:
+            self.metrics["decode_errors"] += 1
+            return False
+        return self.offer(row)
+
+    def offer(self, row):
+        if not self.resumed.is_set():
+            # paused: keep what is still in flight, the sources stop shortly
+            self._held.append(row)
+            return True
+        if len(self.queue) >= self.max_queue:
+            if self.overflow == "drop_newest":
+                self.metrics["messages_dropped"] += 1
+                return False
+            if self.overflow == "drop_oldest":
+                self.queue.popleft()
+                self.metrics["messages_dropped"] += 1
+            else:
+                self._set_paused(True)
+                self._held.append(row)
+                return True
+        self.queue.append(row)
+        self.metrics["queue_high_water"] = max(self.metrics["queue_high_water"], len(self.queue))
+        self._has_rows.set()
+        return True
+
+    def _set_paused(self, paused):
+        if paused == (not self.resumed.is_set()):
+            return
+        if paused:
+            self.metrics["pauses"] += 1
+            self.resumed.clear()
+        else:
+            self.resumed.set()
+        for hook in self.pause_hooks:
+            hook(paused)
+
+    # -- consumer side ---------------------------------------------------------
+
+    def _take_batch(self):
+        batch = []
+        while self.queue and len(batch) < self.batch_size:
+            batch.append(self.queue.popleft())
+        if not self.resumed.is_set() and len(self.queue) <= self.max_queue // 2:
+            self.queue.extend(self._held)
+            self._held = []
+            self._set_paused(False)
+        return batch
+
+    def _write(self, rows):
+        started = time.perf_counter()
+        with self.engine.begin() as conn:
+            write_batch(conn, rows)
+        return time.perf_counter() - started
+
+    async def writer(self):
+        """Flush once ``batch_size`` rows are queued or the oldest has waited ``max_latency``."""
+        loop = asyncio.get_running_loop()
+        retention_checked = None
+        while True:
+            if not self.queue:
+                if self._stopping:
+                    return
+                self._has_rows.clear()
+                await self._has_rows.wait()
+            deadline = loop.time() + self.max_latency
+            while (len(self.queue) < self.batch_size and loop.time() < deadline
+                   and not self._stopping and self.resumed.is_set()):
+                await asyncio.sleep(min(0.05, deadline - loop.time()))
+            batch = self._take_batch()
+            if not batch:
+                continue
+            try:
+                # SQLite work happens off the loop, so the MQTT client keeps running
+                elapsed = await asyncio.to_thread(self._write, batch)
+            except Exception as e:
+                self.metrics["write_errors"] += 1
+                log.error("ingest_flush_failed", rows=len(batch), error=str(e))
+                continue
+            self.metrics["rows_written"] += len(batch)
+            self.metrics["batches_written"] += 1
+            self.metrics["last_write_seconds"] = elapsed
+            self.metrics["max_write_seconds"] = max(self.metrics["max_write_seconds"], elapsed)
+            if self.retention_months and (retention_checked is None
+                                          or loop.time() - retention_checked >= RETENTION_CHECK_SECONDS):
+                retention_checked = loop.time()
+                await asyncio.to_thread(self._apply_retention)
+
+    def _apply_retention(self):
+        with self.engine.begin() as conn:
+            for name in apply_retention(conn, self.retention_months):
+                log.info("retention_dropped_partition", partition=name)
+
+    async def drain(self):
+        """Stop taking new work and wait for the writer to flush everything queued."""
+        self._stopping = True
+        self.queue.extend(self._held)
+        self._held = []
+        self._set_paused(False)
+        self._has_rows.set()
+
+    def stats(self):
+        return dict(self.metrics, queue_depth=len(self.queue) + len(self._held),
+                    paused=not self.resumed.is_set())
+
+
+class MqttSource:
+    """paho client driven by the asyncio loop instead of its own network thread."""
+
+    def __init__(self, service, host, port, client_id=""):
+        self.service = service
+        self.host, self.port = host, port
+        self.loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self.sock = None
+        self._misc = None
+        self.connected = asyncio.Event()
+        self.client = mqtt.Client(client_id=client_id)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_message = lambda client, userdata, msg: service.handle_payload(msg.topic, msg.payload)
+        self.client.on_socket_open = self._on_loop(self._on_socket_open)
+        self.client.on_socket_close = self._on_loop(self._on_socket_close)
+        self.client.on_socket_register_write = self._on_loop(lambda c, u, sock: self.loop.add_writer(sock, c.loop_write))
+        self.client.on_socket_unregister_write = self._on_loop(lambda c, u, sock: self.loop.remove_writer(sock))
+        service.pause_hooks.append(self._pause)
+
+    def _on_loop(self, callback):
+        # reconnect() runs in an executor and fires the socket callbacks from
+        # there; the loop's reader/writer registrations must happen on the loop
+        def call(*args):
+            if threading.get_ident() == self._loop_thread:
+                callback(*args)
+            else:
+                self.loop.call_soon_threadsafe(callback, *args)
+        return call
+
+    def _on_connect(self, client, userdata, flags, rc):
+        client.subscribe([(topic, 0) for topic in self.service.topics])
+        self.connected.set()
+        log.info("mqtt_connected", broker=self.host, port=self.port, topics=self.service.topics)
+
+    def _on_disconnect(self, client, userdata, rc):
+        self.connected.clear()
+        # rc 0 is our own disconnect() on shutdown
+        (log.info if rc == 0 else log.warning)("mqtt_disconnected", broker=self.host, rc=rc)
+
+    def _on_socket_open(self, client, userdata, sock):
+        self.sock = sock
+        if self.service.resumed.is_set():
+            self.loop.add_reader(sock, client.loop_read)
+        self._misc = self.loop.create_task(self._misc_loop())
+
+    def _on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+        self.sock = None
+        if self._misc is not None:
+            self._misc.cancel()
+
+    def _pause(self, paused):
+        # "block" backpressure: unread data stays in the socket, then in the broker
+        if self.sock is None:
+            return
+        if paused:
+            self.loop.remove_reader(self.sock)
+        else:
+            self.loop.add_reader(self.sock, self.client.loop_read)
+
+    async def _misc_loop(self):
+        # keepalive pings and retries; runs even while reads are paused
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
+
+    async def run(self, stop):
+        backoff = 1
+        self.client.connect_async(self.host, self.port, 60)
+        while not stop.is_set():
+            if self.sock is None:
+                try:
+                    # the TCP connect blocks for up to paho's 5 s timeout, so it runs
+                    # off the loop; the socket callbacks come back through _on_loop
+                    await self.loop.run_in_executor(None, self.client.reconnect)
+                    backoff = 1
+                except OSError as e:
+                    log.warning("mqtt_connect_failed", broker=self.host, port=self.port, error=str(e), retry_in=backoff)
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, 60)
+                    continue
+            await asyncio.sleep(1)
+        self.client.disconnect()
+
+
+class FakeSource:
+    """In-process broker stand-in publishing ESP32-like payloads at ``rate`` msg/s.
+
+    Messages rotate over ``devices`` topics ``stations/fake-NN/output`` and
+    are encoded as ``payload_format`` (see ``payloads.py``).
+    """
+
+    def __init__(self, service, rate=100.0, devices=1, seed=0, payload_format="json"):
+        self.service = service
+        self.rate = rate
+        self.payload_format = payload_format
+        self.topics = [f"stations/fake-{i:02d}/output" for i in range(devices)]
+        self.random = random.Random(seed)
+
+    def payload(self):
+        r = self.random
+        return encode({
+            "temperature": round(r.uniform(15, 30), 2), "humidity": round(r.uniform(30, 90), 2),
+            "pressure": round(r.uniform(1000, 1030), 2), "rain_level": r.choice([0, 0, 0, 1, 2]),
+            "rain_score": round(r.random(), 3), "light": round(r.uniform(0, 1000), 1),
+        }, self.payload_format)
+
+    async def run(self, stop):
+        loop = asyncio.get_running_loop()
+        started, sent = loop.time(), 0
+        while not stop.is_set():
+            if not self.service.resumed.is_set():
+                # "block" backpressure: the fake publisher waits, and does not catch up afterwards
+                await self.service.resumed.wait()
+                started, sent = loop.time(), 0
+            for _ in range(int((loop.time() - started) * self.rate) - sent):
+                if not self.service.resumed.is_set():
+                    break
+                self.service.handle_payload(self.topics[sent % len(self.topics)], self.payload())
+                sent += 1
+            await asyncio.sleep(0.01)
+
+
+async def main(args):
+    engine = create_engine(args.database)
+    run_migrations(engine)
+    topics = args.topics.split(",")
+    if args.fake and "stations/+/output" not in topics:
+        # the fake publishers use per-station topics; no broker, so nothing else can publish there
+        topics.append("stations/+/output")
+    service = IngestService(engine, max_queue=args.max_queue, overflow=args.overflow,
+                            batch_size=args.batch_size, max_latency=args.max_latency,
+                            retention_months=args.retention_months, topics=topics,
+                            payload_formats=parse_formats(args.payload_formats))
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    if args.duration:
+        loop.call_later(args.duration, stop.set)
+
+    source = (FakeSource(service, rate=args.rate, devices=args.devices, payload_format=args.fake_format) if args.fake
+              else MqttSource(service, args.broker, args.port))
+    writer = asyncio.create_task(service.writer())
+    producer = asyncio.create_task(source.run(stop))
+
+    async def report():
+        while True:
+            await asyncio.sleep(args.stats_interval)
+            print(json.dumps(service.stats()))
+
+    reporter = asyncio.create_task(report()) if args.stats_interval else None
+    await stop.wait()
+    await producer
+    await service.drain()
+    await writer
+    if reporter is not None:
+        reporter.cancel()
+    print(json.dumps(service.stats()))
+
+
+def parse_args(argv=None):
+    basedir = os.path.abspath(os.path.dirname(__file__))
+    parser = argparse.ArgumentParser(description="Standalone MQTT ingest service")
+    parser.add_argument("--database", default=os.getenv("DATABASE_URL", "sqlite:///" + os.path.join(basedir, "sensors.db")))
+    parser.add_argument("--broker", default=os.getenv("MQTT_BROKER", "broker.hivemq.com"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("MQTT_PORT", 1883)))
+    parser.add_argument("--topics", default=os.getenv("MQTT_TOPICS", "esp32/output"),
+                        help="comma-separated subscriptions; '+' matches the device_id")
+    parser.add_argument("--payload-formats", default=os.getenv("MQTT_PAYLOAD_FORMATS", ""),
+                        help='per-subscription formats, e.g. "stations/+/output=msgpack" (default: sniff)')
+    parser.add_argument("--max-queue", type=int, default=int(os.getenv("INGEST_MAX_QUEUE", 10000)))
+    parser.add_argument("--overflow", choices=OVERFLOW_POLICIES, default=os.getenv("INGEST_OVERFLOW", "drop_oldest"))
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("INGEST_BATCH_SIZE", 500)))
+    parser.add_argument("--max-latency", type=float, default=float(os.getenv("INGEST_MAX_LATENCY", 1.0)))
+    parser.add_argument("--retention-months", type=int, default=int(os.getenv("RETENTION_MONTHS", 0)))
+    parser.add_argument("--stats-interval", type=float, default=0, help="print metrics every N seconds")
+    parser.add_argument("--fake", action="store_true", help="generate payloads in-process instead of MQTT")
+    parser.add_argument("--rate", type=float, default=100.0, help="--fake messages per second")
+    parser.add_argument("--devices", type=int, default=1, help="--fake devices to rotate over")
+    parser.add_argument("--fake-format", choices=tuple(DECODERS), default="json", help="--fake payload encoding")
+    parser.add_argument("--duration", type=float, default=0, help="stop after N seconds")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,85 @@
+import threading
+
+
+class LatestCache:
+    """Thread-safe newest value of every topic, kept in process memory.
+
+    ``on_message`` updates it as readings arrive, so ``/api/data`` can answer
+    without touching SQLite. Values are kept per device and for all devices
+    together (``device=None``). Each view is seeded once from the database
+    so the first request after a restart still sees the last stored values.
+
+    At most ``max_devices`` devices get their own view. Readings from any
+    further device still update the all-devices view, and ``lookup`` answers
+    for such a device straight from the database.
+    """
+
+    def __init__(self, max_devices=1000):
+        self._lock = threading.Lock()
+        # device (None = any device) -> {topic: (value, timestamp)}
+        self._values = {None: {}}
+        # timestamp of the newest reading seen, per device
+        self._updated_at = {None: None}
+        self._seeded = set()
+        # caps the per-device views, whether created by readings or by requests
+        self.max_devices = max_devices
+
+    def _has_room(self, device):
+        # the all-devices view is always kept and does not count
+        return device in self._values or len(self._values) <= self.max_devices
+
+    def _merge(self, device, items):
+        values = self._values.setdefault(device, {})
+        for topic, (value, timestamp) in items:
+            current = values.get(topic)
+            if current is None or current[1] <= timestamp:
+                values[topic] = (value, timestamp)
+            updated_at = self._updated_at.get(device)
+            if updated_at is None or updated_at < timestamp:
+                self._updated_at[device] = timestamp
+
+    def update(self, row):
+        """Record a SensorReading row dict (as built by ``models.reading_row``)."""
+        timestamp = row["timestamp"]
+        items = [(topic, (value, timestamp)) for topic, value in row.items()
+                 if topic not in ("timestamp", "device_id", "extra") and value is not None]
+        device = row.get("device_id")
+        with self._lock:
+            self._merge(None, items)
+            if self._has_room(device):
+                self._merge(device, items)
+
+    def seed(self, values, device=None):
+        """Merge ``{topic: (value, timestamp)}`` loaded from the database.
+
+        Returns False, keeping nothing, for a new device past ``max_devices``.
+        """
+        with self._lock:
+            if not self._has_room(device):
+                return False
+            self._merge(device, values.items())
+            self._updated_at.setdefault(device, None)
+            self._seeded.add(device)
+            return True
+
+    def ensure_seeded(self, loader, device=None):
+        """Seed the ``device`` view from ``loader()`` the first time only."""
+        if device not in self._seeded:
+            self.seed(loader(), device)
+
+    def lookup(self, loader, device=None):
+        """``snapshot(device)``, seeded from ``loader()`` on first use.
+
+        A device past ``max_devices`` is answered from ``loader()`` on every call.
+        """
+        if device in self._seeded:
+            return self.snapshot(device)
+        values = loader()
+        if self.seed(values, device):
+            return self.snapshot(device)
+        return dict(values), max((timestamp for _, timestamp in values.values()), default=None)
+
+    def snapshot(self, device=None):
+        """``({topic: (value, timestamp)}, updated_at)`` for one device, or for any."""
+        with self._lock:
+            return dict(self._values.get(device, {})), self._updated_at.get(device)
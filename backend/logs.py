@@ -0,0 +1,120 @@
+"""Structured logging: one JSON object per line on stderr.
+
+    log = logs.get_logger("ingest")
+    log.error("flush_failed", rows=500, error=str(e))
+    log.sample("payload_malformed", topic=msg.topic)   # hot path: 1 in LOG_SAMPLE_EVERY
+
+``sample`` is for events that can fire once per MQTT message. It writes
+the first occurrence and then every ``LOG_SAMPLE_EVERY``-th, each with the
+running ``occurrences`` count, so a misbehaving board cannot flood the log
+while the metrics keep the exact totals.
+"""
+import itertools
+import json
+import logging
+import os
+import re
+import threading
+from datetime import datetime
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE_EVERY = max(1, int(os.getenv("LOG_SAMPLE_EVERY", 100)))
+
+_configured = False
+_configure_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def _configure():
+    global _configured
+    with _configure_lock:
+        if _configured:
+            return
+        root = logging.getLogger("weather")
+        # leave it alone if the host (gunicorn, tests) already set up handlers
+        if not root.handlers:
+            handler = logging.StreamHandler()
+            handler.setFormatter(JsonFormatter())
+            root.addHandler(handler)
+            root.setLevel(LOG_LEVEL)
+            root.propagate = False
+        _configured = True
+
+
+class RedactQuery(logging.Filter):
+    """Masks the values of credential query parameters (``?jwt=...``) in log lines."""
+
+    def __init__(self, names=("jwt",)):
+        super().__init__()
+        self.pattern = re.compile(r"([?&](?:%s)=)[^&\s\"]*" % "|".join(map(re.escape, names)))
+
+    def filter(self, record):
+        message = record.getMessage()
+        redacted = self.pattern.sub(r"\1[redacted]", message)
+        if redacted != message:
+            record.msg, record.args = redacted, ()
+        return True
+
+
+def redact_query(logger_name, names=("jwt",)):
+    """Strip ``names`` query values from what ``logger_name`` (e.g. werkzeug's access log) writes."""
+    logging.getLogger(logger_name).addFilter(RedactQuery(names))
+
+
+class StructuredLogger:
+    def __init__(self, name, sample_every=LOG_SAMPLE_EVERY):
+        _configure()
+        self.logger = logging.getLogger(f"weather.{name}")
+        self.sample_every = sample_every
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def _log(self, level, event, exc_info=False, **fields):
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, event, exc_info=exc_info, extra={"fields": fields})
+
+    def info(self, event, **fields):
+        self._log(logging.INFO, event, **fields)
+
+    def warning(self, event, **fields):
+        self._log(logging.WARNING, event, **fields)
+
+    def error(self, event, exc_info=False, **fields):
+        self._log(logging.ERROR, event, exc_info=exc_info, **fields)
+
+    def sample(self, event, level="warning", **fields):
+        """Log 1 in ``sample_every`` occurrences of ``event`` at ``level`` ("info", "warning", ...)."""
+        counter = self._counts.get(event)
+        if counter is None:
+            with self._lock:
+                counter = self._counts.setdefault(event, itertools.count(1))
+        n = next(counter)
+        if n == 1 or n % self.sample_every == 0:
+            self._log(logging.getLevelName(level.upper()), event, occurrences=n,
+                      sampled=self.sample_every, **fields)
+
+
+_loggers = {}
+_loggers_lock = threading.Lock()
+
+
+def get_logger(name):
+    """The shared logger for ``name``, so sample counts survive repeated lookups."""
+    with _loggers_lock:
+        logger = _loggers.get(name)
+        if logger is None:
+            logger = _loggers[name] = StructuredLogger(name)
+    return logger
@@ -0,0 +1,184 @@
+"""Schema migrations for sensors.db.
+
+Each migration runs once; the last applied version is kept in SQLite's
+``PRAGMA user_version``. ``app.py`` applies pending migrations at startup,
+or run them by hand:
+
+    python migrations.py [path/to/sensors.db] [--drop-legacy]
+"""
+import os
+import sys
+import json
+from datetime import datetime
+from sqlalchemy import create_engine, text
+from models import ROLLUPS, SENSOR_FIELDS, DEFAULT_DEVICE, DEVICE_ID_MAX, SensorReading
+from rollups import rebuild_rollups
+from partitions import list_partitions, next_month, partition_name, partition_table
+
+# keys of one legacy message were stored at most this far apart
+MESSAGE_GAP_SECONDS = 0.5
+
+
+def _parse_ts(value):
+    return value if isinstance(value, datetime) else datetime.fromisoformat(value)
+
+
+def _columns(conn, table):
+    return [row[1] for row in conn.execute(text(f"PRAGMA table_info({table})"))]
+
+
+def _wide_readings(conn, chunk_size=50000):
+    # fold the old one-row-per-key sensor_data table into sensor_reading
+    SensorReading.__table__.create(conn, checkfirst=True)
+    has_legacy = conn.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='sensor_data'")).first()
+    if not has_legacy:
+        return
+    if conn.execute(text("SELECT 1 FROM sensor_reading LIMIT 1")).first():
+        return
+
+    # Rows are regrouped into messages in id order: the ingest path gave every
+    # key of a message the same timestamp, but mqtt_test.py stamped each key
+    # separately, so a message ends when a topic repeats or time jumps.
+    insert = SensorReading.__table__.insert()
+    batch, group, extra, group_ts, last_ts = [], {}, {}, None, None
+
+    def emit():
+        if group or extra:
+            batch.append({"timestamp": group_ts, **group,
+                          "extra": json.dumps(extra) if extra else None})
+
+    result = conn.execute(text("SELECT topic, value, timestamp FROM sensor_data ORDER BY id"))
+    while True:
+        rows = result.fetchmany(chunk_size)
+        if not rows:
+            break
+        for topic, value, ts in rows:
+            if value is None or ts is None:
+                continue
+            ts = _parse_ts(ts)
+            key = topic.split("/", 1)[-1]
+            if (group_ts is None or key in group or key in extra
+                    or (ts - last_ts).total_seconds() > MESSAGE_GAP_SECONDS):
+                emit()
+                group, extra, group_ts = {}, {}, ts
+            if key in SENSOR_FIELDS:
+                group[key] = value
+            else:
+                extra[key] = value
+            last_ts = ts
+        if batch:
+            conn.execute(insert, batch)
+            batch = []
+    emit()
+    if batch:
+        conn.execute(insert, batch)
+
+
+def _latest_value_indexes(conn):
+    # newest-per-topic lookups walk these backwards instead of scanning
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_sensor_reading_timestamp ON sensor_reading (timestamp)"))
+    has_legacy = conn.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='sensor_data'")).first()
+    if has_legacy:
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_sensor_data_topic_timestamp ON sensor_data (topic, timestamp)"))
+
+
+def _rollup_tables(conn):
+    for model in ROLLUPS.values():
+        model.__table__.create(conn, checkfirst=True)
+    # backfill from whatever raw readings already exist
+    rebuild_rollups(conn)
+
+
+def _monthly_partitions(conn):
+    # move sensor_reading into one table per month; sensor_reading stays as the empty template
+    months = conn.execute(text(
+        "SELECT DISTINCT strftime('%Y-%m', timestamp) FROM sensor_reading "
+        "WHERE timestamp IS NOT NULL ORDER BY 1")).scalars().all()
+    for month in months:
+        start = datetime.strptime(month, "%Y-%m")
+        table = partition_table(partition_name(start))
+        table.create(conn, checkfirst=True)
+        # only what sensor_reading had at this version; newer columns take their defaults
+        source = _columns(conn, "sensor_reading")
+        columns = ", ".join(c.name for c in table.columns if c.name != "id" and c.name in source)
+        conn.execute(text(f"INSERT INTO {table.name} ({columns}) SELECT {columns} FROM sensor_reading "
+                          "WHERE timestamp >= :start AND timestamp < :end ORDER BY timestamp"),
+                     {"start": str(start), "end": str(next_month(start))})
+    conn.execute(text("DELETE FROM sensor_reading"))
+    # Rollups created in this same run were built before any partition existed.
+    # Ones from an earlier run (no device_id yet) already hold these rows and
+    # are carried over by _device_ids.
+    if months and "device_id" in _columns(conn, ROLLUPS[60].__tablename__):
+        rebuild_rollups(conn)
+
+
+def _device_ids(conn):
+    # everything stored so far came from the one esp32 board
+    for name in ["sensor_reading"] + [name for month, name in list_partitions(conn)]:
+        if "device_id" not in _columns(conn, name):
+            conn.execute(text(f"ALTER TABLE {name} ADD COLUMN device_id VARCHAR({DEVICE_ID_MAX}) "
+                              f"NOT NULL DEFAULT '{DEFAULT_DEVICE}'"))
+        index = "ix_sensor_reading_device_timestamp" if name == "sensor_reading" else f"ix_{name}_device_timestamp"
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {index} ON {name} (device_id, timestamp)"))
+    # device_id joins the rollups' primary key, which SQLite can only change by
+    # rebuilding the table; copy rather than recompute, hourly rows may outlive raw partitions
+    for model in ROLLUPS.values():
+        table = model.__tablename__
+        if "device_id" in _columns(conn, table):
+            continue
+        conn.execute(text(f"ALTER TABLE {table} RENAME TO {table}_old"))
+        model.__table__.create(conn)
+        columns = ", ".join(c.name for c in model.__table__.columns if c.name != "device_id")
+        conn.execute(text(f"INSERT INTO {table} (device_id, {columns}) "
+                          f"SELECT '{DEFAULT_DEVICE}', {columns} FROM {table}_old"))
+        conn.execute(text(f"DROP TABLE {table}_old"))
+
+
+# (version, description, function taking a Connection)
+MIGRATIONS = [
+    (1, "wide sensor_reading table", _wide_readings),
+    (2, "topic/timestamp indexes", _latest_value_indexes),
+    (3, "1m/1h rollup tables", _rollup_tables),
+    (4, "monthly sensor_reading partitions", _monthly_partitions),
+    (5, "device_id column and per-device indexes", _device_ids),
+]
+
+
+def run_migrations(engine):
+    """Apply every migration newer than the database's user_version."""
+    applied = []
+    with engine.begin() as conn:
+        current = conn.execute(text("PRAGMA user_version")).scalar()
+        for version, description, migrate in MIGRATIONS:
+            if version <= current:
+                continue
+            migrate(conn)
+            conn.execute(text(f"PRAGMA user_version = {version}"))
+            applied.append(description)
+    return applied
+
+
+def drop_legacy_sensor_data(engine):
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS sensor_data"))
+    with engine.connect() as conn:
+        conn.execute(text("VACUUM"))
+
+
+if __name__ == '__main__':
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    basedir = os.path.abspath(os.path.dirname(__file__))
+    path = args[0] if args else os.path.join(basedir, 'sensors.db')
+    engine = create_engine('sqlite:///' + path)
+    for description in run_migrations(engine):
+        print(f"applied: {description}")
+    if "--drop-legacy" in sys.argv:
+        drop_legacy_sensor_data(engine)
+        print("dropped legacy sensor_data table")
+    with engine.connect() as conn:
+        for month, name in list_partitions(conn):
+            print(f"{name} rows: {conn.execute(text(f'SELECT COUNT(*) FROM {name}')).scalar()}")
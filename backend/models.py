@@ -1,7 +1,8 @@
-import torch
-from torch import nn
+import sqlite3
 from flask import Flask, jsonify
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from datetime import datetime
 import json
 
@@ -9,8 +10,32 @@ app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///sensors.db'
 db = SQLAlchemy(app)
 
+# Applied to every new SQLite connection (app, migrations, scripts). WAL lets
+# dashboard reads run while the ingest writer commits; synchronous=NORMAL is
+# safe against app crashes in WAL mode and skips an fsync per commit;
+# busy_timeout makes a second writer wait instead of failing with
+# "database is locked".
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,      # ms
+    "mmap_size": 268435456,    # map up to 256 MiB of the file for reads
+    "cache_size": -16384,      # negative = KiB, so 16 MiB of page cache per connection
+    "temp_store": "MEMORY",
+}
+
+@event.listens_for(Engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+    cursor.close()
+
 # Database model
 class SensorData(db.Model):
+    __table_args__ = (db.Index("ix_sensor_data_topic_timestamp", "topic", "timestamp"),)
     id = db.Column(db.Integer, primary_key=True)
     topic = db.Column(db.String(100))
     value = db.Column(db.Float)
@@ -19,6 +44,108 @@ class SensorData(db.Model):
     def __repr__(self):
         return f"<SensorData {self.topic}: {self.value} @ {self.timestamp}>"
 
+# sensors the ESP32 publishes; each gets its own column in SensorReading
+SENSOR_FIELDS = ("temperature", "humidity", "pressure", "rain_level", "rain_score", "light")
+# device_id of the original board (topic esp32/output) and of readings stored before devices existed
+DEFAULT_DEVICE = "esp32"
+DEVICE_ID_MAX = 64
+
+# One row per MQTT message (replaces one SensorData row per key). Rows are
+# stored in monthly copies of this table (see partitions.py); sensor_reading
+# itself is the template and stays empty.
+class SensorReading(db.Model):
+    __tablename__ = "sensor_reading"
+    __table_args__ = (db.Index("ix_sensor_reading_device_timestamp", "device_id", "timestamp"),)
+    id = db.Column(db.Integer, primary_key=True)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    # server-side default, so inserts written before this column existed still work
+    device_id = db.Column(db.String(DEVICE_ID_MAX), nullable=False, server_default=DEFAULT_DEVICE)
+    temperature = db.Column(db.Float)
+    humidity = db.Column(db.Float)
+    pressure = db.Column(db.Float)
+    rain_level = db.Column(db.Float)
+    rain_score = db.Column(db.Float)
+    light = db.Column(db.Float)
+    # JSON object holding any numeric keys not in SENSOR_FIELDS
+    extra = db.Column(db.Text)
+
+    def values(self):
+        values = {f: getattr(self, f) for f in SENSOR_FIELDS if getattr(self, f) is not None}
+        if self.extra:
+            values.update(json.loads(self.extra))
+        return values
+
+    def __repr__(self):
+        return f"<SensorReading {self.values()} @ {self.timestamp}>"
+
+
+# Per-device, per-topic aggregates of SensorReading over fixed buckets, kept current by ingest
+class RollupMixin:
+    device_id = db.Column(db.String(DEVICE_ID_MAX), primary_key=True)
+    topic = db.Column(db.String(100), primary_key=True)
+    bucket = db.Column(db.Integer, primary_key=True)  # bucket start, epoch seconds
+    count = db.Column(db.Integer, nullable=False)
+    sum = db.Column(db.Float, nullable=False)
+    sum_sq = db.Column(db.Float, nullable=False)
+    min = db.Column(db.Float)
+    max = db.Column(db.Float)
+    first = db.Column(db.Float)
+    last = db.Column(db.Float)
+    first_ts = db.Column(db.Float)  # epoch seconds of the first/last reading
+    last_ts = db.Column(db.Float)
+
+class SensorRollup1m(RollupMixin, db.Model):
+    __tablename__ = "sensor_rollup_1m"
+    # all-device queries filter on topic and bucket only
+    __table_args__ = (db.Index("ix_sensor_rollup_1m_topic_bucket", "topic", "bucket"),)
+
+class SensorRollup1h(RollupMixin, db.Model):
+    __tablename__ = "sensor_rollup_1h"
+    __table_args__ = (db.Index("ix_sensor_rollup_1h_topic_bucket", "topic", "bucket"),)
+
+# bucket width in seconds -> rollup model, finest first
+ROLLUPS = {60: SensorRollup1m, 3600: SensorRollup1h}
+
+
+def device_from_topic(topic, subscriptions=("esp32/output",)):
+    """device_id for a message topic, or None if the topic yields no usable id.
+
+    For a wildcard subscription such as ``stations/+/output`` the id is the
+    level matched by ``+``; for a plain topic (``esp32/output``) it is the
+    first level.
+    """
+    levels = topic.split("/")
+    for pattern in subscriptions:
+        parts = pattern.split("/")
+        if parts[-1] == "#":
+            matched = len(levels) >= len(parts) - 1
+            parts = parts[:-1]
+        else:
+            matched = len(levels) == len(parts)
+        if not matched or any(p not in ("+", level) for p, level in zip(parts, levels)):
+            continue
+        device = levels[parts.index("+")] if "+" in parts else levels[0]
+        return device if 0 < len(device) <= DEVICE_ID_MAX else None
+    return None
+
+
+def reading_row(data, timestamp, device_id=DEFAULT_DEVICE):
+    """Map a decoded ESP32 payload to a SensorReading row dict, or None if it has no numbers."""
+    row = {"timestamp": timestamp, "device_id": device_id}
+    extra = {}
+    for key, value in data.items():
+        # ensure value is numeric type
+        if not isinstance(value, (int, float)):
+            continue
+        if key in SENSOR_FIELDS:
+            row[key] = float(value)
+        else:
+            extra[key] = float(value)
+    if len(row) == 2 and not extra:
+        return None
+    row["extra"] = json.dumps(extra) if extra else None
+    return row
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100))
@@ -28,42 +155,32 @@ class User(db.Model):
     def __repr__(self):
         return f"<User {self.name} ({self.email})>"
 
-# PyTorch model for rain classification
-class RainClassifier(nn.Module):
-    def __init__(self, in_dim):
-        super().__init__()
-        self.net = nn.Sequential(
-            nn.Linear(in_dim, 32),
-            nn.ReLU(),
-            nn.Linear(32, 16),
-            nn.ReLU(),
-            nn.Linear(16, 1)
-        )
-    def forward(self, x):
-        return self.net(x).squeeze(-1)
-
 # expose latest data to frontend
 @app.route('/latest')
 def latest_data():
-    latest = SensorData.query.order_by(SensorData.timestamp.desc()).all()
-    # group by timestamp 
-    latest_data = {}
-    for reading in latest:
-        if reading.timestamp not in latest_data:
-            latest_data[reading.timestamp] = {}
-        latest_data[reading.timestamp][reading.topic.split('/')[-1]] = reading.value
+    from database import get_sensor_data_between
+    latest = reversed(get_sensor_data_between(None, None))
+    # one row already holds every sensor for its timestamp
+    latest_data = {reading.timestamp: reading.values() for reading in latest}
     return jsonify(latest_data)  
 
 def on_message(client, userdata, msg):
-    data = json.loads(msg.payload.decode())
+    from payloads import PayloadError, decode
+    from logs import get_logger
+    try:
+        _, data = decode(msg.payload)
+    except PayloadError as e:
+        get_logger("models").sample("payload_malformed", topic=msg.topic, format=e.format, error=str(e))
+        return
     timestamp = datetime.now()
+    row = reading_row(data, timestamp, device_from_topic(msg.topic) or DEFAULT_DEVICE)
+    if row is None:
+        return
+    from partitions import insert_readings
     with app.app_context():
-        for key, value in data.items():
-            if isinstance(value, (int, float)):
-                sensor = SensorData(topic=f"esp32/{key}", value=float(value), timestamp=timestamp)
-                db.session.add(sensor)
+        insert_readings(db.session.connection(), [row])
         db.session.commit()
-        print(f"Stored sensor data: {data}")
+        get_logger("models").sample("reading_stored", level="info", device=row["device_id"], data=data)
 
 if __name__ == '__main__':
     with app.app_context():
@@ -1,6 +1,7 @@
 import paho.mqtt.client as mqtt
 import json
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime
+import payloads
+from sqlalchemy import create_engine, inspect, select, Column, Index, Integer, String, Float, DateTime, Table, Text
 from sqlalchemy.orm import declarative_base, sessionmaker
 from datetime import datetime
 
@@ -16,11 +17,41 @@ class SensorData(Base):
     value = Column(Float)
     timestamp = Column(DateTime, default=datetime.utcnow)
 
+# one row per message, mirrors models.SensorReading
+SENSOR_FIELDS = ("temperature", "humidity", "pressure", "rain_level", "rain_score", "light")
+
+class SensorReading(Base):
+    __tablename__ = 'sensor_reading'
+    id = Column(Integer, primary_key=True)
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
+    device_id = Column(String(64), nullable=False, server_default="esp32")
+    temperature = Column(Float)
+    humidity = Column(Float)
+    pressure = Column(Float)
+    rain_level = Column(Float)
+    rain_score = Column(Float)
+    light = Column(Float)
+    extra = Column(Text)
+
 # initialize database
 engine = create_engine(DATABASE_URI, echo=False)
 Base.metadata.create_all(engine)
 Session = sessionmaker(bind=engine)
 
+# readings are stored one table per month, mirrors partitions.py
+def partition_table(ts):
+    name = f"sensor_reading_p{ts:%Y%m}"
+    if name not in Base.metadata.tables:
+        Table(name, Base.metadata,
+              *[Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable,
+                       server_default=c.server_default.arg if c.server_default is not None else None)
+                for c in SensorReading.__table__.columns],
+              Index(f"ix_{name}_timestamp", "timestamp"),
+              Index(f"ix_{name}_device_timestamp", "device_id", "timestamp"))
+    table = Base.metadata.tables[name]
+    table.create(engine, checkfirst=True)
+    return table
+
 # mqtt config
 broker = "broker.hivemq.com"
 port = 1883
@@ -35,30 +66,30 @@ def on_connect(client, userdata, flags, rc, properties=None):
 
 def on_message(client, userdata, msg):
     try:
-        # parse json payload
-        data = json.loads(msg.payload.decode())
-        if isinstance(data, dict):
-            session = Session()
-            try:
-                for sensor_type, value in data.items():
-                    if isinstance(value, (int, float)):
-                        new_data = SensorData(
-                            topic=f"esp32/{sensor_type}",
-                            value=value,
-                            timestamp=datetime.utcnow()
-                        )
-                        session.add(new_data)
-                session.commit()
-                print(f"Stored sensor data: {data}")
-            except Exception as e:
-                session.rollback()
-                print(f"Error storing data: {e}")
-            finally:
-                session.close()
-        else:
-            print(f"Received non-dict message: {msg.payload.decode()}")
-    except json.JSONDecodeError:
-        print(f"Received non-JSON message: {msg.payload.decode()}")
+        # JSON, MessagePack, CBOR or packed struct, see payloads.py
+        fmt, data = payloads.decode(msg.payload)
+    except payloads.PayloadError as e:
+        print(f"Received undecodable message: {e}")
+        return
+    session = Session()
+    try:
+        numeric = {k: float(v) for k, v in data.items() if isinstance(v, (int, float))}
+        extra = {k: v for k, v in numeric.items() if k not in SENSOR_FIELDS}
+        timestamp = datetime.utcnow()
+        new_data = dict(
+            timestamp=timestamp,
+            device_id=msg.topic.split("/")[0],
+            extra=json.dumps(extra) if extra else None,
+            **{k: v for k, v in numeric.items() if k in SENSOR_FIELDS}
+        )
+        session.execute(partition_table(timestamp).insert().values(**new_data))
+        session.commit()
+        print(f"Stored sensor data ({fmt}): {data}")
+    except Exception as e:
+        session.rollback()
+        print(f"Error storing data: {e}")
+    finally:
+        session.close()
 
 # create mqtt client
 client = mqtt.Client(client_id=client_id, callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
@@ -91,11 +122,16 @@ engine = create_engine('sqlite:////Users/qinding/weather-monitoring-system/backe
 Session = sessionmaker(bind=engine)
 session = Session()
 
-# query recent data
-recent_data = session.query(SensorData).order_by(SensorData.timestamp.desc()).limit(5).all()
+# query recent data from the newest monthly partition
+partitions = sorted(n for n in inspect(engine).get_table_names() if n.startswith("sensor_reading_p"))
+recent_data = []
+if partitions:
+    newest = Table(partitions[-1], Base.metadata, autoload_with=engine, extend_existing=True)
+    recent_data = session.execute(select(newest).order_by(newest.c.timestamp.desc()).limit(5)).all()
 
 
 for data in recent_data:
-    print(f"Topic: {data.topic}, Value: {data.value}, Time: {data.timestamp}")
+    values = {f: getattr(data, f) for f in SENSOR_FIELDS if getattr(data, f) is not None}
+    print(f"Values: {values}, Extra: {data.extra}, Time: {data.timestamp}")
 
 session.close()
\ No newline at end of file
@@ -0,0 +1,159 @@
+"""Monthly partitions of the sensor readings.
+
+Readings live in one table per calendar month, ``sensor_reading_pYYYYMM``,
+each with the columns of ``models.SensorReading`` (whose own
+``sensor_reading`` table is only the template and stays empty). A
+partition is created the first time a reading for its month is written.
+Range queries read only the partitions overlapping the range, and
+retention drops whole months with ``DROP TABLE`` instead of deleting rows.
+"""
+import re
+import threading
+from datetime import datetime
+from sqlalchemy import Column, Index, MetaData, Table, false, literal, select, text, union_all
+from sqlalchemy.schema import CreateIndex, CreateTable
+from models import SensorReading, ROLLUPS, DEFAULT_DEVICE
+
+PREFIX = "sensor_reading_p"
+_NAME = re.compile(r"^sensor_reading_p(\d{4})(\d{2})$")
+
+# partition tables live outside db.metadata so create_all never touches them
+_metadata = MetaData()
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+def month_start(ts):
+    return datetime(ts.year, ts.month, 1)
+
+
+def next_month(ts):
+    return datetime(ts.year + ts.month // 12, ts.month % 12 + 1, 1)
+
+
+def months_before(ts, months):
+    """Start of the month ``months`` calendar months before the one holding ``ts``."""
+    index = ts.year * 12 + ts.month - 1 - months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(ts):
+    return f"{PREFIX}{ts.year:04d}{ts.month:02d}"
+
+
+def partition_month(name):
+    """Start of the month partition ``name`` holds, or None if it is not a partition."""
+    match = _NAME.match(name)
+    return datetime(int(match[1]), int(match[2]), 1) if match else None
+
+
+def partition_table(name):
+    """``Table`` for partition ``name``, with SensorReading's columns and its indexes."""
+    with _tables_lock:
+        table = _tables.get(name)
+        if table is None:
+            columns = [Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable,
+                              server_default=c.server_default.arg if c.server_default is not None else None)
+                       for c in SensorReading.__table__.columns]
+            table = Table(name, _metadata, *columns,
+                          Index(f"ix_{name}_timestamp", "timestamp"),
+                          # per-device range and newest-value queries
+                          Index(f"ix_{name}_device_timestamp", "device_id", "timestamp"))
+            _tables[name] = table
+        return table
+
+
+def create_partition(conn, table):
+    """CREATE the partition and its indexes unless they exist.
+
+    IF NOT EXISTS rather than ``checkfirst``: writer threads for different
+    devices may create the same new month at the same moment.
+    """
+    conn.execute(CreateTable(table, if_not_exists=True))
+    for index in table.indexes:
+        conn.execute(CreateIndex(index, if_not_exists=True))
+
+
+def list_partitions(conn):
+    """``[(month_start, table_name)]`` of every existing partition, oldest first."""
+    names = conn.execute(text(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'sensor_reading_p%'")).scalars()
+    return sorted((partition_month(name), name) for name in names if partition_month(name))
+
+
+def partitions_between(conn, start_time=None, end_time=None):
+    """Partition tables that can hold readings in [start_time, end_time], oldest first."""
+    return [partition_table(name) for month, name in list_partitions(conn)
+            if (start_time is None or next_month(month) > start_time)
+            and (end_time is None or month <= end_time)]
+
+
+def insert_readings(conn, rows):
+    """Insert SensorReading row dicts, each into the partition of its month.
+
+    ``conn`` is a Connection (``db.session.connection()`` inside a session);
+    missing partitions are created in the same transaction. Rows without a
+    ``device_id`` are stored under ``DEFAULT_DEVICE``.
+    """
+    by_month = {}
+    for row in rows:
+        by_month.setdefault(partition_name(row["timestamp"]), []).append(row)
+    for name, batch in by_month.items():
+        table = partition_table(name)
+        create_partition(conn, table)
+        # executemany needs the same keys in every row
+        keys = [c.name for c in table.columns if c.name != "id"]
+        conn.execute(table.insert(), [{**{k: row.get(k) for k in keys},
+                                       "device_id": row.get("device_id") or DEFAULT_DEVICE}
+                                      for row in batch])
+
+
+def readings_between(conn, start_time=None, end_time=None, columns=None, device=None):
+    """Subquery named ``readings`` over every partition overlapping the range.
+
+    ``columns`` are SensorReading column names (all of them by default).
+    Each UNION ALL arm filters on the range (and ``device``, if given)
+    itself, so SQLite uses that partition's timestamp or device/timestamp
+    index. Both ends are inclusive, like BETWEEN.
+    """
+    names = list(columns or [c.name for c in SensorReading.__table__.columns])
+    arms = []
+    for table in partitions_between(conn, start_time, end_time):
+        arm = select(*[table.c[n] for n in names])
+        if device is not None:
+            arm = arm.where(table.c.device_id == device)
+        if start_time is not None:
+            arm = arm.where(table.c.timestamp >= start_time)
+        if end_time is not None:
+            arm = arm.where(table.c.timestamp <= end_time)
+        arms.append(arm)
+    if not arms:
+        # nothing stored yet: an empty result with the same columns
+        return select(*[literal(None).label(n) for n in names]).where(false()).subquery("readings")
+    return (union_all(*arms) if len(arms) > 1 else arms[0]).subquery("readings")
+
+
+def drop_partitions_before(conn, cutoff):
+    """DROP every partition whose whole month ends on or before ``cutoff``; returns the names."""
+    dropped = []
+    for month, name in list_partitions(conn):
+        if next_month(month) <= cutoff:
+            conn.execute(text(f'DROP TABLE "{name}"'))
+            dropped.append(name)
+    return dropped
+
+
+def apply_retention(conn, months, now=None):
+    """Keep the current month plus ``months`` full months before it; 0 keeps everything.
+
+    Minute rollups age out with the raw rows they summarise; hourly rollups
+    are small and kept so long-range charts still work. Returns the names
+    of the dropped partitions.
+    """
+    if not months:
+        return []
+    cutoff = months_before(now or datetime.now(), months)
+    dropped = drop_partitions_before(conn, cutoff)
+    minute = ROLLUPS[60].__table__
+    conn.execute(minute.delete().where(minute.c.bucket < int((cutoff - datetime(1970, 1, 1)).total_seconds())))
+    return dropped
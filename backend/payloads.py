@@ -0,0 +1,213 @@
+"""MQTT sensor payload formats: JSON, MessagePack, CBOR and a packed struct.
+
+Every format decodes to the flat ``{name: number}`` map that
+``models.reading_row`` turns into a row. The format is configured per
+subscription (``MQTT_PAYLOAD_FORMATS="stations/+/output=msgpack"``) or, by
+default, sniffed from the first byte. The formats cannot be confused for a
+map payload:
+
+    ``{`` or whitespace        JSON object
+    0x80-0x8f, 0xde, 0xdf      MessagePack map
+    0xa0-0xbf, 0xd9            CBOR map (0xd9 starts the self-describe tag)
+    0x01 and 22 bytes total    struct, layout 1 in ``STRUCT_LAYOUTS``
+
+MessagePack and CBOR need the optional ``msgpack`` and ``cbor2`` packages.
+Whatever goes wrong, decoding raises ``PayloadError`` (a ``ValueError``),
+so callers can reject the message and carry on. That includes numbers
+``reading_row`` cannot store: NaN, infinities and ints too large for a
+float (a struct's NaN still means "no reading" and is dropped).
+"""
+import json
+import math
+import struct
+import sys
+
+from paho.mqtt.client import topic_matches_sub
+
+try:
+    import msgpack
+except ImportError:  # optional; msgpack payloads are rejected
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:  # optional; CBOR payloads are rejected
+    cbor2 = None
+
+# version byte -> (layout, field per value after the version byte); little-endian,
+# floats are NaN and rain_level 0xff when a sensor has no reading
+STRUCT_LAYOUTS = {
+    1: (struct.Struct("<BfffBff"), ("temperature", "humidity", "pressure", "rain_level", "rain_score", "light")),
+}
+STRUCT_MISSING_BYTE = 0xff
+# largest int that float() converts without OverflowError
+FLOAT_MAX = int(sys.float_info.max)
+# topic -> format lookups remembered by PayloadDecoder
+MAX_CACHED_TOPICS = 10000
+
+
+class PayloadError(ValueError):
+    """A payload that is not a map of readings in the expected format."""
+
+    def __init__(self, message, format="unknown"):
+        super().__init__(message)
+        self.format = format
+
+
+def _as_map(data, fmt):
+    if not isinstance(data, dict):
+        raise PayloadError(f"{fmt} payload is not a map", fmt)
+    if fmt != "json" and not all(isinstance(key, str) for key in data):
+        raise PayloadError(f"{fmt} payload has non-string keys", fmt)
+    return data
+
+
+def decode_json(payload):
+    try:
+        # str, not bytes: json.loads(bytes) first sniffs the encoding in pure Python
+        data = json.loads(payload.decode())
+    except (ValueError, UnicodeDecodeError) as e:
+        raise PayloadError(f"invalid json: {e}", "json") from None
+    return _as_map(data, "json")
+
+
+def decode_msgpack(payload):
+    if msgpack is None:
+        raise PayloadError("msgpack payloads need the msgpack package", "msgpack")
+    try:
+        data = msgpack.unpackb(payload, raw=False)
+    except Exception as e:  # ExtraData, FormatError, StackError, UnicodeDecodeError...
+        raise PayloadError(f"invalid msgpack: {e}", "msgpack") from None
+    return _as_map(data, "msgpack")
+
+
+def decode_cbor(payload):
+    if cbor2 is None:
+        raise PayloadError("CBOR payloads need the cbor2 package", "cbor")
+    try:
+        data = cbor2.loads(payload)
+    except Exception as e:  # CBORDecodeError, but also errors from tag decoders
+        raise PayloadError(f"invalid cbor: {e}", "cbor") from None
+    return _as_map(data, "cbor")
+
+
+def decode_struct(payload):
+    layout = STRUCT_LAYOUTS.get(payload[0]) if payload else None
+    if layout is None:
+        raise PayloadError("unknown struct layout", "struct")
+    packed, fields = layout
+    if len(payload) != packed.size:
+        raise PayloadError(f"struct layout {payload[0]} is {packed.size} bytes, got {len(payload)}", "struct")
+    data = {}
+    for name, value in zip(fields, packed.unpack(payload)[1:]):
+        if isinstance(value, float):
+            if not math.isnan(value):
+                data[name] = value
+        elif value != STRUCT_MISSING_BYTE:
+            data[name] = value
+    return data
+
+
+DECODERS = {
+    "json": decode_json,
+    "msgpack": decode_msgpack,
+    "cbor": decode_cbor,
+    "struct": decode_struct,
+}
+FORMATS = ("auto",) + tuple(DECODERS)
+
+
+def sniff(payload):
+    """Name of the format a payload is in, from its first byte."""
+    if not payload:
+        raise PayloadError("empty payload")
+    first = payload[0]
+    if first == 0x7b or first in b" \t\r\n":
+        return "json"
+    if 0x80 <= first <= 0x8f or first in (0xde, 0xdf):
+        return "msgpack"
+    if 0xa0 <= first <= 0xbf or first == 0xd9:
+        return "cbor"
+    if first in STRUCT_LAYOUTS:
+        return "struct"
+    raise PayloadError(f"unrecognised payload (first byte 0x{first:02x})")
+
+
+def _check_numbers(data, fmt):
+    # reading_row stores every number as a float: reject the ones that are not one
+    for key, value in data.items():
+        if isinstance(value, float):
+            if not math.isfinite(value):
+                raise PayloadError(f"{key} is not a finite number", fmt)
+        elif isinstance(value, int) and not -FLOAT_MAX <= value <= FLOAT_MAX:
+            raise PayloadError(f"{key} is too large for a float", fmt)
+    return data
+
+
+def decode(payload, fmt="auto"):
+    """``(format, {name: value})`` for one payload; raises ``PayloadError``."""
+    if fmt == "auto":
+        fmt = sniff(payload)
+    return fmt, _check_numbers(DECODERS[fmt](payload), fmt)
+
+
+def available(fmt):
+    """False when the package a format needs is not installed."""
+    return {"msgpack": msgpack, "cbor": cbor2}.get(fmt, True) is not None
+
+
+def encode(data, fmt="json"):
+    """Encode a ``{name: number}`` map, as a station would publish it."""
+    if fmt == "json":
+        return json.dumps(data, separators=(",", ":")).encode()
+    if fmt == "msgpack" and msgpack is not None:
+        # float32, like ArduinoJson's serializeMsgPack for the board's float readings
+        return msgpack.packb(data, use_single_float=True)
+    if fmt == "cbor" and cbor2 is not None:
+        return cbor2.dumps(data)
+    if fmt == "struct":
+        packed, fields = STRUCT_LAYOUTS[1]
+        values = []
+        for name in fields:
+            value = data.get(name)
+            if name == "rain_level":
+                values.append(STRUCT_MISSING_BYTE if value is None else int(value))
+            else:
+                values.append(math.nan if value is None else value)
+        return packed.pack(1, *values)
+    raise ValueError(f"cannot encode {fmt} payloads here")
+
+
+def parse_formats(text):
+    """``"stations/+/output=msgpack,esp32/output=json"`` -> ``{subscription: format}``."""
+    formats = {}
+    for item in (text or "").split(","):
+        if not item.strip():
+            continue
+        subscription, _, fmt = item.rpartition("=")
+        subscription, fmt = subscription.strip(), fmt.strip().lower()
+        if not subscription or fmt not in FORMATS:
+            raise ValueError(f"payload format must look like <topic>=<{'|'.join(FORMATS)}>, got {item!r}")
+        if not available(fmt):
+            raise ValueError(f"{fmt} payloads are configured for {subscription} but the package is not installed")
+        formats[subscription] = fmt
+    return formats
+
+
+class PayloadDecoder:
+    """Decodes each payload in its topic's configured format, sniffing the rest."""
+
+    def __init__(self, formats=None):
+        self.formats = dict(formats or {})
+        self._by_topic = {}
+
+    def format_for(self, topic):
+        fmt = self._by_topic.get(topic)
+        if fmt is None:
+            fmt = next((f for sub, f in self.formats.items() if topic_matches_sub(sub, topic)), "auto")
+            if len(self._by_topic) < MAX_CACHED_TOPICS:
+                self._by_topic[topic] = fmt
+        return fmt
+
+    def decode(self, topic, payload):
+        return decode(payload, self.format_for(topic))
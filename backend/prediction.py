@@ -0,0 +1,270 @@
+"""Rain classifier inference and /api/predict result caching.
+
+Two interchangeable engines score (temperature, humidity, pressure) rows:
+
+* ``TorchRainModel`` - ``RainClassifier`` from rain_classifier.pth plus the
+  pickled StandardScaler, exactly as trained.
+* ``NumpyRainModel`` - the same network exported to rain_classifier.npz by
+  suggestion/export_numpy.py, with the scaler folded into the first layer.
+  It needs neither torch nor scikit-learn.
+
+``load_rain_model`` picks one from the ``RAIN_MODEL_BACKEND`` setting and
+``LazyRainModel`` defers that until the first prediction, so importing the
+app stays cheap. torch, scikit-learn and classifier.py are only imported
+by the torch engine.
+"""
+import hashlib
+import os
+import pickle
+import threading
+import time
+import numpy as np
+import logs
+import metrics
+
+log = logs.get_logger("prediction")
+# the numpy engine folds the scaler into its first layer, so it only reports stage="forward"
+INFERENCE_SECONDS = metrics.histogram("model_inference_seconds",
+                                      "Rain classifier time per call, by engine and stage (scale, forward)",
+                                      ("backend", "stage"))
+INFERENCE_ROWS = metrics.counter("model_inference_rows_total", "Rows scored by the rain classifier", ("backend",))
+
+# model input columns, in training order
+FEATURES = ("temperature", "humidity", "pressure")
+# rows scaled and scored per forward pass; bounds peak memory for huge batches
+DEFAULT_CHUNK_SIZE = 8192
+
+MODEL_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "suggestion"))
+MODEL_PATH = os.path.join(MODEL_DIR, "rain_classifier.pth")
+SCALER_PATH = os.path.join(MODEL_DIR, "scaler.pkl")
+NUMPY_MODEL_PATH = os.path.join(MODEL_DIR, "rain_classifier.npz")
+BACKENDS = ("numpy", "torch")
+
+
+def _check_rows(X):
+    X = np.asarray(X, dtype=np.float64)
+    if X.ndim != 2 or X.shape[1] != len(FEATURES):
+        raise ValueError(f"expected rows of {len(FEATURES)} features ({', '.join(FEATURES)})")
+    return X
+
+
+def predict_proba(model, scaler, X, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Rain probability for every row of ``X`` (n x 3: temperature, humidity, pressure).
+
+    Each chunk of up to ``chunk_size`` rows gets one ``scaler.transform`` and
+    one forward pass of the torch ``model``; shared by ``TorchRainModel`` and
+    suggestion/test_training.py.
+    """
+    import torch
+
+    X = _check_rows(X)
+    probs = np.empty(len(X), dtype=np.float32)
+    scale_seconds = forward_seconds = 0.0
+    with torch.no_grad():
+        for i in range(0, len(X), chunk_size):
+            started = time.perf_counter()
+            scaled = scaler.transform(X[i:i + chunk_size]).astype(np.float32)
+            scaled_at = time.perf_counter()
+            probs[i:i + chunk_size] = torch.sigmoid(model(torch.from_numpy(scaled))).numpy()
+            scale_seconds += scaled_at - started
+            forward_seconds += time.perf_counter() - scaled_at
+    INFERENCE_SECONDS.labels("torch", "scale").observe(scale_seconds)
+    INFERENCE_SECONDS.labels("torch", "forward").observe(forward_seconds)
+    INFERENCE_ROWS.labels("torch").inc(len(X))
+    return probs
+
+
+def source_digest(*paths):
+    """sha256 over the given files; ties an exported .npz to the artifacts it came from."""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def fold_scaler(state_dict, mean, scale):
+    """Linear layers of a ``RainClassifier`` state dict with the scaler folded in.
+
+    ``W @ ((x - mean) / scale) + b == (W / scale) @ x + (b - W @ (mean / scale))``,
+    so scaling costs nothing at inference time. Returns ``[(W, b), ...]`` as
+    float64 arrays, first layer first.
+    """
+    layers = []
+    names = sorted({k.rsplit(".", 1)[0] for k in state_dict if k.endswith(".weight")},
+                   key=lambda name: int(name.rsplit(".", 1)[-1]))
+    for name in names:
+        W = np.asarray(state_dict[name + ".weight"], dtype=np.float64)
+        b = np.asarray(state_dict[name + ".bias"], dtype=np.float64)
+        layers.append((W, b))
+    W, b = layers[0]
+    mean, scale = np.asarray(mean, dtype=np.float64), np.asarray(scale, dtype=np.float64)
+    layers[0] = (W / scale, b - W @ (mean / scale))
+    return layers
+
+
+class NumpyRainModel:
+    """``RainClassifier`` forward pass in NumPy: ReLU between layers, sigmoid on the logit."""
+
+    def __init__(self, layers):
+        # weights stored transposed so a batch is X @ W + b. The first layer
+        # stays float64: with the scaler folded in it subtracts large,
+        # nearly equal terms (pressure ~1013 hPa). Past it float32 is as
+        # exact as the torch model and twice as fast.
+        self.layers = [(np.ascontiguousarray(W.T, dtype=np.float64 if i == 0 else np.float32),
+                        np.asarray(b, dtype=np.float64 if i == 0 else np.float32))
+                       for i, (W, b) in enumerate(layers)]
+
+    @classmethod
+    def load(cls, path=NUMPY_MODEL_PATH):
+        with np.load(path) as data:
+            count = sum(1 for key in data.files if key.startswith("W"))
+            model = cls([(data[f"W{i}"], data[f"b{i}"]) for i in range(count)])
+            model.source = str(data["source"]) if "source" in data.files else None
+        return model
+
+    def save(self, path, source=None):
+        arrays = {}
+        for i, (W, b) in enumerate(self.layers):
+            arrays[f"W{i}"], arrays[f"b{i}"] = W.T, b
+        if source is not None:
+            arrays["source"] = np.array(source)
+        np.savez(path, **arrays)
+
+    def predict_proba(self, X, chunk_size=DEFAULT_CHUNK_SIZE):
+        started = time.perf_counter()
+        X = _check_rows(X)
+        probs = np.empty(len(X), dtype=np.float32)
+        last = len(self.layers) - 1
+        for i in range(0, len(X), chunk_size):
+            h = X[i:i + chunk_size]
+            for j, (W, b) in enumerate(self.layers):
+                h = h @ W
+                h += b
+                if j < last:
+                    np.maximum(h, 0.0, out=h)
+                if j == 0:
+                    h = h.astype(np.float32)
+            # logistic without overflow warnings for very negative logits
+            probs[i:i + chunk_size] = 0.5 * (1.0 + np.tanh(0.5 * h[:, 0]))
+        INFERENCE_SECONDS.labels("numpy", "forward").observe(time.perf_counter() - started)
+        INFERENCE_ROWS.labels("numpy").inc(len(X))
+        return probs
+
+
+class TorchRainModel:
+    """The trained ``RainClassifier`` and ``StandardScaler`` behind the same interface."""
+
+    def __init__(self, model, scaler):
+        self.model = model
+        self.scaler = scaler
+
+    @classmethod
+    def load(cls, model_path=MODEL_PATH, scaler_path=SCALER_PATH):
+        import torch
+        from classifier import RainClassifier
+
+        model = RainClassifier.from_state_dict(torch.load(model_path, map_location="cpu", weights_only=True))
+        if model.net[0].in_features != len(FEATURES):
+            raise ValueError(f"{model_path} takes {model.net[0].in_features} inputs, expected {len(FEATURES)}")
+        model.eval()
+        with open(scaler_path, "rb") as f:
+            scaler = pickle.load(f)
+        return cls(model, scaler)
+
+    def predict_proba(self, X, chunk_size=DEFAULT_CHUNK_SIZE):
+        return predict_proba(self.model, self.scaler, X, chunk_size)
+
+
+def load_rain_model(backend="numpy"):
+    """Inference engine for ``backend`` ("numpy" or "torch")."""
+    if backend == "torch":
+        return TorchRainModel.load()
+    if backend != "numpy":
+        raise ValueError(f"RAIN_MODEL_BACKEND must be one of {', '.join(BACKENDS)}, got {backend!r}")
+    if not os.path.exists(NUMPY_MODEL_PATH):
+        raise FileNotFoundError(f"{NUMPY_MODEL_PATH} is missing; run suggestion/export_numpy.py "
+                                "or set RAIN_MODEL_BACKEND=torch")
+    model = NumpyRainModel.load()
+    if model.source and model.source != source_digest(MODEL_PATH, SCALER_PATH):
+        log.warning("numpy_model_stale", path=NUMPY_MODEL_PATH,
+                    hint="exported from a different rain_classifier.pth/scaler.pkl; re-run suggestion/export_numpy.py")
+    return model
+
+
+class LazyRainModel:
+    """Loads the rain classifier on first use, once, even under concurrent requests."""
+
+    def __init__(self, backend="numpy"):
+        if backend not in BACKENDS:
+            raise ValueError(f"RAIN_MODEL_BACKEND must be one of {', '.join(BACKENDS)}, got {backend!r}")
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._model = None
+        self.load_seconds = None
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    def get(self):
+        model = self._model
+        if model is None:
+            with self._lock:
+                if self._model is None:
+                    started = time.perf_counter()
+                    self._model = load_rain_model(self.backend)
+                    self.load_seconds = time.perf_counter() - started
+                model = self._model
+        return model
+
+    def predict_proba(self, X, chunk_size=DEFAULT_CHUNK_SIZE):
+        return self.get().predict_proba(X, chunk_size)
+
+
+class PredictionCache:
+    """Reuses the last /api/predict result until newer data makes it worth recomputing.
+
+    The ingest writer calls ``invalidate`` after each flush. A dirty result is
+    still served for ``min_interval`` seconds, so a stream of 1 Hz readings
+    does not force a model pass per request; a clean one expires after
+    ``ttl`` seconds because the averaging window keeps sliding. Results are
+    kept per ``key`` (the device, or None for all devices), at most
+    ``max_keys`` of them.
+    """
+
+    def __init__(self, ttl=60.0, min_interval=5.0, max_keys=256):
+        self.ttl = ttl
+        self.min_interval = min_interval
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        # key -> [value, computed_at, dirty]
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate(self):
+        for entry in list(self._entries.values()):
+            entry[2] = True
+
+    def get_or_compute(self, compute, key=None):
+        # the lock is held while computing so concurrent requests share one pass
+        with self._lock:
+            now = time.monotonic()
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is not None:
+                age = now - entry[1]
+                if age < self.ttl and (not entry[2] or age < self.min_interval):
+                    self.hits += 1
+                    return entry[0]
+            self.misses += 1
+            if entry is None:
+                if len(self._entries) >= self.max_keys:
+                    # evict the result computed longest ago
+                    del self._entries[min(self._entries, key=lambda k: self._entries[k][1])]
+                entry = self._entries[key] = [None, now, False]
+            # cleared first so a flush that lands mid-compute marks it dirty again
+            entry[2] = False
+            value = compute()
+            entry[0], entry[1] = value, now
+            return value
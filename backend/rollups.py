@@ -0,0 +1,200 @@
+"""1-minute and 1-hour per-device, per-topic rollups of the sensor readings.
+
+Each rollup row holds count, sum, sum of squares, min, max and the first
+and last value of one topic of one device inside one bucket. Queries
+without a device merge the rows of every device. The ingest writer merges
+every flushed batch into both tables (``apply_rollups``), and
+``rebuild_rollups`` recomputes them from the raw partitions when they drift,
+e.g. after readings were written outside the ingest path.
+"""
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import case, func, select, text
+from sqlalchemy.dialects.sqlite import insert
+from models import ROLLUPS, SENSOR_FIELDS, DEFAULT_DEVICE
+from partitions import next_month, partition_month, partitions_between
+from stats import Moments
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def to_epoch(ts):
+    # naive timestamps are treated as UTC, matching SQLite's strftime('%s')
+    return (ts - EPOCH).total_seconds()
+
+
+def from_epoch(seconds):
+    return EPOCH + timedelta(seconds=seconds)
+
+
+def pick_rollup(resolution):
+    """Coarsest rollup width that evenly divides ``resolution`` seconds, or None."""
+    fitting = [width for width in ROLLUPS if resolution % width == 0]
+    return max(fitting) if fitting else None
+
+
+def _aggregate(readings, width):
+    buckets = {}
+    for row in readings:
+        ts = to_epoch(row["timestamp"])
+        bucket = int(ts // width * width)
+        device = row.get("device_id") or DEFAULT_DEVICE
+        for topic in SENSOR_FIELDS:
+            value = row.get(topic)
+            if value is None:
+                continue
+            agg = buckets.get((device, topic, bucket))
+            if agg is None:
+                buckets[(device, topic, bucket)] = {
+                    "device_id": device, "topic": topic, "bucket": bucket, "count": 1,
+                    "sum": value, "sum_sq": value * value, "min": value, "max": value,
+                    "first": value, "last": value, "first_ts": ts, "last_ts": ts,
+                }
+                continue
+            agg["count"] += 1
+            agg["sum"] += value
+            agg["sum_sq"] += value * value
+            agg["min"] = min(agg["min"], value)
+            agg["max"] = max(agg["max"], value)
+            if ts < agg["first_ts"]:
+                agg["first"], agg["first_ts"] = value, ts
+            if ts >= agg["last_ts"]:
+                agg["last"], agg["last_ts"] = value, ts
+    return list(buckets.values())
+
+
+def apply_rollups(session, readings):
+    """Merge a batch of SensorReading row dicts into every rollup table (``session`` or Connection)."""
+    for width, model in ROLLUPS.items():
+        rows = _aggregate(readings, width)
+        if not rows:
+            continue
+        stmt = insert(model)
+        new = stmt.excluded
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[model.device_id, model.topic, model.bucket],
+            set_={
+                "count": model.count + new.count,
+                "sum": model.sum + new.sum,
+                "sum_sq": model.sum_sq + new.sum_sq,
+                "min": func.min(model.min, new.min),
+                "max": func.max(model.max, new.max),
+                "first": case((new.first_ts < model.first_ts, new.first), else_=model.first),
+                "first_ts": func.min(model.first_ts, new.first_ts),
+                "last": case((new.last_ts >= model.last_ts, new.last), else_=model.last),
+                "last_ts": func.max(model.last_ts, new.last_ts),
+            },
+        )
+        session.execute(stmt, rows)
+
+
+def rebuild_rollups(conn, start=None, end=None):
+    """Recompute the rollups for [start, end) (everything by default) from the raw readings.
+
+    The range is widened to whole hours so no bucket is left half rebuilt.
+    Months start on an hour boundary, so every bucket comes from exactly one
+    partition. Each partition's share of the range is deleted and rebuilt
+    with its own INSERT ... SELECT; buckets of months that have no partition
+    (e.g. dropped by retention, whose hourly rollups are kept) are left alone.
+    """
+    start_s = None if start is None else int(to_epoch(start) // 3600 * 3600)
+    end_s = None if end is None else int(-(-to_epoch(end) // 3600) * 3600)
+    tables = partitions_between(conn, None if start_s is None else from_epoch(start_s),
+                                None if end_s is None else from_epoch(end_s))
+    for source in tables:
+        month = partition_month(source.name)
+        month_s, next_s = int(to_epoch(month)), int(to_epoch(next_month(month)))
+        lo = month_s if start_s is None else max(start_s, month_s)
+        hi = next_s if end_s is None else min(end_s, next_s)
+        params = {"start": str(from_epoch(lo)), "end": str(from_epoch(hi))}
+        for width, model in ROLLUPS.items():
+            table = model.__tablename__
+            conn.execute(text(f"DELETE FROM {table} WHERE bucket >= {lo} AND bucket < {hi}"))
+            bucket = f"CAST(strftime('%s', timestamp) AS INTEGER) / {width} * {width}"
+            for field in SENSOR_FIELDS:
+                conn.execute(text(f"""
+                    INSERT INTO {table} (device_id, topic, bucket, count, sum, sum_sq, min, max,
+                                         first, last, first_ts, last_ts)
+                    SELECT device_id, '{field}', bucket, COUNT(v), SUM(v), SUM(v * v), MIN(v), MAX(v),
+                           MIN(fv), MIN(lv), MIN(ts), MAX(ts)
+                    FROM (
+                        SELECT device_id,
+                               {bucket} AS bucket,
+                               {field} AS v,
+                               (julianday(timestamp) - 2440587.5) * 86400.0 AS ts,
+                               FIRST_VALUE({field}) OVER w AS fv,
+                               LAST_VALUE({field}) OVER (w ROWS BETWEEN UNBOUNDED PRECEDING
+                                                           AND UNBOUNDED FOLLOWING) AS lv
+                        FROM {source.name}
+                        WHERE {field} IS NOT NULL AND timestamp >= :start AND timestamp < :end
+                        WINDOW w AS (PARTITION BY device_id, {bucket} ORDER BY timestamp)
+                    )
+                    GROUP BY device_id, bucket
+                """), params)
+
+
+def _device_filter(model, device):
+    return [] if device is None else [model.device_id == device]
+
+
+def get_rollup_buckets(session, start_time, end_time, resolution, aggs, fields, device=None):
+    """Same result as ``database.get_bucketed_readings`` but read from a rollup table.
+
+    ``resolution`` must be a multiple of one of the rollup widths (see
+    ``pick_rollup``). Buckets are whole, so the first one may include
+    readings from just before ``start_time``.
+    """
+    model = ROLLUPS[pick_rollup(resolution)]
+    resolution = int(resolution)
+    start_s = int(to_epoch(start_time) // resolution * resolution)
+    end_s = to_epoch(end_time)
+    bucket = (model.bucket // resolution * resolution).label("b")
+    total = func.sum(model.count)
+    columns = {
+        "mean": func.sum(model.sum) / total,
+        "min": func.min(model.min),
+        "max": func.max(model.max),
+    }
+    rows = session.execute(
+        select(model.topic, bucket, *[columns[a] for a in aggs])
+        .where(model.topic.in_(fields), model.bucket >= start_s, model.bucket <= end_s,
+               *_device_filter(model, device))
+        .group_by(model.topic, bucket)
+    ).all()
+    by_bucket = {}
+    for topic, b, *values in rows:
+        entry = by_bucket.setdefault(b, {f: {a: None for a in aggs} for f in fields})
+        entry[topic] = dict(zip(aggs, values))
+    return [(from_epoch(b), by_bucket[b]) for b in sorted(by_bucket)]
+
+
+def get_rollup_moments(session, start_time, end_time, fields, width, x0=None, device=None):
+    """Mergeable ``stats.Moments`` for ``fields`` built from one rollup table.
+
+    Each bucket counts as sampled at its centre, measured in seconds from
+    ``x0`` (epoch seconds, default: start of the range), for the slope.
+    """
+    model = ROLLUPS[width]
+    start_s = int(to_epoch(start_time) // width * width)
+    rows = session.execute(
+        # one row per bucket and topic, whichever devices reported in it
+        select(model.bucket, model.topic, func.sum(model.count), func.sum(model.sum),
+               func.sum(model.sum_sq), func.min(model.min), func.max(model.max))
+        .where(model.topic.in_(fields), model.bucket >= start_s, model.bucket <= to_epoch(end_time),
+               *_device_filter(model, device))
+        .group_by(model.bucket, model.topic)
+    ).all()
+    if not rows:
+        return Moments.empty(len(fields))
+    buckets = sorted({r[0] for r in rows})
+    index = {b: i for i, b in enumerate(buckets)}
+    column = {f: j for j, f in enumerate(fields)}
+    shape = (len(buckets), len(fields))
+    count, total, total_sq = np.zeros(shape), np.zeros(shape), np.zeros(shape)
+    lo, hi = np.full(shape, np.inf), np.full(shape, -np.inf)
+    for b, topic, n, s, ss, mn, mx in rows:
+        i, j = index[b], column[topic]
+        count[i, j], total[i, j], total_sq[i, j], lo[i, j], hi[i, j] = n, s, ss, mn, mx
+    x0 = start_s if x0 is None else x0
+    centres = np.array(buckets, dtype=float) + width / 2 - x0
+    return Moments.from_sums(count, total, total_sq, lo, hi, centres)
@@ -0,0 +1,229 @@
+"""Vectorised, mergeable summary statistics and trend slopes.
+
+Everything works on a 2-D block of readings plus the matching time axis
+``x`` (seconds), with NaN meaning "topic missing from this reading". The
+fast layout is ``C`` of shape ``(topics, rows)``; ``*_array`` helpers take
+the row-major ``(rows, topics)`` form and transpose it once. ``Moments`` holds the partial result for one block of rows;
+partial results from chunks, threads or rollup buckets merge exactly with
+Chan et al.'s pairwise formulas, so a month can be summarised piece by
+piece and still match a single pass over all rows.
+"""
+import numpy as np
+
+QUARTILES = (0.25, 0.5, 0.75)
+
+
+class Moments:
+    """Count, mean, M2, min, max and the x/y co-moment for each topic."""
+
+    def __init__(self, n, mean, m2, min, max, x_mean, x_m2, c_xy):
+        self.n = n
+        self.mean = mean
+        self.m2 = m2
+        self.min = min
+        self.max = max
+        self.x_mean = x_mean
+        self.x_m2 = x_m2
+        self.c_xy = c_xy
+
+    @classmethod
+    def empty(cls, k):
+        zeros = np.zeros(k)
+        return cls(zeros.copy(), zeros.copy(), zeros.copy(), np.full(k, np.inf),
+                   np.full(k, -np.inf), zeros.copy(), zeros.copy(), zeros.copy())
+
+    @classmethod
+    def from_array(cls, x, Y):
+        """One vectorised pass over ``Y`` (rows x topics) sampled at times ``x``."""
+        return cls.from_columns(x, np.ascontiguousarray(np.asarray(Y, dtype=float).T))
+
+    @classmethod
+    def from_columns(cls, x, C):
+        """Same as ``from_array`` for the transposed layout ``C`` (topics x rows).
+
+        This is the fast path: every reduction walks one contiguous row.
+        """
+        C = np.asarray(C, dtype=float)
+        x = np.asarray(x, dtype=float)
+        k = C.shape[0]
+        if not len(x):
+            return cls.empty(k)
+        mask = ~np.isnan(C)
+        if mask.all():
+            # common case: every message carried every sensor, no masking needed
+            mean = C.mean(axis=1)
+            dy = C - mean[:, None]
+            dx = x - x.mean()
+            return cls(np.full(k, float(len(x))), mean, np.einsum("ij,ij->i", dy, dy),
+                       C.min(axis=1), C.max(axis=1),
+                       np.full(k, x.mean()), np.full(k, dx @ dx), dy @ dx)
+        n = mask.sum(axis=1).astype(float)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(mask, C, 0.0).sum(axis=1) / n
+            x_mean = (mask @ x) / n
+        mean, x_mean = np.nan_to_num(mean), np.nan_to_num(x_mean)
+        dy = np.where(mask, C - mean[:, None], 0.0)
+        dx = np.where(mask, x - x_mean[:, None], 0.0)
+        return cls(
+            n,
+            mean,
+            np.einsum("ij,ij->i", dy, dy),
+            np.where(mask, C, np.inf).min(axis=1),
+            np.where(mask, C, -np.inf).max(axis=1),
+            x_mean,
+            np.einsum("ij,ij->i", dx, dx),
+            np.einsum("ij,ij->i", dx, dy),
+        )
+
+    @classmethod
+    def from_sums(cls, count, total, total_sq, min, max, x=None):
+        """Partials from per-group sums, e.g. rollup rows (groups x topics).
+
+        ``x`` is a representative time per group (such as the bucket
+        centre); the slope then treats each group's readings as sampled
+        at that time. Groups are reduced into a single ``Moments``.
+        """
+        count = np.asarray(count, dtype=float)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(count > 0, np.asarray(total) / count, 0.0)
+        m2 = np.maximum(np.asarray(total_sq) - count * mean * mean, 0.0)
+        x = np.zeros(count.shape[0]) if x is None else np.asarray(x, dtype=float)
+        x_mean = np.broadcast_to(x[:, None], count.shape)
+        zeros = np.zeros_like(count)
+        return cls.reduce(count, mean, m2,
+                          np.where(count > 0, min, np.inf),
+                          np.where(count > 0, max, -np.inf),
+                          x_mean, zeros, zeros)
+
+    @classmethod
+    def reduce(cls, n, mean, m2, min, max, x_mean, x_m2, c_xy):
+        """Merge many partials at once; every argument has shape (groups, topics)."""
+        total = n.sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            grand = np.nan_to_num((n * mean).sum(axis=0) / total)
+            x_grand = np.nan_to_num((n * x_mean).sum(axis=0) / total)
+        dy = mean - grand
+        dx = x_mean - x_grand
+        return cls(
+            total,
+            grand,
+            m2.sum(axis=0) + (n * dy * dy).sum(axis=0),
+            min.min(axis=0),
+            max.max(axis=0),
+            x_grand,
+            x_m2.sum(axis=0) + (n * dx * dx).sum(axis=0),
+            c_xy.sum(axis=0) + (n * dx * dy).sum(axis=0),
+        )
+
+    def merge(self, other):
+        """Combine with another partial over the same topics (Chan et al.)."""
+        n = self.n + other.n
+        with np.errstate(invalid="ignore", divide="ignore"):
+            wa = np.where(n > 0, self.n / n, 0.0)
+            wb = np.where(n > 0, other.n / n, 0.0)
+        dy = other.mean - self.mean
+        dx = other.x_mean - self.x_mean
+        cross = self.n * wb  # na * nb / n
+        return Moments(
+            n,
+            self.mean * wa + other.mean * wb,
+            self.m2 + other.m2 + dy * dy * cross,
+            np.minimum(self.min, other.min),
+            np.maximum(self.max, other.max),
+            self.x_mean * wa + other.x_mean * wb,
+            self.x_m2 + other.x_m2 + dx * dx * cross,
+            self.c_xy + other.c_xy + dx * dy * cross,
+        )
+
+    def std(self, ddof=1):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.n > ddof, np.sqrt(self.m2 / (self.n - ddof)), np.nan)
+
+    def slope(self):
+        """Least-squares slope of value against x, per topic."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.x_m2 > 0, self.c_xy / self.x_m2, np.nan)
+
+
+class QuantileSample:
+    """Bounded reservoir of values per topic (algorithm R) for streaming quantiles.
+
+    Quantiles are exact while a topic has at most ``size`` values and a
+    uniform-sample estimate beyond that.
+    """
+
+    def __init__(self, k, size=100000, seed=0):
+        self.size = size
+        self.rng = np.random.default_rng(seed)
+        self.seen = np.zeros(k, dtype=np.int64)
+        self.values = np.empty((k, size))
+
+    def add(self, C):
+        """Feed a block in the topics x rows layout."""
+        for j, y in enumerate(C):
+            y = y[~np.isnan(y)]
+            if not len(y):
+                continue
+            seen = np.arange(self.seen[j], self.seen[j] + len(y))
+            fill = seen < self.size
+            self.values[j, seen[fill]] = y[fill]
+            if not fill.all():
+                slots = self.rng.integers(0, seen[~fill] + 1)
+                hit = slots < self.size
+                self.values[j, slots[hit]] = y[~fill][hit]
+            self.seen[j] += len(y)
+
+    def quantiles(self, qs=QUARTILES):
+        """Array of shape (len(qs), topics); NaN for topics without values."""
+        out = np.full((len(qs), len(self.seen)), np.nan)
+        for j, seen in enumerate(self.seen):
+            if seen:
+                out[:, j] = np.quantile(self.values[j, :min(seen, self.size)], qs)
+        return out
+
+
+def column_quantiles(C, qs=QUARTILES):
+    """Quantiles of every row of ``C`` (topics x rows), ignoring NaN."""
+    out = np.full((len(qs), C.shape[0]), np.nan)
+    for j, y in enumerate(C):
+        y = y[~np.isnan(y)]
+        if len(y):
+            out[:, j] = np.quantile(y, qs)
+    return out
+
+
+def _number(value):
+    return None if value is None or not np.isfinite(value) else float(value)
+
+
+def describe(names, moments, quantiles=None, qs=QUARTILES):
+    """``(summary, trends)`` dicts keyed by topic, in the shape /api/analyze returns.
+
+    Topics without any readings are left out; statistics that cannot be
+    computed (std of one value, quartiles of rollups) are None.
+    """
+    std = moments.std()
+    slope = moments.slope()
+    summary, trends = {}, {}
+    for j, name in enumerate(names):
+        if not moments.n[j]:
+            continue
+        stats = {
+            "count": int(moments.n[j]),
+            "mean": _number(moments.mean[j]),
+            "std": _number(std[j]),
+            "min": _number(moments.min[j]),
+        }
+        for i, q in enumerate(qs):
+            stats[f"{q * 100:g}%"] = _number(quantiles[i, j]) if quantiles is not None else None
+        stats["max"] = _number(moments.max[j])
+        summary[name] = stats
+        trends[name] = _number(slope[j])
+    return summary, trends
+
+
+def summarize(x, Y, names, qs=QUARTILES):
+    """Single-pass summary of an in-memory block (rows x topics); see ``describe``."""
+    # transpose once; moments and quantiles then both read contiguous rows
+    C = np.ascontiguousarray(np.asarray(Y, dtype=float).T)
+    return describe(names, Moments.from_columns(x, C), column_quantiles(C, qs), qs)
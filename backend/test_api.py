@@ -0,0 +1,124 @@
+"""API checks against a throwaway SQLite database.
+
+    cd backend
+    python -m pytest test_api.py      # or: python test_api.py
+"""
+import os
+import tempfile
+
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db")
+os.environ.setdefault("JWT_SECRET_KEY", "test-secret-" + "x" * 32)
+
+import app as web
+from migrations import run_migrations
+
+with web.app.app_context():
+    web.db.create_all()
+    list(run_migrations(web.db.engine))
+client = web.app.test_client()
+
+
+def test_fractional_resolution_rejected():
+    r = client.get("/api/historical-data?window=1h&resolution=1.5s")
+    assert r.status_code == 400
+    assert "whole number of seconds" in r.get_json()["error"]
+    assert client.get("/api/historical-data?window=1h&resolution=2s").status_code == 200
+
+
+def test_reading_chunks_include_both_bounds():
+    from datetime import datetime
+    from database import create_sensor_reading, get_reading_columns, iter_reading_chunks
+    stamps = [datetime(2024, 6, 1, 12, 0, 0), datetime(2024, 6, 1, 12, 0, 0, 250000), datetime(2024, 6, 1, 12, 0, 1)]
+    with web.app.app_context():
+        for ts in stamps:
+            create_sensor_reading(timestamp=ts, temperature=20.0)
+        # (start, end, readings in [start, end])
+        for start, end, expected in ((stamps[0], stamps[2], 3), (stamps[1], stamps[2], 2), (stamps[0], stamps[1], 2)):
+            streamed = sum(len(c["timestamp"]) for c in iter_reading_chunks(start, end, ("temperature",)))
+            assert streamed == len(get_reading_columns(start, end, ("temperature",))["timestamp"]) == expected
+
+
+def test_prediction_uses_fresh_local_readings():
+    import time
+    from datetime import datetime
+    from database import create_sensor_reading
+    # east of UTC, a UTC "now" ends the window hours before the newest local-time reading
+    previous = os.environ.get("TZ")
+    os.environ["TZ"] = "Australia/Perth"
+    time.tzset()
+    try:
+        with web.app.test_request_context("/api/predict"):
+            create_sensor_reading(timestamp=datetime.now(), device_id="tz-check",
+                                  temperature=31.5, humidity=77.0, pressure=1002.0)
+            features = web.compute_prediction("tz-check")["features_used"]
+        assert features == {"temperature": 31.5, "humidity": 77.0, "pressure": 1002.0}
+    finally:
+        if previous is None:
+            os.environ.pop("TZ")
+        else:
+            os.environ["TZ"] = previous
+        time.tzset()
+
+
+def test_batch_prediction_rejects_non_object_bodies():
+    for body in ([[20.0, 50.0, 1013.0]], "rows", 3):
+        r = client.post("/api/predict/batch", json=body)
+        assert r.status_code == 400
+        assert r.get_json()["error"] == "body must be a JSON object"
+    r = client.post("/api/predict/batch", json={"rows": [[20.0, 50.0, 1013.0]]})
+    assert r.status_code == 200 and r.get_json()["count"] == 1
+
+
+def test_stream_takes_only_short_lived_stream_tokens_in_the_url():
+    from flask_jwt_extended import create_access_token
+    with web.app.app_context():
+        login = create_access_token(identity="test@example.com")
+    # the login token itself is refused in the query string...
+    assert client.get(f"/api/stream?jwt={login}").status_code == 401
+    # ...but buys a stream token, which opens the stream and nothing else
+    r = client.post("/api/stream/token", headers={"Authorization": f"Bearer {login}"})
+    assert r.status_code == 200 and r.get_json()["expires_in"] == web.app.config["STREAM_TOKEN_SECONDS"]
+    token = r.get_json()["token"]
+    stream = client.get(f"/api/stream?jwt={token}")
+    assert stream.status_code == 200
+    stream.close()
+    assert client.get("/api/profile", headers={"Authorization": f"Bearer {token}"}).status_code != 200
+
+
+def test_access_log_redacts_tokens():
+    import logging
+    import logs
+    record = logging.LogRecord("werkzeug", logging.INFO, __file__, 0, '"%s" %s %s',
+                               ("GET /api/stream?device=a&jwt=eyJ.secret.sig HTTP/1.1", 200, "-"), None)
+    logs.RedactQuery().filter(record)
+    assert record.getMessage() == '"GET /api/stream?device=a&jwt=[redacted] HTTP/1.1" 200 -'
+
+
+def test_device_views_stay_bounded():
+    from datetime import datetime, timedelta
+    from http_cache import DataVersion
+    from latest_cache import LatestCache
+    from models import reading_row
+    cache, version = LatestCache(max_devices=5), DataVersion(max_devices=5)
+    start = datetime(2026, 1, 1)
+    for i in range(200):
+        row = reading_row({"temperature": i}, start + timedelta(seconds=i), f"station-{i}")
+        cache.update(row)
+        version.note([row])
+    # five devices plus the all-devices view
+    assert len(cache._values) == len(cache._updated_at) == 6
+    assert len(version._versions) == 6
+    assert cache.snapshot()[0]["temperature"] == (199, start + timedelta(seconds=199))
+    # untracked devices are answered from the loader and share the any-device tag
+    assert cache.lookup(lambda: {"temperature": (7, start)}, "station-150") == ({"temperature": (7, start)}, start)
+    assert len(cache._values) == 6
+    before = version.get("station-150")
+    version.note([reading_row({"temperature": 1}, start, "station-150")])
+    assert version.get("station-150") != before
+
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_"):
+            test()
+            print(f"ok  {name}")
@@ -1,6 +1,14 @@
 import React, {useEffect, useState} from "react";
 import {useNavigate} from "react-router";
 
+// /api/data poll interval while the live stream is down
+const POLL_MS = 5000;
+// wait before asking for a new stream token after the stream dropped, and after a failed request
+const STREAM_RETRY_MS = 5000;
+const STREAM_RETRY_FAILED_MS = 60000;
+// how often "quiet sensor" status is re-evaluated without new data
+const STALE_CHECK_MS = 10000;
+
 const Dashboard = () => {
   const navigate = useNavigate();
   const [email, setEmail] = useState("");
@@ -8,6 +16,7 @@ const Dashboard = () => {
   const [data, setData] = useState(null);
   const [lastUpdated, setLastUpdated] = useState(new Date());
   const [historicalData, setHistoricalData] = useState(null);
+  const [now, setNow] = useState(Date.now());
 
   useEffect(() => {
     const params = new URLSearchParams(window.location.search);
@@ -32,47 +41,115 @@ const Dashboard = () => {
     setLoading(false);
   }, [navigate]);
 
+  // live sensor values pushed by the backend, with /api/data polling while the stream is down
   useEffect(() => {
-    const fetchData = () => {
+    const token = localStorage.getItem("jwt");
+    if (!token) return;
+
+    let source = null;
+    let pollId = null;
+    let retryId = null;
+    let closed = false;
+
+    const show = (sensorData) => {
+      setData(sensorData);
+      // time of the newest reading the backend has seen
+      setLastUpdated(sensorData.updatedAt ? new Date(sensorData.updatedAt) : new Date());
+    };
+    const poll = () => {
       fetch("/api/data")
         .then((res) => res.json())
-        .then((data) => {
-          setData(data);
-          setLastUpdated(new Date());
-        })
-        .catch((err) => console.error("Failed to fetch data:", err));
+        .then(show)
+        .catch((err) => console.error("Failed to fetch sensor data:", err));
+    };
+    const startPolling = () => {
+      if (pollId !== null) return;
+      poll();
+      pollId = setInterval(poll, POLL_MS);
+    };
+    const stopPolling = () => {
+      clearInterval(pollId);
+      pollId = null;
+    };
+    const retry = (delay) => {
+      startPolling();
+      clearTimeout(retryId);
+      retryId = setTimeout(connect, delay);
     };
 
-    // get data
-    fetchData();
-    
-    // get data every 10 seconds
-    const intervalId = setInterval(fetchData, 10000);
-    
-    // clean up
-    return () => clearInterval(intervalId);
+    const connect = async () => {
+      // EventSource cannot send headers, so it takes a short-lived, stream-only token in the URL
+      let streamToken;
+      try {
+        const res = await fetch("/api/stream/token", {
+          method: "POST",
+          headers: {Authorization: `Bearer ${token}`},
+        });
+        if (!res.ok) throw new Error(`stream token request failed (HTTP ${res.status})`);
+        streamToken = (await res.json()).token;
+      } catch (err) {
+        // e.g. the login expired: keep the cards current by polling and try again later
+        console.error("Live stream unavailable, polling /api/data:", err);
+        if (!closed) retry(STREAM_RETRY_FAILED_MS);
+        return;
+      }
+      if (closed) return;
+
+      source = new EventSource(`/api/stream?jwt=${encodeURIComponent(streamToken)}`);
+      const onUpdate = (event) => {
+        stopPolling();
+        show(JSON.parse(event.data).data);
+      };
+      // "snapshot" arrives once per connection, then one "reading" per MQTT message
+      source.addEventListener("snapshot", onUpdate);
+      source.addEventListener("reading", onUpdate);
+      // the browser's own reconnect would reuse the expired stream token, so reconnect with a new one
+      source.onerror = (err) => {
+        console.error("Live stream interrupted, polling until it reconnects:", err);
+        source.close();
+        retry(STREAM_RETRY_MS);
+      };
+    };
+    connect();
+
+    return () => {
+      closed = true;
+      if (source) source.close();
+      stopPolling();
+      clearTimeout(retryId);
+    };
+  }, []);
+
+  // re-check sensor staleness even when no new data arrives
+  useEffect(() => {
+    const id = setInterval(() => setNow(Date.now()), STALE_CHECK_MS);
+    return () => clearInterval(id);
   }, []);
 
   // get historical data
   useEffect(() => {
-    fetch("/api/historical-data")
-      .then((res) => res.json())
-      .then((data) => {
-        setHistoricalData(data);
-      })
-      .catch((err) => console.error("Failed to fetch historical data:", err));
-      
-    // update historical data every second
-    const intervalId = setInterval(() => {
+    const fetchHistory = () => {
       fetch("/api/historical-data")
         .then((res) => res.json())
         .then((data) => {
           setHistoricalData(data);
         })
         .catch((err) => console.error("Failed to fetch historical data:", err));
-    }, 1000);  
-    
-    return () => clearInterval(intervalId);
+    };
+
+    fetchHistory();
+
+    // charts are per-minute buckets, so refresh once a minute, just after each one closes
+    let intervalId;
+    const timeoutId = setTimeout(() => {
+      fetchHistory();
+      intervalId = setInterval(fetchHistory, 60000);
+    }, 60000 - (Date.now() % 60000) + 1000);
+
+    return () => {
+      clearTimeout(timeoutId);
+      clearInterval(intervalId);
+    };
   }, []);
 
   if (loading || !data) {
@@ -207,6 +284,14 @@ const Dashboard = () => {
     }
   }
 
+  // a sensor that hasn't reported for a minute is considered quiet
+  const STALE_AFTER_MS = 60000;
+  const isStale = (key) => {
+    const ts = data.lastUpdated && data.lastUpdated[key];
+    return !ts || now - new Date(ts).getTime() > STALE_AFTER_MS;
+  };
+  const quietSensors = Object.keys(data.lastUpdated || {}).filter(isStale);
+
   // rain level icon mapping
   const getRainLevelIcon = (level) => {
     switch(level) {
@@ -315,7 +400,10 @@ const Dashboard = () => {
 
         {/* Footer / System Status */}
         <footer className="mt-10 text-sm text-center text-gray-500">
-          Last updated: {lastUpdated.toLocaleTimeString()} | System Status: 🟢 Online
+          Last reading: {lastUpdated.toLocaleTimeString()} | System Status:{" "}
+          {quietSensors.length === 0
+            ? "🟢 Online"
+            : `🟠 No recent data from ${quietSensors.join(", ")}`}
         </footer>
       </div>
   );
@@ -0,0 +1,84 @@
+"""Wall time and accuracy of the training loops in training.py.
+
+Trains the same model (same init seed, same split) with the original
+DataLoader loop and with the whole-tensor loop at a few batch sizes. Each
+configuration runs ``--repeat`` times (init seeds 0..repeat-1) and
+reports the median wall time, ms per epoch, epochs run, and the mean
+final validation loss and accuracy, plus the speed-up over the original
+loop. Larger batches take fewer steps per epoch, so they run with early
+stopping and a higher epoch cap; compare their accuracy, not only their
+time.
+
+``--scale N`` repeats the training rows N times (with a little noise) to
+show how the loops behave on more data than the BOM sample.
+
+    python bench_training.py [--repeat 3] [--threads 1] [--scale 1]
+"""
+import statistics
+import sys
+import time
+
+import numpy as np
+import torch
+
+from features import FEATURES, load_features
+from training import RainClassifier, set_threads, split_and_scale, train_fast, train_loader
+
+# (label, loop, keyword arguments)
+CONFIGS = [
+    ('loader  bs=64', train_loader, dict(epochs=20, batch_size=64)),
+    ('fast    bs=64', train_fast, dict(epochs=20, batch_size=64)),
+    ('fast    bs=256 es', train_fast, dict(epochs=200, batch_size=256, lr=3e-3, patience=15)),
+    ('fast    bs=1024 es', train_fast, dict(epochs=400, batch_size=1024, lr=1e-2, patience=25)),
+]
+
+
+def run(loop, data, seed, **kwargs):
+    torch.manual_seed(seed)
+    model = RainClassifier(in_dim=len(FEATURES))
+    if loop is train_fast:
+        kwargs['seed'] = seed
+    started = time.perf_counter()
+    history = loop(model, *data, log=None, **kwargs)
+    elapsed = time.perf_counter() - started
+    if kwargs.get('patience'):
+        # early stopping keeps the best epoch's weights
+        last = min(history, key=lambda h: h[2])
+    else:
+        last = history[-1]
+    return {'seconds': elapsed, 'epochs': len(history), 'val_loss': last[2], 'val_acc': last[3]}
+
+
+def main():
+    repeat, threads, scale = 3, 1, 1
+    if '--repeat' in sys.argv:
+        repeat = int(sys.argv[sys.argv.index('--repeat') + 1])
+    if '--threads' in sys.argv:
+        threads = int(sys.argv[sys.argv.index('--threads') + 1])
+    if '--scale' in sys.argv:
+        scale = int(sys.argv[sys.argv.index('--scale') + 1])
+    set_threads(threads)
+
+    X_train, X_val, y_train, y_val, _ = split_and_scale(load_features())
+    if scale > 1:
+        rng = np.random.default_rng(0)
+        X_train = np.tile(X_train, (scale, 1)) + rng.normal(0, 0.05, (len(X_train) * scale, X_train.shape[1]))
+        y_train = np.tile(y_train, scale)
+    data = (X_train, X_val, y_train, y_val)
+    print(f"{len(y_train)} training rows, {len(y_val)} validation rows, "
+          f"{torch.get_num_threads()} torch threads, {repeat} runs each")
+    print(f"{'config':<18} | {'wall':>8} | {'ms/epoch':>8} | {'epochs':>6} | {'val loss':>8} | {'val acc':>7} | speed-up")
+
+    baseline = None
+    for label, loop, kwargs in CONFIGS:
+        results = [run(loop, data, seed, **kwargs) for seed in range(repeat)]
+        seconds = statistics.median(r['seconds'] for r in results)
+        epochs = statistics.mean(r['epochs'] for r in results)
+        baseline = baseline or seconds
+        print(f"{label:<18} | {seconds:>7.3f}s | {seconds / epochs * 1000:>8.2f} | {epochs:>6.0f} | "
+              f"{statistics.mean(r['val_loss'] for r in results):>8.4f} | "
+              f"{statistics.mean(r['val_acc'] for r in results):>7.3f} | {baseline / seconds:>6.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""Export rain_classifier.pth + scaler.pkl to rain_classifier.npz for the NumPy backend.
+
+The StandardScaler is folded into the first layer, so the backend needs
+neither torch nor scikit-learn at run time. After writing the file the
+exporter scores the feature store's BOM rows plus random rows with both
+engines and fails if the probabilities disagree.
+
+    python export_numpy.py            # run from suggestion/, after training.py
+"""
+import os
+import sys
+import pickle
+import numpy as np
+import torch
+
+from features import load_features
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from prediction import (NumpyRainModel, TorchRainModel, fold_scaler, source_digest,
+                        MODEL_PATH, SCALER_PATH, NUMPY_MODEL_PATH)
+
+# largest |p_numpy - p_torch| accepted (torch runs in float32, NumPy in float64)
+TOLERANCE = 1e-5
+
+
+def export(model_path=MODEL_PATH, scaler_path=SCALER_PATH, out_path=NUMPY_MODEL_PATH):
+    state = torch.load(model_path, map_location='cpu', weights_only=True)
+    with open(scaler_path, 'rb') as f:
+        scaler = pickle.load(f)
+    layers = fold_scaler({k: v.numpy() for k, v in state.items()}, scaler.mean_, scaler.scale_)
+    model = NumpyRainModel(layers)
+    model.save(out_path, source=source_digest(model_path, scaler_path))
+    return model
+
+
+def parity_rows(n_random=100000, seed=0):
+    # real BOM observations plus a wide random box around them
+    rows = []
+    try:
+        X = load_features().X
+        rows.append(X[~np.isnan(X).any(axis=1)])
+    except FileNotFoundError:
+        pass
+    rng = np.random.default_rng(seed)
+    rows.append(rng.uniform([-10, 0, 950], [50, 100, 1060], size=(n_random, 3)))
+    return np.vstack(rows)
+
+
+def check_parity(numpy_model, torch_model, X):
+    diff = np.abs(numpy_model.predict_proba(X) - torch_model.predict_proba(X))
+    return float(diff.max())
+
+
+if __name__ == '__main__':
+    numpy_model = export()
+    print(f"Wrote {NUMPY_MODEL_PATH} ({os.path.getsize(NUMPY_MODEL_PATH)} bytes)")
+    X = parity_rows()
+    worst = check_parity(numpy_model, TorchRainModel.load(), X)
+    print(f"Parity over {len(X)} rows: max |p_numpy - p_torch| = {worst:.2e}")
+    if worst > TOLERANCE:
+        sys.exit(f"NumPy export disagrees with the torch model (tolerance {TOLERANCE:g})")
@@ -0,0 +1,145 @@
+"""Feature store for the rain classifier scripts.
+
+The preprocessed BOM table has one row per day with 9am and 3pm columns.
+``build_long`` turns it into one row per observation, ``(date, time,
+air_temp, rel_hum, press, rain)``, with each day's 9am before its 3pm and
+``rain`` set when it rained that day. ``load_features`` saves that once as
+``.npy`` files in ``monthly_data/.features/`` and then memory-maps them.
+The store is rebuilt when the preprocessed table changes: its SHA-256 is
+checked when its size or mtime moves.
+
+    from features import load_features
+    f = load_features()
+    f.X          # (n, 3) float64 memmap: air_temp, rel_hum, press
+    f.rain       # (n,) int8
+    f.date       # (n,) datetime64[D]
+    f.time       # (n,) '9am' / '3pm'
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from preprocess_BOM_data import DATA_DIR, file_digest, preprocessed_path, read_preprocessed
+
+FEATURES = ('air_temp', 'rel_hum', 'press')
+STORE_DIR = os.path.join(DATA_DIR, '.features')
+META_PATH = os.path.join(STORE_DIR, 'meta.json')
+# bump when build_long changes, so stores built by older code are rebuilt
+STORE_VERSION = 1
+ARRAYS = ('X', 'rain', 'date', 'time')
+
+# preprocessed column per (time of day, feature)
+COLUMNS = {
+    '9am': {'air_temp': '9am Temperature (°C)',
+            'rel_hum': '9am relative humidity (%)',
+            'press': '9am MSL pressure (hPa)'},
+    '3pm': {'air_temp': '3pm Temperature (°C)',
+            'rel_hum': '3pm relative humidity (%)',
+            'press': '3pm MSL pressure (hPa)'},
+}
+
+
+def build_long(df):
+    """One row per observation from the per-day preprocessed table."""
+    df = df.assign(date=pd.to_datetime(df['timestamp']).dt.normalize())
+    morning = df[['date', 'rain_next', *COLUMNS['9am'].values()]]
+    afternoon = df[['date', *COLUMNS['3pm'].values()]]
+    wide = pd.merge(morning, afternoon, on='date', how='inner')
+    # rain_next is "did it rain the next day": move it onto that day, no rain before the first
+    rain = wide['rain_next'].shift(1).fillna(0).to_numpy(dtype=np.int8)
+
+    parts = []
+    for order, (time_of_day, columns) in enumerate(COLUMNS.items()):
+        parts.append(pd.DataFrame({
+            'date': wide['date'], 'time': time_of_day, 'order': order, 'rain': rain,
+            **{name: wide[column] for name, column in columns.items()},
+        }))
+    long_df = pd.concat(parts, ignore_index=True)
+    long_df = long_df.sort_values(['date', 'order'], kind='stable').drop(columns='order')
+    return long_df.reset_index(drop=True)
+
+
+class FeatureSet:
+    """Memory-mapped columns of the long table (see the module docstring)."""
+
+    def __init__(self, X, rain, date, time):
+        self.X, self.rain, self.date, self.time = X, rain, date, time
+
+    def __len__(self):
+        return len(self.rain)
+
+    def to_frame(self):
+        """The columns as a DataFrame, for printing (copies the data)."""
+        return pd.DataFrame({'date': self.date, 'time': self.time,
+                             **{name: self.X[:, i] for i, name in enumerate(FEATURES)},
+                             'rain': self.rain})
+
+
+def _source_key(source):
+    st = os.stat(source)
+    return {'path': os.path.basename(source), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+def _read_meta():
+    try:
+        with open(META_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _is_current(meta, source):
+    if meta is None or meta.get('version') != STORE_VERSION:
+        return False
+    if not all(os.path.exists(os.path.join(STORE_DIR, f'{name}.npy')) for name in ARRAYS):
+        return False
+    key = _source_key(source)
+    if all(meta['source'].get(k) == v for k, v in key.items()):
+        return True
+    # touched but maybe not changed (copy, checkout): compare contents
+    if meta['source'].get('path') == key['path'] and meta['source'].get('sha256') == file_digest(source):
+        meta['source'].update(key)
+        _write_meta(meta)
+        return True
+    return False
+
+
+def _write_meta(meta):
+    with open(META_PATH + '.tmp', 'w') as f:
+        json.dump(meta, f, indent=1)
+    os.replace(META_PATH + '.tmp', META_PATH)
+
+
+def materialize(source=None):
+    """Rebuild the store from the preprocessed table; returns the row count."""
+    source = source or preprocessed_path()
+    long_df = build_long(read_preprocessed(source))
+    arrays = {
+        'X': long_df[list(FEATURES)].to_numpy(dtype=np.float64),
+        'rain': long_df['rain'].to_numpy(dtype=np.int8),
+        'date': long_df['date'].to_numpy(dtype='datetime64[D]'),
+        'time': long_df['time'].to_numpy(dtype='<U3'),
+    }
+    os.makedirs(STORE_DIR, exist_ok=True)
+    # no meta while the arrays are being replaced, so a crash leaves a store that is rebuilt
+    if os.path.exists(META_PATH):
+        os.remove(META_PATH)
+    for name, array in arrays.items():
+        path = os.path.join(STORE_DIR, f'{name}.npy')
+        with open(path + '.tmp', 'wb') as f:
+            np.save(f, np.ascontiguousarray(array))
+        os.replace(path + '.tmp', path)
+    _write_meta({'version': STORE_VERSION, 'rows': len(long_df),
+                 'source': dict(_source_key(source), sha256=file_digest(source))})
+    return len(long_df)
+
+
+def load_features(rebuild=False, mmap_mode='r'):
+    """The feature store, rebuilt first if the preprocessed table changed."""
+    source = preprocessed_path()
+    if rebuild or not _is_current(_read_meta(), source):
+        materialize(source)
+    return FeatureSet(**{name: np.load(os.path.join(STORE_DIR, f'{name}.npy'), mmap_mode=mmap_mode)
+                         for name in ARRAYS})
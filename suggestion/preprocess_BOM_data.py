@@ -1,77 +1,199 @@
-import os
+"""Combine the monthly BOM observation CSVs into one Parquet table.
+
+Each ``IDCJDW6111.YYYYMM.csv`` is parsed with declared dtypes, in a process
+pool, and cached as ``monthly_data/.cache/<name>.parquet``. The cache is
+keyed by the file's SHA-256 (checked only when its size or mtime changed),
+so a re-run parses just the new or edited months. The combined, cleaned
+table goes to ``monthly_data/preprocessed_weather.parquet``.
+
+    python preprocess_BOM_data.py [--workers 4] [--rebuild]
+"""
+import argparse
 import glob
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
 
-# 1. Gather all monthly files
-data_dir = r'.\monthly_data'
-pattern = os.path.join(data_dir, 'IDCJDW6111.*.csv')
-files = sorted(glob.glob(pattern))
-
-dfs = []
-for f in files:
-    # 2. Read, skipping the 8 metadata rows so the header is correct
-    tmp = pd.read_csv(
-        f,
-        sep=',',
-        skiprows=8,
-        encoding='latin-1',
-        low_memory=False
-    )
-    # 3. Drop the first unnamed column if present
-    if tmp.columns[0].startswith('Unnamed'):
-        tmp = tmp.iloc[:, 1:]
-    dfs.append(tmp)
-
-# 4. Concatenate into one frame
-df = pd.concat(dfs, ignore_index=True)
-print(f"Combined DataFrame: {df.shape[0]} rows, {df.shape[1]} cols")
-
-# 5. Parse the Date column into a datetime
-df['timestamp'] = pd.to_datetime(df['Date'], format='%Y-%m-%d', errors='coerce')
-
-# 6. Sort by time
-df = df.sort_values('timestamp').reset_index(drop=True)
-
-# 7. Cast numeric columns
-num_cols = [
+HERE = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(HERE, 'monthly_data')
+CACHE_DIR = os.path.join(DATA_DIR, '.cache')
+MANIFEST_PATH = os.path.join(CACHE_DIR, 'manifest.json')
+OUTPUT_PATH = os.path.join(DATA_DIR, 'preprocessed_weather.parquet')
+# written by earlier versions of this script; still read if the Parquet file is missing
+LEGACY_CSV_PATH = os.path.join(DATA_DIR, 'preprocessed_weather.csv')
+# bump when parse_month changes, so cached months are parsed again
+CACHE_VERSION = 1
+
+# BOM column -> dtype; the files are latin-1, hence the "°"
+FLOAT_COLUMNS = [
     'Minimum temperature (°C)',
     'Maximum temperature (°C)',
     'Rainfall (mm)',
     'Evaporation (mm)',
     'Sunshine (hours)',
-    'Wind gust speed (km/h)',
-    'Wind speed 9am (km/h)',
-    'Wind speed 3pm (km/h)',
-    'Humidity 9am (%)',
-    'Humidity 3pm (%)',
-    'Pressure 9am (hPa)',
-    'Pressure 3pm (hPa)',
+    'Speed of maximum wind gust (km/h)',
+    '9am Temperature (°C)',
+    '9am relative humidity (%)',
+    '9am cloud amount (oktas)',
+    '9am MSL pressure (hPa)',
+    '3pm Temperature (°C)',
+    '3pm relative humidity (%)',
+    '3pm cloud amount (oktas)',
+    '3pm MSL pressure (hPa)',
+]
+# wind speeds are "Calm" on still days, so they stay text like before
+TEXT_COLUMNS = [
+    'Date',
+    'Direction of maximum wind gust ',
+    'Time of maximum wind gust',
+    '9am wind direction',
+    '9am wind speed (km/h)',
+    '3pm wind direction',
+    '3pm wind speed (km/h)',
 ]
-for c in num_cols:
-    if c in df.columns:
-        df[c] = pd.to_numeric(df[c], errors='coerce')
+DTYPES = {**{c: 'float64' for c in FLOAT_COLUMNS}, **{c: str for c in TEXT_COLUMNS}}
+# a row is kept only if all of these are present
+REQUIRED_COLUMNS = [
+    'Minimum temperature (°C)',
+    'Maximum temperature (°C)',
+    'Rainfall (mm)',
+    'Evaporation (mm)',
+    'Sunshine (hours)',
+    'rain_next',
+]
+
+
+def parse_month(path):
+    """One monthly CSV as a DataFrame with a parsed ``timestamp`` column."""
+    options = dict(sep=',', skiprows=8, encoding='latin-1',
+                   # the leading unnamed column is always empty
+                   usecols=lambda c: not c.startswith('Unnamed'))
+    try:
+        df = pd.read_csv(path, dtype=DTYPES, **options)
+    except ValueError:
+        # an unexpected token in a number column; coerce it to NaN like the old loader
+        df = pd.read_csv(path, dtype=str, **options)
+        for c in FLOAT_COLUMNS:
+            if c in df.columns:
+                df[c] = pd.to_numeric(df[c], errors='coerce')
+    df['timestamp'] = pd.to_datetime(df['Date'], format='%Y-%m-%d', errors='coerce')
+    return df
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def cache_path(path, digest):
+    name = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(CACHE_DIR, f'{name}.{digest[:16]}.parquet')
 
-# 8. Define target: did it rain *next* day? (you can adjust shift window)
-if 'Rainfall (mm)' in df.columns:
+
+def _parse_to_cache(path, digest):
+    # runs in a worker process; only the path travels back
+    out = cache_path(path, digest)
+    parse_month(path).to_parquet(out, index=False)
+    return out
+
+
+def load_manifest():
+    try:
+        with open(MANIFEST_PATH) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return manifest if manifest.get('version') == CACHE_VERSION else {}
+
+
+def cached_months(files, workers=None, rebuild=False):
+    """Parquet path per monthly file, parsing only the months not cached yet.
+
+    Returns ``(paths, parsed)``, ``parsed`` being the number of files that
+    had to be parsed this time.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    manifest = {} if rebuild else load_manifest()
+    entries = manifest.get('files', {})
+    paths, todo, new_entries = {}, [], {}
+    for path in files:
+        name = os.path.basename(path)
+        st = os.stat(path)
+        entry = entries.get(name)
+        if entry and (entry['size'], entry['mtime_ns']) == (st.st_size, st.st_mtime_ns):
+            digest = entry['sha256']
+        else:
+            # size or mtime moved (new month, edit, fresh checkout): the hash decides
+            digest = file_digest(path)
+        out = cache_path(path, digest)
+        new_entries[name] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': digest}
+        if entry and entry['sha256'] == digest and os.path.exists(out):
+            paths[path] = out
+        else:
+            todo.append((path, digest))
+
+    if len(todo) > 1 and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            done = pool.map(_parse_to_cache, *zip(*todo))
+            paths.update(zip((p for p, _ in todo), done))
+    else:
+        for path, digest in todo:
+            paths[path] = _parse_to_cache(path, digest)
+
+    # drop parquet files of months that changed or disappeared
+    keep = set(paths.values())
+    for stale in glob.glob(os.path.join(CACHE_DIR, '*.parquet')):
+        if stale not in keep:
+            os.remove(stale)
+    with open(MANIFEST_PATH + '.tmp', 'w') as f:
+        json.dump({'version': CACHE_VERSION, 'files': new_entries}, f, indent=1)
+    os.replace(MANIFEST_PATH + '.tmp', MANIFEST_PATH)
+    return [paths[p] for p in files], len(todo)
+
+
+def combine(month_frames):
+    """Concatenate the months and derive ``rain_next`` (did it rain the next day)."""
+    df = pd.concat(month_frames, ignore_index=True)
+    df = df.sort_values('timestamp', kind='stable').reset_index(drop=True)
     df['rain_next'] = (df['Rainfall (mm)'].shift(-1).fillna(0) > 0).astype(int)
+    return df.dropna(subset=REQUIRED_COLUMNS).reset_index(drop=True)
+
+
+def preprocessed_path(path=OUTPUT_PATH):
+    """The Parquet output if it exists, else the CSV older runs wrote."""
+    return path if os.path.exists(path) else LEGACY_CSV_PATH
+
+
+def read_preprocessed(path=OUTPUT_PATH):
+    """The combined table, from ``preprocessed_path(path)``."""
+    path = preprocessed_path(path)
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    return pd.read_csv(path, parse_dates=['timestamp'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=None, help='parser processes (default: one per CPU)')
+    parser.add_argument('--rebuild', action='store_true', help='ignore the cache and parse every month')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    files = sorted(glob.glob(os.path.join(DATA_DIR, 'IDCJDW6111.*.csv')))
+    paths, parsed = cached_months(files, workers=args.workers, rebuild=args.rebuild)
+    df = combine([pd.read_parquet(p) for p in paths])
+    df.to_parquet(OUTPUT_PATH, index=False)
+    print(f"{len(files)} months ({parsed} parsed, {len(files) - parsed} cached): "
+          f"{df.shape[0]} rows, {df.shape[1]} cols in {time.perf_counter() - started:.2f}s")
+    print(f"Saved preprocessed data to {OUTPUT_PATH}")
+
 
-# 9. Drop rows with missing in any feature or target
-features = [c for c in num_cols if c in df.columns]
-if 'rain_next' in df.columns:
-    features += ['rain_next']
-df_clean = df.dropna(subset=features).reset_index(drop=True)
-
-# 10. One-hot encode the two wind-direction columns
-for col in ['Wind direction 9am', 'Wind direction 3pm']:
-    if col in df_clean.columns:
-        df_clean = pd.get_dummies(
-            df_clean,
-            columns=[col],
-            prefix=col.replace(' ', '_'),
-            dummy_na=True
-        )
-
-# 11. Save
-output = os.path.join(data_dir, 'preprocessed_weather.csv')
-df_clean.to_csv(output, index=False)
-print(f"Saved preprocessed data to {output}")
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""Hyperparameter sweep for the rain classifier.
+
+Trains every combination of the given epoch caps, learning rates, batch
+sizes, hidden sizes and seeds with ``training.train_fast``, one trial per
+task on a process pool. Each worker runs torch on a single thread (a
+3-input MLP gains nothing from more). The parent splits and scales the
+feature store once and writes the arrays as float32 ``.npy`` files in a
+temporary directory. Every worker memory-maps them and trains straight
+from the mapped pages, so the page cache holds the one copy they all
+read.
+
+Every trial's settings, validation loss and accuracy, epochs run and
+wall time go to ``--out`` (CSV, or JSON when the name ends in .json).
+Configurations are ranked by their mean over the seeds. The best seed of
+the best configuration is saved as rain_classifier.pth + scaler.pkl, the
+files the backend loads; re-run export_numpy.py afterwards.
+
+    python sweep.py --hidden 16 32,16 64,32 --lr 1e-3 3e-3 --batch-size 64 256 \\
+                    --epochs 100 --patience 10 --seeds 0 1 2 [--workers 8] [--out sweep.csv]
+"""
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import pickle
+import statistics
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import torch
+
+from features import FEATURES, load_features
+from training import RainClassifier, parse_hidden, set_threads, split_and_scale, train_fast
+
+# lower is better for val_loss, higher for val_acc
+METRICS = {'val_loss': min, 'val_acc': max}
+COLUMNS = ('trial', 'hidden', 'lr', 'batch_size', 'epochs', 'patience', 'seed',
+           'epochs_run', 'best_epoch', 'val_loss', 'val_acc', 'seconds', 'selected')
+
+# the split written by share_split, in train_fast's argument order
+SPLIT = ('X_train', 'X_val', 'y_train', 'y_val')
+
+# memory-mapped split, set in each worker by _init_worker
+_data = None
+
+
+def share_split(arrays, directory):
+    """Write the scaled split as float32 .npy files (the dtype train_fast trains in)."""
+    for name, array in zip(SPLIT, arrays):
+        np.save(os.path.join(directory, f'{name}.npy'), np.asarray(array, dtype=np.float32))
+
+
+def _init_worker(directory):
+    global _data
+    set_threads(1)
+    # copy-on-write maps: torch wraps them without copying, and nothing writes to them
+    _data = tuple(np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='c') for name in SPLIT)
+
+
+def run_trial(trial):
+    """Train one configuration; returns its result row and final weights."""
+    torch.manual_seed(trial['seed'])
+    model = RainClassifier(in_dim=len(FEATURES), hidden=trial['hidden'])
+    started = time.perf_counter()
+    history = train_fast(model, *_data, epochs=trial['epochs'], batch_size=trial['batch_size'],
+                         lr=trial['lr'], patience=trial['patience'], seed=trial['seed'], log=None)
+    seconds = time.perf_counter() - started
+    # with early stopping the model holds the best epoch's weights, so report that epoch
+    epoch, _, val_loss, val_acc = min(history, key=lambda h: h[2]) if trial['patience'] else history[-1]
+    result = dict(trial, epochs_run=len(history), best_epoch=epoch,
+                  val_loss=val_loss, val_acc=val_acc, seconds=seconds)
+    return result, model.state_dict()
+
+
+def make_trials(args):
+    trials = []
+    for hidden, lr, batch_size, epochs, seed in itertools.product(
+            args.hidden, args.lr, args.batch_size, args.epochs, args.seeds):
+        trials.append({'trial': len(trials), 'hidden': hidden, 'lr': lr, 'batch_size': batch_size,
+                       'epochs': epochs, 'patience': args.patience, 'seed': seed})
+    return trials
+
+
+def config_key(result):
+    return result['hidden'], result['lr'], result['batch_size'], result['epochs'], result['patience']
+
+
+def select(results, metric):
+    """Trial id of the best seed in the configuration with the best mean ``metric``."""
+    best = METRICS[metric]
+    by_config = {}
+    for result in results:
+        by_config.setdefault(config_key(result), []).append(result)
+    config = best(by_config.values(), key=lambda rs: statistics.mean(r[metric] for r in rs))
+    return best(config, key=lambda r: r[metric])['trial']
+
+
+def write_results(path, results):
+    rows = [dict(r, hidden='x'.join(map(str, r['hidden'])) or '-') for r in results]
+    if path.endswith('.json'):
+        with open(path, 'w') as f:
+            json.dump(rows, f, indent=1)
+        return
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def default_workers():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Train many rain classifier configurations in parallel')
+    parser.add_argument('--hidden', type=parse_hidden, nargs='+', default=[(32, 16)],
+                        help='hidden layer sizes per configuration, e.g. 16 32,16 64,32')
+    parser.add_argument('--lr', type=float, nargs='+', default=[1e-3])
+    parser.add_argument('--batch-size', type=int, nargs='+', default=[64])
+    parser.add_argument('--epochs', type=int, nargs='+', default=[20], help='epoch caps')
+    parser.add_argument('--patience', type=int, default=0, help='early-stopping patience (0 = off)')
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0])
+    parser.add_argument('--metric', choices=tuple(METRICS), default='val_loss')
+    parser.add_argument('--workers', type=int, default=default_workers())
+    parser.add_argument('--out', default='sweep_results.csv')
+    parser.add_argument('--no-save', action='store_true', help='only write the results file')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    trials = make_trials(args)
+    workers = max(1, min(args.workers, len(trials)))
+    features = load_features()
+    X_train, X_val, y_train, y_val, scaler = split_and_scale(features)
+    print(f"{len(trials)} trials on {workers} workers, {len(features)} rows")
+
+    results, states = [], {}
+    started = time.perf_counter()
+    # spawn: forking a parent that has already used torch's thread pool can hang the children
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory(prefix='sweep-') as directory, \
+            ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                                initargs=(directory,)) as pool:
+        share_split((X_train, X_val, y_train, y_val), directory)
+        # longest trials first, so the pool does not wait on one straggler at the end
+        order = sorted(trials, key=lambda t: t['epochs'] / t['batch_size'], reverse=True)
+        futures = [pool.submit(run_trial, trial) for trial in order]
+        for future in as_completed(futures):
+            result, state = future.result()
+            results.append(result)
+            states[result['trial']] = state
+            print(f"[{len(results):>{len(str(len(trials)))}}/{len(trials)}] trial {result['trial']:<4} "
+                  f"hidden={'x'.join(map(str, result['hidden'])) or '-':<6} lr={result['lr']:<7g} "
+                  f"bs={result['batch_size']:<5} epochs={result['epochs_run']:>4} | "
+                  f"val loss {result['val_loss']:.4f} | val acc {result['val_acc']:.3f} | "
+                  f"{result['seconds']:.2f}s")
+    elapsed = time.perf_counter() - started
+
+    results.sort(key=lambda r: r['trial'])
+    chosen = select(results, args.metric)
+    for result in results:
+        result['selected'] = result['trial'] == chosen
+    write_results(args.out, results)
+    busy = sum(r['seconds'] for r in results)
+    print(f"{len(trials)} trials in {elapsed:.1f}s wall, {busy:.1f}s training "
+          f"({busy / elapsed:.1f}x parallel). Results in {args.out}")
+
+    best = results[chosen]
+    print(f"Best ({args.metric}): trial {chosen}, hidden={best['hidden']} lr={best['lr']:g} "
+          f"bs={best['batch_size']} -> val loss {best['val_loss']:.4f}, val acc {best['val_acc']:.3f}")
+    if not args.no_save:
+        torch.save(states[chosen], 'rain_classifier.pth')
+        with open('scaler.pkl', 'wb') as f:
+            pickle.dump(scaler, f)
+        print("Saved rain_classifier.pth + scaler.pkl; run export_numpy.py for the NumPy backend")
+
+
+if __name__ == '__main__':
+    main()
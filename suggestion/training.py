@@ -1,149 +1,90 @@
-import pandas as pd
+"""Train the rain classifier and save rain_classifier.pth + scaler.pkl.
+
+    python training.py [--mode fast|loader] [--epochs 20] [--batch-size 64] [--lr 1e-3]
+                       [--hidden 32,16] [--patience 0] [--threads 0] [--seed 0]
+
+``fast`` (default) keeps the whole training set as tensors, reshuffles an
+index tensor each epoch and slices batches from it. Losses and accuracy
+are summed on-tensor and read back once per epoch. ``--patience N`` stops
+after N epochs without a lower validation loss and keeps the best
+weights. ``loader`` is the original ``DataLoader`` loop.
+``bench_training.py`` compares the two; ``sweep.py`` trains many
+configurations of the fast loop in parallel.
+"""
+import argparse
+import os
+import pickle
+import sys
+import time
 import torch
 from torch import nn, optim
 from torch.utils.data import Dataset, DataLoader
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing  import StandardScaler
+from features import FEATURES, load_features
+
+# one RainClassifier definition, shared with the backend that serves it
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from classifier import RainClassifier
 
 # -------------------------------
 # 1) PREPROCESSING
 # -------------------------------
-class RainClassifier(nn.Module):
-    def __init__(self, in_dim):
-        super().__init__()
-        self.net = nn.Sequential(
-            nn.Linear(in_dim, 32),
-            nn.ReLU(),
-            nn.Linear(32, 16),
-            nn.ReLU(),
-            nn.Linear(16, 1)            # single logit
-        )
-    def forward(self, x):
-        return self.net(x).squeeze(-1)  # (batch,)
-
-if __name__ == '__main__':
-    # 1) load & parse
-    df = pd.read_csv('preprocessed_weather.csv', parse_dates=['timestamp'])
-
-    # 2) extract date only
-    df['date'] = df['timestamp'].dt.date
-
-    # 3) copy full DataFrame for morning vs afternoon
-    morning   = df.copy()
-    afternoon = df.copy()
-
-    # 4) rename the actual 9 AM and 3 PM columns
-    morning.rename(columns={
-        '9am Temperature (°C)':      'air_temp_9am',
-        '9am relative humidity (%)': 'rel_hum_9am',
-        '9am MSL pressure (hPa)':    'press_9am'
-    }, inplace=True)
-
-    afternoon.rename(columns={
-        '3pm Temperature (°C)':      'air_temp_3pm',
-        '3pm relative humidity (%)': 'rel_hum_3pm',
-        '3pm MSL pressure (hPa)':    'press_3pm'
-    }, inplace=True)
-
-    # 5) pick the cols we need
-    morning_cols   = ['date','air_temp_9am','rel_hum_9am','press_9am','rain_next']
-    afternoon_cols = ['date','air_temp_3pm','rel_hum_3pm','press_3pm']
-
-    morning   = morning[morning_cols]
-    afternoon = afternoon[afternoon_cols]
-
-    # 6) merge on date
-    wide = pd.merge(morning, afternoon, on='date', how='inner')
-
-    # move rain_next into rain of the *next* day, fill first day with 0, cast to int
-    wide['rain'] = wide['rain_next'].shift(1).fillna(0).astype(int)
-    wide.drop(columns='rain_next', inplace=True)
-
-    # 7) reshape to long format
-    morning_long = wide[['date','air_temp_9am','rel_hum_9am','press_9am','rain']].copy()
-    morning_long['time'] = '9am'
-    morning_long.rename(columns={
-        'air_temp_9am': 'air_temp',
-        'rel_hum_9am':  'rel_hum',
-        'press_9am':    'press'
-    }, inplace=True)
-
-    afternoon_long = wide[['date','air_temp_3pm','rel_hum_3pm','press_3pm','rain']].copy()
-    afternoon_long['time'] = '3pm'
-    afternoon_long.rename(columns={
-        'air_temp_3pm': 'air_temp',
-        'rel_hum_3pm':  'rel_hum',
-        'press_3pm':    'press'
-    }, inplace=True)
-
-    # 8) combine & sort so each date’s 9am then 3pm are consecutive
-    long_df = pd.concat([morning_long, afternoon_long], ignore_index=True)
-    time_order = {'9am': 0, '3pm': 1}
-    long_df['time_order'] = long_df['time'].map(time_order)
-    long_df = (
-        long_df
-        .sort_values(['date','time_order'])
-        .drop(columns='time_order')
-        .reset_index(drop=True)
-    )
-
-    print("Preprocessed rows:", len(long_df))
-    print(long_df.head(6))
-
-    # -------------------------------
-    # 2) PREPARE TRAIN/VAL SPLIT
-    # -------------------------------
+def parse_hidden(text):
+    """``'32,16'`` -> ``(32, 16)``; ``''`` -> ``()`` (logistic regression)."""
+    return tuple(int(size) for size in text.replace('x', ',').split(',') if size.strip())
 
-    FEATURES = ['air_temp','rel_hum','press']
-    X = long_df[FEATURES].values
-    y = long_df['rain'].values
 
+def split_and_scale(features, seed=42):
+    """``(X_train, X_val, y_train, y_val, scaler)``, standardized on the training rows."""
     X_train, X_val, y_train, y_val = train_test_split(
-        X, y, test_size=0.2, stratify=y, random_state=42
+        features.X, features.rain, test_size=0.2, stratify=features.rain, random_state=seed
     )
-
     scaler = StandardScaler().fit(X_train)
-    X_train = scaler.transform(X_train)
-    X_val   = scaler.transform(X_val)
+    return scaler.transform(X_train), scaler.transform(X_val), y_train, y_val, scaler
 
-    # -------------------------------
-    # 3) DATASET & DATALOADER
-    # -------------------------------
 
-    class RainDataset(Dataset):
-        def __init__(self, X, y):
-            self.X = torch.tensor(X, dtype=torch.float32)
-            self.y = torch.tensor(y, dtype=torch.float32)
-        def __len__(self):      return len(self.y)
-        def __getitem__(self, i): return self.X[i], self.y[i]
+def set_threads(threads):
+    """Pin torch's intra-op threads (0 keeps torch's default); a tiny MLP rarely gains past a few."""
+    if threads:
+        torch.set_num_threads(threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass  # only settable before the first parallel op
 
-    train_ds = RainDataset(X_train, y_train)
-    val_ds   = RainDataset(X_val,   y_val)
-
-    train_loader = DataLoader(train_ds, batch_size=64, shuffle=True)
-    val_loader   = DataLoader(val_ds,   batch_size=64)
 
-    # -------------------------------
-    # 4) MODEL DEFINITION
-    # -------------------------------
+def log_epoch(epoch, train_loss, val_loss, val_acc):
+    print(f"Epoch {epoch:02d} | "
+          f"Train Loss: {train_loss:.4f} | "
+          f"Val Loss: {val_loss:.4f} | "
+          f"Val Acc: {val_acc:.3f}")
 
 
-    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-    model = RainClassifier(in_dim=len(FEATURES)).to(device)
+# -------------------------------
+# 2) ORIGINAL LOOP (DataLoader)
+# -------------------------------
 
-    # -------------------------------
-    # 5) LOSS, OPTIMIZER, METRIC
-    # -------------------------------
+class RainDataset(Dataset):
+    def __init__(self, X, y):
+        self.X = torch.tensor(X, dtype=torch.float32)
+        self.y = torch.tensor(y, dtype=torch.float32)
+    def __len__(self):      return len(self.y)
+    def __getitem__(self, i): return self.X[i], self.y[i]
 
-    criterion = nn.BCEWithLogitsLoss()
-    optimizer = optim.Adam(model.parameters(), lr=1e-3)
 
-    # -------------------------------
-    # 6) TRAIN / VALIDATION LOOP
-    # -------------------------------
+def train_loader(model, X_train, X_val, y_train, y_val, epochs=20, batch_size=64, lr=1e-3,
+                 device='cpu', log=log_epoch):
+    """Row-at-a-time Dataset + DataLoader, one ``.item()`` per step. Returns the per-epoch history."""
+    train_ds = RainDataset(X_train, y_train)
+    val_ds   = RainDataset(X_val,   y_val)
+    train_loader = DataLoader(train_ds, batch_size=batch_size, shuffle=True)
+    val_loader   = DataLoader(val_ds,   batch_size=batch_size)
 
-    EPOCHS = 20
-    for epoch in range(1, EPOCHS+1):
+    criterion = nn.BCEWithLogitsLoss()
+    optimizer = optim.Adam(model.parameters(), lr=lr)
+    history = []
+    for epoch in range(1, epochs+1):
         # -- train --
         model.train()
         total_loss = 0.0
@@ -171,17 +112,125 @@ if __name__ == '__main__':
         avg_val_loss = total_val_loss / len(val_ds)
         val_acc      = correct / len(val_ds)
 
-        print(f"Epoch {epoch:02d} | "
-              f"Train Loss: {avg_train_loss:.4f} | "
-              f"Val Loss: {avg_val_loss:.4f} | "
-              f"Val Acc: {val_acc:.3f}")
+        history.append((epoch, avg_train_loss, avg_val_loss, val_acc))
+        if log:
+            log(epoch, avg_train_loss, avg_val_loss, val_acc)
+    return history
+
+
+# -------------------------------
+# 3) FAST LOOP (whole-tensor)
+# -------------------------------
+
+def train_fast(model, X_train, X_val, y_train, y_val, epochs=20, batch_size=64, lr=1e-3,
+               patience=0, seed=None, device='cpu', log=log_epoch):
+    """Index-sliced batches over resident tensors. Returns the per-epoch history.
+
+    With ``patience`` > 0, stops after that many epochs without a lower
+    validation loss and loads the best epoch's weights back into ``model``.
+    """
+    X_train = torch.as_tensor(X_train, dtype=torch.float32, device=device)
+    y_train = torch.as_tensor(y_train, dtype=torch.float32, device=device)
+    X_val = torch.as_tensor(X_val, dtype=torch.float32, device=device)
+    y_val = torch.as_tensor(y_val, dtype=torch.float32, device=device)
+    n = len(y_train)
+    generator = torch.Generator()
+    if seed is not None:
+        generator.manual_seed(seed)
+    else:
+        generator.seed()  # a fresh Generator always starts from the same default seed
+
+    criterion = nn.BCEWithLogitsLoss(reduction='sum')
+    try:
+        # one kernel for the whole update; about a third off each step of this small net
+        optimizer = optim.Adam(model.parameters(), lr=lr, fused=True)
+    except (RuntimeError, TypeError):
+        optimizer = optim.Adam(model.parameters(), lr=lr)
+    history = []
+    best_loss, best_state, stale = float('inf'), None, 0
+    for epoch in range(1, epochs+1):
+        # -- train --
+        model.train()
+        order = torch.randperm(n, generator=generator).to(device)
+        total_loss = torch.zeros((), device=device)
+        for start in range(0, n, batch_size):
+            idx = order[start:start + batch_size]
+            loss = criterion(model(X_train[idx]), y_train[idx])
+            optimizer.zero_grad(set_to_none=True)
+            # mean over the batch, as BCEWithLogitsLoss() would give
+            (loss / len(idx)).backward()
+            optimizer.step()
+            total_loss += loss.detach()
+
+        # -- validate, the whole set in one pass --
+        model.eval()
+        with torch.no_grad():
+            logits = model(X_val)
+            val_loss = criterion(logits, y_val) / len(y_val)
+            val_acc = ((logits > 0) == (y_val > 0.5)).float().mean()
+        avg_train_loss, avg_val_loss, val_acc = torch.stack([total_loss / n, val_loss, val_acc]).tolist()
+
+        history.append((epoch, avg_train_loss, avg_val_loss, val_acc))
+        if log:
+            log(epoch, avg_train_loss, avg_val_loss, val_acc)
+        if patience:
+            if avg_val_loss < best_loss:
+                best_loss, stale = avg_val_loss, 0
+                best_state = {k: v.detach().clone() for k, v in model.state_dict().items()}
+            else:
+                stale += 1
+                if stale >= patience:
+                    break
+    if best_state is not None:
+        model.load_state_dict(best_state)
+    return history
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Train the rain classifier')
+    parser.add_argument('--mode', choices=('fast', 'loader'), default='fast')
+    parser.add_argument('--epochs', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--lr', type=float, default=1e-3)
+    parser.add_argument('--hidden', type=parse_hidden, default=(32, 16), help='hidden layer sizes, e.g. 64,32')
+    parser.add_argument('--patience', type=int, default=0, help='fast mode: early-stopping patience (0 = off)')
+    parser.add_argument('--threads', type=int, default=0, help='torch threads (0 = torch default)')
+    parser.add_argument('--seed', type=int, default=None, help='weight init and shuffling seed')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    set_threads(args.threads)
+    if args.seed is not None:
+        torch.manual_seed(args.seed)
+
+    # one row per 9am / 3pm observation, memory-mapped from the feature store
+    features = load_features()
+    print("Preprocessed rows:", len(features))
+    print(features.to_frame().head(6))
+
+    X_train, X_val, y_train, y_val, scaler = split_and_scale(features)
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    model = RainClassifier(in_dim=len(FEATURES), hidden=args.hidden).to(device)
+
+    started = time.perf_counter()
+    if args.mode == 'fast':
+        history = train_fast(model, X_train, X_val, y_train, y_val, epochs=args.epochs,
+                             batch_size=args.batch_size, lr=args.lr, patience=args.patience,
+                             seed=args.seed, device=device)
+    else:
+        history = train_loader(model, X_train, X_val, y_train, y_val, epochs=args.epochs,
+                               batch_size=args.batch_size, lr=args.lr, device=device)
+    elapsed = time.perf_counter() - started
+    print(f"{args.mode}: {len(history)} epochs in {elapsed:.2f}s ({elapsed / len(history) * 1000:.1f} ms/epoch)")
 
     # -------------------------------
-    # 7) SAVE MODEL + SCALER
+    # 4) SAVE MODEL + SCALER
     # -------------------------------
 
     torch.save(model.state_dict(), 'rain_classifier.pth')
-    import pickle
     with open('scaler.pkl', 'wb') as f:
         pickle.dump(scaler, f)
 